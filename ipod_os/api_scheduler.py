@@ -0,0 +1,163 @@
+import threading
+import itertools
+import time
+from contextlib import contextmanager
+from config import *
+
+# Planificador central de las peticiones a las APIs (Spotify, Twitch, carátulas).
+# Lo usa SesionHTTP en cada petición, así que cubre todo lo que pasa por 'http'
+# (spotipy incluido) sin tocar a los que llaman:
+#
+#   - Prioridad: como mucho API_MAX_CONCURRENTES peticiones a la vez; cuando
+#     se libera un hueco entra la interactiva más antigua antes que cualquier
+#     petición de fondo (sondeos, precarga, revalidaciones de la caché).
+#     La prioridad es del hilo: with planificador_api.prioridad(FONDO): ...
+#   - Coalescencia: un GET idéntico (misma URL, parámetros y token) a otro que
+#     ya está en vuelo no sale a la red; espera y comparte su respuesta.
+#   - 429: el Retry-After bloquea a todo el servicio (host), no solo a quien
+#     lo recibió, hasta que pase el plazo.
+#   - Métricas: profundidad de la cola y tiempo de espera por prioridad.
+
+INTERACTIVA = 0
+FONDO = 1
+NOMBRES_PRIORIDAD = {INTERACTIVA: 'interactiva', FONDO: 'fondo'}
+
+class _Llamada:
+    """Petición en vuelo compartida por los que piden lo mismo."""
+    def __init__(self):
+        self.hecha = threading.Event()
+        self.resultado = None
+        self.error = None
+
+class PlanificadorAPI:
+    def __init__(self, max_concurrentes=API_MAX_CONCURRENTES):
+        self.cond = threading.Condition()
+        self.libres = max_concurrentes
+        self.cola = [] # Turnos esperando: (prioridad, orden, servicio)
+        self.orden = itertools.count()
+        self.bloqueos = {} # servicio -> monotonic hasta el que no se puede llamar
+        self.en_vuelo = {} # clave -> _Llamada
+        self._local = threading.local()
+
+        self.max_en_cola = 0
+        self.coalescidas = 0
+        self.bloqueos_429 = 0
+        self.caducadas = 0 # Se agotó el plazo esperando turno
+        self.esperas = {p: {'peticiones': 0, 'total_ms': 0.0, 'max_ms': 0.0} for p in NOMBRES_PRIORIDAD}
+
+    def fijar_prioridad(self, nivel):
+        """Prioridad de todas las peticiones de este hilo (ej: hilos de precarga)."""
+        self._local.nivel = nivel
+
+    @contextmanager
+    def prioridad(self, nivel):
+        """Las peticiones que haga este hilo dentro del bloque van con esta prioridad."""
+        anterior = self.prioridad_actual()
+        self.fijar_prioridad(nivel)
+        try:
+            yield
+        finally:
+            self.fijar_prioridad(anterior)
+
+    def prioridad_actual(self):
+        return getattr(self._local, 'nivel', INTERACTIVA) # Por defecto, lo pide el usuario
+
+    def _puede_pasar(self, turno, ahora):
+        if self.libres <= 0 or self.bloqueos.get(turno[2], 0) > ahora:
+            return False
+        # Nadie con más prioridad (o igual y más antiguo) que sí pueda salir ya
+        return not any(otro < turno and self.bloqueos.get(otro[2], 0) <= ahora for otro in self.cola)
+
+    def adquirir(self, servicio, limite):
+        """
+        Espera turno para llamar a 'servicio' (host). 'limite' es el monotonic
+        máximo hasta el que se puede esperar. Devuelve False si se agota.
+        """
+        turno = (self.prioridad_actual(), next(self.orden), servicio)
+        inicio = time.monotonic()
+        with self.cond:
+            self.cola.append(turno)
+            self.max_en_cola = max(self.max_en_cola, len(self.cola))
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    if ahora >= limite:
+                        self.caducadas += 1
+                        return False
+                    if self._puede_pasar(turno, ahora):
+                        break
+                    espera = limite - ahora
+                    bloqueado_hasta = self.bloqueos.get(servicio, 0)
+                    if bloqueado_hasta > ahora:
+                        espera = min(espera, bloqueado_hasta - ahora)
+                    self.cond.wait(espera)
+                self.libres -= 1
+            finally:
+                self.cola.remove(turno)
+                self.cond.notify_all() # Puede que ahora le toque a otro
+
+            e = self.esperas[turno[0]]
+            ms = (time.monotonic() - inicio) * 1000.0
+            e['peticiones'] += 1
+            e['total_ms'] += ms
+            e['max_ms'] = max(e['max_ms'], ms)
+        return True
+
+    def liberar(self, servicio, bloqueo=None):
+        """Devuelve el hueco. 'bloqueo' (segundos, por un 429) pausa a todo el servicio."""
+        with self.cond:
+            self.libres += 1
+            if bloqueo:
+                self.bloqueos_429 += 1
+                hasta = time.monotonic() + bloqueo
+                self.bloqueos[servicio] = max(self.bloqueos.get(servicio, 0), hasta)
+            self.cond.notify_all()
+
+    def coalescer(self, clave, funcion):
+        """Ejecuta funcion() o, si ya hay una llamada con la misma clave en vuelo, espera su resultado."""
+        with self.cond:
+            llamada = self.en_vuelo.get(clave)
+            if llamada is None:
+                llamada = self.en_vuelo[clave] = _Llamada()
+                propia = True
+            else:
+                self.coalescidas += 1
+                propia = False
+
+        if not propia:
+            llamada.hecha.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = funcion()
+            return llamada.resultado
+        except Exception as e:
+            llamada.error = e
+            raise
+        finally:
+            with self.cond:
+                del self.en_vuelo[clave]
+            llamada.hecha.set()
+
+    def estadisticas(self):
+        """Profundidad de la cola, esperas por prioridad, coalescidas y bloqueos por 429."""
+        with self.cond:
+            ahora = time.monotonic()
+            return {
+                'en_cola': len(self.cola),
+                'max_en_cola': self.max_en_cola,
+                'en_vuelo': len(self.en_vuelo),
+                'coalescidas': self.coalescidas,
+                'bloqueos_429': self.bloqueos_429,
+                'caducadas': self.caducadas,
+                'bloqueados': {s: round(h - ahora, 1) for s, h in self.bloqueos.items() if h > ahora},
+                'esperas': {
+                    NOMBRES_PRIORIDAD[p]: dict(e, media_ms=e['total_ms'] / e['peticiones'] if e['peticiones'] else 0.0)
+                    for p, e in self.esperas.items()
+                },
+            }
+
+# Planificador único: todas las peticiones de la app pasan por él
+planificador_api = PlanificadorAPI()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark del motor de dithering de carátulas.
+
+Compara el bucle píxel a píxel original de procesar_caratula_retro con los
+algoritmos de dithering.py sobre una entrada de 64x64.
+
+Uso (desde ipod_os/):
+    python benchmarks/bench_dithering.py [repeticiones]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+import dithering
+from config import *
+from utils import procesar_caratula_retro
+
+
+def procesar_caratula_retro_original(surface_original, color_tema=VERDE_SPOTIFY):
+    """Implementación anterior (bucle Python de 4096 iteraciones), como referencia."""
+    palette_colors = dithering.paleta_tema(color_tema).astype(np.int64)
+
+    small = pygame.transform.scale(surface_original, (64, 64))
+    pixels = pygame.surfarray.pixels3d(small).astype(np.float32)
+    ancho, alto, _ = pixels.shape
+    grayscale = pixels[:, :, 0] * 0.299 + pixels[:, :, 1] * 0.587 + pixels[:, :, 2] * 0.114
+    output = np.zeros((ancho, alto, 3), dtype=np.uint8)
+
+    for y in range(alto):
+        for x in range(ancho):
+            old_pixel = grayscale[x, y]
+            level = np.round(old_pixel / 85.0)
+            level = np.clip(level, 0, 3)
+            new_pixel_val = level * 85.0
+            output[x, y] = palette_colors[int(level)]
+            error = old_pixel - new_pixel_val
+            if x + 1 < ancho:
+                grayscale[x+1, y] += error * 0.5
+            if y + 1 < alto:
+                grayscale[x, y+1] += error * 0.5
+
+    surface_final = pygame.surfarray.make_surface(output)
+    return pygame.transform.scale(surface_final, (128, 128))
+
+
+def imagen_sintetica(tamano=64, semilla=1234):
+    """Degradado + ruido, para que el dithering tenga trabajo real."""
+    rng = np.random.default_rng(semilla)
+    xs = np.linspace(0, 255, tamano)
+    base = np.add.outer(xs, xs) / 2
+    rgb = np.stack([base, base[::-1], base.T], axis=-1) + rng.normal(0, 25, (tamano, tamano, 3))
+    return pygame.surfarray.make_surface(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def medir(funcion, repeticiones):
+    funcion()  # Calentamiento (cachés de diagonales, etc.)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    pygame.init()
+    img = imagen_sintetica()
+
+    ref = pygame.surfarray.array3d(procesar_caratula_retro_original(img))
+    t_ref = medir(lambda: procesar_caratula_retro_original(img), max(1, repeticiones // 10))
+    print(f"{'original':<10} {t_ref:9.2f} ms")
+
+    for algoritmo in dithering.ALGORITMOS:
+        t = medir(lambda: procesar_caratula_retro(img, algoritmo=algoritmo), repeticiones)
+        out = pygame.surfarray.array3d(procesar_caratula_retro(img, algoritmo=algoritmo))
+        distintos = np.count_nonzero(np.any(out != ref, axis=-1))
+        print(f"{algoritmo:<10} {t:9.2f} ms  x{t_ref / t:6.1f}  píxeles distintos: {distintos}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark del escaneo de la biblioteca local con índice vacío (lectura de etiquetas).
+
+Genera una biblioteca sintética de MP3 con etiquetas ID3 en una carpeta
+temporal (o usa la que se indique) y mide archivos/s leyendo etiquetas con
+1, 2 y 4 hilos (music/library_index.py).
+
+Uso (desde ipod_os/):
+    python benchmarks/bench_escaneo.py [archivos] [carpeta_existente]
+
+Nota: tras la primera pasada los archivos están en la caché de páginas del
+sistema; para medir la latencia real de la SD, vaciarla entre pasadas
+(sudo sh -c 'echo 3 > /proc/sys/vm/drop_caches') o usar una carpeta propia.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mutagen.easyid3 import EasyID3
+from music.library_index import IndiceBiblioteca
+
+EXTENSIONES = ('.mp3', '.flac', '.wav', '.m4a', '.ogg')
+
+# Trama MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417 bytes
+TRAMA_MP3 = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def biblioteca_sintetica(carpeta, archivos, tramas=40):
+    """archivos MP3 repartidos en artistas/álbumes, con etiquetas ID3."""
+    audio = TRAMA_MP3 * tramas
+    for i in range(archivos):
+        artista, album = f"Artista {i % 50:02d}", f"Album {i % 200:03d}"
+        ruta = os.path.join(carpeta, artista, album)
+        os.makedirs(ruta, exist_ok=True)
+        path = os.path.join(ruta, f"{i:05d}.mp3")
+        with open(path, 'wb') as f:
+            f.write(audio)
+        tags = EasyID3()
+        tags.update({'artist': artista, 'album': album, 'title': f"Pista {i}", 'tracknumber': str(i % 12 + 1)})
+        tags.save(path)
+
+
+def medir(carpeta, hilos):
+    indice = IndiceBiblioteca(':memory:') # Índice vacío: se leen todas las etiquetas
+    inicio = time.perf_counter()
+    cambios = indice.sincronizar(carpeta, EXTENSIONES, hilos=hilos)
+    segundos = time.perf_counter() - inicio
+    return cambios['nuevas'], segundos
+
+
+def main():
+    archivos = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    carpeta = sys.argv[2] if len(sys.argv) > 2 else None
+
+    temporal = None
+    if carpeta is None:
+        temporal = carpeta = tempfile.mkdtemp(prefix='bench_escaneo_')
+        print(f"Generando {archivos} MP3 en {carpeta}...")
+        biblioteca_sintetica(carpeta, archivos)
+
+    try:
+        medir(carpeta, 1) # Calentamiento (caché de páginas del sistema)
+        base = None
+        for hilos in (1, 2, 4):
+            leidos, segundos = medir(carpeta, hilos)
+            por_segundo = leidos / segundos
+            base = base or por_segundo
+            print(f"{hilos} hilo(s): {leidos} archivos en {segundos:6.2f} s  {por_segundo:8.0f} archivos/s  x{por_segundo / base:4.2f}")
+    finally:
+        if temporal:
+            shutil.rmtree(temporal)
+
+
+if __name__ == "__main__":
+    main()
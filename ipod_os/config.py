@@ -13,12 +13,87 @@ TWITCH_ACCESS_TOKEN = ''
 
 # Rutas
 CACHE_PATH = '.spotify_cache'
+RUTA_CACHE_CARATULAS = '.cover_cache' # Carátulas ya procesadas (cover_cache.py)
+RUTA_CACHE_RESPUESTAS = '.response_cache.db' # Páginas de los menús de Spotify (response_cache.py)
+RUTA_INDICE_BIBLIOTECA = '.library_index.db' # Etiquetas de la música local (music/library_index.py)
+
+# Capa HTTP compartida (http_client.py)
+HTTP_TIMEOUT_CONEXION = 3.05 # Segundos para abrir la conexión
+HTTP_TIMEOUT_LECTURA = 10 # Segundos sin recibir datos
+HTTP_PLAZO = 15 # Plazo total de una petición, reintentos incluidos
+HTTP_REINTENTOS = 2 # Reintentos máximos (solo GET/HEAD)
+HTTP_BACKOFF_BASE = 0.5 # Espera base entre reintentos (se dobla en cada uno, con jitter)
+HTTP_BACKOFF_MAX = 4
+HTTP_MAX_HOSTS = 8 # Pools de conexiones (uno por host)
+HTTP_CONEXIONES_POR_HOST = 4 # Conexiones keep-alive por host
+TWITCH_PLAZO = 8 # Plazo de las llamadas a la API de Twitch (antes no tenían timeout)
+API_MAX_CONCURRENTES = 4 # Peticiones HTTP a la vez; el resto espera turno (primero las interactivas)
+API_BLOQUEO_429 = 2 # Segundos de pausa de un servicio tras un 429 sin Retry-After
+
+# Caché de carátulas: memoria (LRU) y disco
+MAX_CARATULAS_MEMORIA = 64
+MAX_BYTES_CARATULAS_MEMORIA = 1024 * 1024 # 1 MB
+MAX_BYTES_CARATULAS_DISCO = 16 * 1024 * 1024 # 16 MB (~4000 carátulas)
+
+# Sondeo del estado de reproducción de Spotify (music/playback_state.py)
+# El progreso se interpola entre sondeos, así que no hace falta sondear cada segundo
+INTERVALO_SONDEO_MS = 5000 # Reproduciendo con Now Playing en pantalla
+INTERVALO_SONDEO_FONDO_MS = 10000 # Reproduciendo, en otras pantallas
+INTERVALO_SONDEO_PAUSA_MS = 10000 # En pausa o sin dispositivo activo
+INTERVALO_SONDEO_RAPIDO_MS = 500 # Justo después de un comando (play, shuffle...)
+INTERVALO_SONDEO_EVENTOS_MS = 30000 # Con eventos de librespot (el Pi es el dispositivo)
+MARGEN_RETRASO_API_MS = 3000 # Tras un evento, la Web API puede ir por detrás este tiempo
+RUTA_SOCKET_LIBRESPOT = '/tmp/ipod_os_librespot.sock' # Socket donde llegan los eventos 'onevent'
+VENTANA_COMANDO_MS = 3000 # Tiempo que se sondea rápido tras un comando
+MARGEN_FIN_PISTA_MS = 300 # Sondeo extra justo después del final de la pista
+TIEMPO_CORRECCION_MS = 1000 # La deriva de la interpolación se corrige poco a poco en este tiempo
+UMBRAL_SALTO_MS = 2000 # Diferencias mayores (seek, otra pista) se aplican de golpe
 
 ### INTERFAZ ###
 ANCHO = 320
 ALTO = 240
 FPS = 30
 
+# Bucle por eventos (scheduler.py): tras una pulsación seguimos a FPS completos
+# durante este tiempo; después el bucle duerme hasta el próximo trabajo.
+VENTANA_ACTIVA_MS = 500
+# Modo medición: imprime despertares/s y % de tiempo inactivo cada INTERVALO_MEDICION ms
+MODO_MEDICION = False
+INTERVALO_MEDICION = 10000
+
+# Hilos del pool de tareas en segundo plano (tareas.py): cargas de menús, API...
+HILOS_TAREAS = 2
+
+# Hilos que leen etiquetas al escanear la música local (music/library_index.py)
+# Solapan la latencia de la SD; 1 = lectura secuencial
+HILOS_ESCANEO = 4
+LOTE_ESCANEO = 200 # Cada cuántos archivos se guarda el índice y se actualiza el menú
+# Imágenes de la carpeta del álbum que sirven de carátula si la pista no la trae incrustada
+CARATULAS_CARPETA = ('cover.jpg', 'folder.jpg', 'front.jpg', 'cover.png', 'folder.png', 'front.png')
+
+# Vigilancia de cambios en la música local (music/library_watcher.py)
+ESPERA_VIGILANCIA_MS = 2000 # Tiempo sin cambios antes de actualizar (agrupa una copia entera)
+MAX_ESPERA_VIGILANCIA_MS = 30000 # En copias largas, se actualiza al menos cada tanto
+INTERVALO_VIGILANCIA_MS = 10000 # Sondeo de carpetas si no hay inotify
+
+# Menús paginados de Spotify (music/menu_principal.py)
+TAMANO_PAGINA = 50 # Elementos por petición (máximo de la API)
+VENTANA_PAGINAS = 2 # Páginas que se guardan a cada lado de la selección
+MARGEN_PAGINA = 10 # A esta distancia del borde de la página se pide la siguiente
+TTL_CACHE_RESPUESTAS = 12 * 3600 # Segundos hasta revalidar una página cacheada (las playlists van por snapshot_id)
+
+# Búsqueda (music/search.py)
+DEBOUNCE_BUSQUEDA_MS = 400 # Espera sin girar la rueda antes de lanzar la búsqueda
+MAX_BUSQUEDAS_CACHE = 32 # Queries recientes guardadas (LRU)
+
+# Precarga de menús hijo y carátulas al pararse sobre un ítem (music/prefetch.py)
+PRECARGA_ESPERA_MS = 600 # Tiempo quieto sobre un ítem antes de precargar
+PRECARGA_BYTES_SEGUNDO = 64 * 1024 # Ancho de banda máximo (de media) de la precarga
+PRECARGA_COLA_PISTAS = 3 # Próximas pistas de la cola cuya carátula se precarga
+PRECARGA_COLA_MAX_BYTES = 256 * 1024 # Presupuesto de bytes por cambio de pista
+PRECARGA_ENLACE_LENTO_MS = 1500 # Si leer la cola tarda más, no se precargan carátulas
+PRECARGA_MIN_BYTES_SEGUNDO = 16 * 1024 # Si una carátula baja más lento, se deja de precargar
+
 ALTURA_HEADER = 28
 INICIO_VERTICAL_LISTA = ALTURA_HEADER + 4 # Altura a la que se empiezan a listar los elementos
 ANCHO_SCROLLBAR = 14
@@ -37,6 +112,10 @@ EXTRA_ALTO_CURSOR_BUSQUEDA = 2
 # Ajusta este número entre 20 y 23.
 MAX_CARACTERES_MENU = 20
 
+# Carátulas retro
+RESOLUCION_DITHER = 64 # Resolución interna pixelada (64x64)
+ALGORITMO_DITHER = 'difusion' # 'difusion', 'bayer' o 'umbral' (ver dithering.py)
+
 # Texto
 TEXT_SMALL = 12
 TEXT_BIG = 22
@@ -44,6 +123,10 @@ OFFSET_TEXTO_LISTA = 0 # Posición Y del texto
 ANTIALIASING = True
 NEGRITA = False
 
+# Caché de textos renderizados (text_cache.py)
+MAX_ENTRADAS_CACHE_TEXTO = 512
+MAX_BYTES_CACHE_TEXTO = 4 * 1024 * 1024 # 4 MB
+
 # Paleta de Colores
 NEGRO = (0, 0, 0)
 VERDE_SPOTIFY = (30, 215, 96)
@@ -0,0 +1,215 @@
+import os
+import struct
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import *
+
+# Caché de carátulas ya procesadas (mapas de niveles 64x64, ver dithering.py).
+# Nivel 1: memoria, LRU limitada por número de entradas y bytes.
+# Nivel 2: disco (SD), un fichero por carátula, limitado en bytes y escrito de
+#          forma atómica (fichero temporal + fsync + rename) para que un corte
+#          de corriente no deje ficheros a medias. La escritura (y el fsync)
+#          se hace sin el lock: obtener() desde la UI no espera a la SD.
+#
+# Claves: la URL de la carátula (Spotify/Twitch), el álbum (música local, todas
+# sus pistas comparten carátula) o el hash del contenido (bytes sueltos).
+
+MAGIA = b'RPC2' # Cabecera de los ficheros: magia + ancho + alto + niveles
+CABECERA = struct.Struct('<4sHH')
+
+class CacheCaratulas:
+    def __init__(self, ruta=RUTA_CACHE_CARATULAS, max_entradas=MAX_CARATULAS_MEMORIA,
+                 max_bytes_memoria=MAX_BYTES_CARATULAS_MEMORIA, max_bytes_disco=MAX_BYTES_CARATULAS_DISCO):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.max_bytes_memoria = max_bytes_memoria
+        self.max_bytes_disco = max_bytes_disco
+
+        self.memoria = OrderedDict()
+        self.bytes_memoria = 0
+        self.bytes_disco = 0
+        self.lock = threading.Lock()
+
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+        try:
+            os.makedirs(self.ruta, exist_ok=True)
+            for e in os.scandir(self.ruta):
+                if e.name.endswith('.tmp'):
+                    self._borrar_temporal(e.path) # Restos de un corte de corriente
+                elif e.name.endswith('.idx'):
+                    self.bytes_disco += e.stat().st_size
+        except OSError as e:
+            print(f"Caché de carátulas sin disco: {e}")
+            self.ruta = None
+
+    @staticmethod
+    def clave_url(url):
+        return 'url:' + url
+
+    @staticmethod
+    def clave_album(artista, album, carpeta=None):
+        """Con 'carpeta' si el álbum no viene en las etiquetas (si no, todos serían el mismo)."""
+        if carpeta:
+            return f'album:{artista}\n{album}\n{carpeta}'
+        return f'album:{artista}\n{album}'
+
+    @staticmethod
+    def clave_bytes(data):
+        return 'sha1:' + hashlib.sha1(data).hexdigest()
+
+    def _fichero(self, clave):
+        return os.path.join(self.ruta, hashlib.sha1(clave.encode('utf-8')).hexdigest() + '.idx')
+
+    # --- MEMORIA ---
+
+    def _guardar_memoria(self, clave, niveles):
+        if clave in self.memoria:
+            self.bytes_memoria -= self.memoria.pop(clave).nbytes
+        self.memoria[clave] = niveles
+        self.bytes_memoria += niveles.nbytes
+        while len(self.memoria) > 1 and (len(self.memoria) > self.max_entradas or self.bytes_memoria > self.max_bytes_memoria):
+            _, viejo = self.memoria.popitem(last=False)
+            self.bytes_memoria -= viejo.nbytes
+
+    # --- DISCO ---
+
+    def _leer_disco(self, clave):
+        if not self.ruta:
+            return None
+        fichero = self._fichero(clave)
+        try:
+            with open(fichero, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        if len(data) < CABECERA.size:
+            magia, ancho, alto = None, 0, 0
+        else:
+            magia, ancho, alto = CABECERA.unpack_from(data)
+        if magia != MAGIA or len(data) != CABECERA.size + ancho * alto:
+            # Fichero dañado (o de un formato anterior): lo quitamos
+            self._borrar_fichero(fichero)
+            return None
+
+        try:
+            os.utime(fichero) # Marca de uso reciente para la expulsión LRU
+        except OSError:
+            pass
+        return np.frombuffer(data, dtype=np.uint8, offset=CABECERA.size).reshape(ancho, alto).copy()
+
+    def _escribir_disco(self, clave, niveles):
+        """Sin el lock: solo las cuentas de bytes_disco lo toman."""
+        if not self.ruta:
+            return
+        ancho, alto = niveles.shape
+        data = CABECERA.pack(MAGIA, ancho, alto) + np.ascontiguousarray(niveles, dtype=np.uint8).tobytes()
+        fichero = self._fichero(clave)
+        try:
+            anterior = os.path.getsize(fichero) if os.path.exists(fichero) else 0
+            fd, temporal = tempfile.mkstemp(dir=self.ruta, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporal, fichero) # Atómico: o el fichero viejo o el nuevo entero
+            except Exception:
+                self._borrar_temporal(temporal)
+                raise
+        except (OSError, struct.error) as e:
+            print(f"Error guardando carátula en disco: {e}")
+            return
+        with self.lock:
+            self.bytes_disco += len(data) - anterior
+        self._expulsar_disco()
+
+    @staticmethod
+    def _borrar_temporal(temporal):
+        try:
+            os.unlink(temporal)
+        except OSError:
+            pass
+
+    def _borrar_fichero(self, fichero):
+        try:
+            tamano = os.path.getsize(fichero)
+            os.unlink(fichero)
+        except OSError:
+            return
+        with self.lock:
+            self.bytes_disco -= tamano
+
+    def _expulsar_disco(self):
+        """Borra las carátulas usadas hace más tiempo hasta volver al presupuesto."""
+        if self.bytes_disco <= self.max_bytes_disco:
+            return
+        try:
+            entradas = sorted((e for e in os.scandir(self.ruta) if e.name.endswith('.idx')),
+                              key=lambda e: e.stat().st_mtime)
+        except OSError:
+            return
+        for e in entradas:
+            if self.bytes_disco <= self.max_bytes_disco:
+                break
+            self._borrar_fichero(e.path)
+
+    # --- API ---
+
+    def obtener(self, clave):
+        """Devuelve el mapa de niveles o None. Un acierto en disco sube a memoria."""
+        with self.lock:
+            niveles = self.memoria.get(clave)
+            if niveles is not None:
+                self.memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return niveles
+
+        niveles = self._leer_disco(clave) # Sin el lock: no espera a las escrituras
+        with self.lock:
+            if niveles is not None:
+                self._guardar_memoria(clave, niveles)
+                self.aciertos_disco += 1
+                return niveles
+            self.fallos += 1
+            return None
+
+    def contiene(self, clave):
+        """Comprueba si está (memoria o disco) sin contar como uso."""
+        with self.lock:
+            if clave in self.memoria:
+                return True
+        return self.ruta is not None and os.path.exists(self._fichero(clave))
+
+    def guardar(self, clave, niveles):
+        with self.lock:
+            self._guardar_memoria(clave, niveles)
+        self._escribir_disco(clave, niveles)
+
+    def descartar(self, clave):
+        """Quita una carátula (memoria y disco), ej: porque ha cambiado."""
+        with self.lock:
+            niveles = self.memoria.pop(clave, None)
+            if niveles is not None:
+                self.bytes_memoria -= niveles.nbytes
+        if self.ruta:
+            self._borrar_fichero(self._fichero(clave))
+
+    def estadisticas(self):
+        return {
+            'aciertos_memoria': self.aciertos_memoria,
+            'aciertos_disco': self.aciertos_disco,
+            'fallos': self.fallos,
+            'entradas_memoria': len(self.memoria),
+            'bytes_memoria': self.bytes_memoria,
+            'bytes_disco': self.bytes_disco,
+        }
+
+# Caché única compartida por toda la app
+cache_caratulas = CacheCaratulas()
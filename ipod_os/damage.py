@@ -0,0 +1,66 @@
+import pygame
+from config import *
+
+# Registro de zonas sucias (dirty rectangles).
+# En vez de pintar toda la pantalla y hacer flip() en cada frame, cada pantalla
+# describe sus regiones con una "firma" (tupla con todo lo que afecta a cómo se
+# ve). Solo se redibujan las regiones cuya firma ha cambiado y el bucle principal
+# envía únicamente esos rectángulos con pygame.display.update(rects).
+
+RECT_PANTALLA = pygame.Rect(0, 0, ANCHO, ALTO)
+
+class RegistroDanos:
+    def __init__(self):
+        self.rects = []
+        self.firmas = {}
+        self.completo = True # El primer frame siempre se pinta entero
+
+    def invalidar_todo(self):
+        """Fuerza a repintar toda la pantalla en el próximo frame."""
+        self.completo = True
+        self.firmas.clear()
+        self.rects = []
+
+    def marcar(self, rect):
+        """Marca un rectángulo como sucio sin pasar por firmas."""
+        if not self.completo:
+            self.rects.append(pygame.Rect(rect))
+
+    def region(self, clave, firma, rect):
+        """
+        Devuelve True si la región 'clave' hay que redibujarla (su firma cambió
+        o toca repintado completo). En ese caso la marca como sucia.
+        """
+        if not self.completo and self.firmas.get(clave) == firma:
+            return False
+        self.firmas[clave] = firma
+        self.marcar(rect)
+        return True
+
+    def disposicion(self, pantalla, firma):
+        """
+        Para cambios que alteran la distribución de la pantalla entera
+        (cambiar de vista, aparecer/desaparecer la scrollbar...).
+        Si la firma cambia, limpia la pantalla y repinta todo.
+        Devuelve True si la pantalla se ha limpiado.
+        """
+        if self.firmas.get('__disposicion__') != firma:
+            self.invalidar_todo()
+            self.firmas['__disposicion__'] = firma
+        if self.completo:
+            pantalla.fill(NEGRO)
+            return True
+        return False
+
+    def tomar(self):
+        """Devuelve los rectángulos a enviar al display y resetea el registro."""
+        if self.completo:
+            rects = [RECT_PANTALLA]
+        else:
+            rects = self.rects
+        self.rects = []
+        self.completo = False
+        return rects
+
+# Registro único: solo hay una pantalla visible a la vez
+danos = RegistroDanos()
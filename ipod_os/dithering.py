@@ -0,0 +1,169 @@
+import numpy as np
+import pygame
+from config import *
+
+# Motor de dithering para las carátulas retro (4 tonos / 2 bits).
+# Todo trabaja sobre arrays de NumPy indexados [x, y] como pygame.surfarray.
+#
+# Algoritmos disponibles:
+#   - 'difusion': Difusión de error derecha/abajo (0.5 + 0.5), idéntica al bucle
+#                 original pero procesada por diagonales (wavefront).
+#   - 'bayer':    Dithering ordenado con matriz de Bayer 4x4. Totalmente vectorizado.
+#   - 'umbral':   Cuantización directa con una LUT de 256 entradas (sin trama).
+
+ALGORITMOS = ('difusion', 'bayer', 'umbral')
+
+# Niveles de gris objetivo: 0, 85, 170, 255
+PASO_NIVEL = 85.0
+
+# Paletas de 4 colores (Simulación LCD)
+# Nivel 0: Negro / Nivel 1: Sombra / Nivel 2: Color del tema / Nivel 3: Brillo
+PALETA_VERDE = np.array([
+    (0, 0, 0),
+    (10, 55, 25),
+    (30, 215, 96),
+    (210, 255, 220),
+], dtype=np.uint8)
+
+PALETAS_TEMA = {
+    VERDE_SPOTIFY: PALETA_VERDE,
+    MORADO_TWITCH: np.array([
+        (0, 0, 0),
+        (48, 24, 85),
+        (145, 71, 255),
+        (210, 190, 255),
+    ], dtype=np.uint8),
+    AZUL_LOCAL: np.array([
+        (0, 0, 0),
+        (20, 53, 73),
+        (60, 160, 220),
+        (233, 247, 247),
+    ], dtype=np.uint8),
+}
+
+# Matriz de Bayer 4x4 normalizada a umbrales en (0, 1)
+_BAYER_4 = np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+], dtype=np.float32)
+_UMBRAL_BAYER = (_BAYER_4 + 0.5) / 16.0
+
+# LUT gris (0-255) -> nivel (0-3) para el modo 'umbral'
+_LUT_NIVELES = np.clip(np.round(np.arange(256, dtype=np.float32) / PASO_NIVEL), 0, 3).astype(np.uint8)
+
+# Índices de las diagonales por tamaño de imagen (se calculan una sola vez)
+_diagonales_cache = {}
+
+def paleta_tema(color_tema):
+    """Devuelve la paleta (4, 3) uint8 del tema. Si no existe, la verde."""
+    return PALETAS_TEMA.get(color_tema, PALETA_VERDE)
+
+def escala_de_grises(surface, tamano=(RESOLUCION_DITHER, RESOLUCION_DITHER)):
+    """
+    Reduce la Surface a la resolución interna y devuelve la luminancia
+    como array float32 [x, y].
+    """
+    small = pygame.transform.scale(surface, tamano)
+    pixels = pygame.surfarray.pixels3d(small).astype(np.float32)
+    # Luminancia perceptiva: 0.299R + 0.587G + 0.114B
+    return pixels[:, :, 0] * 0.299 + pixels[:, :, 1] * 0.587 + pixels[:, :, 2] * 0.114
+
+def _diagonales(ancho, alto):
+    """
+    Índices planos de cada anti-diagonal x + y = d.
+    Todos los píxeles de una diagonal solo dependen de la diagonal anterior
+    (vecino izquierdo y vecino de arriba), así que se pueden procesar a la vez.
+    Devuelve, por diagonal: (índices en la imagen, índices en el array de error
+    con borde de ceros, índices del vecino de arriba, índices del vecino izquierdo).
+    """
+    clave = (ancho, alto)
+    if clave not in _diagonales_cache:
+        diagonales = []
+        for d in range(ancho + alto - 1):
+            xs = np.arange(max(0, d - alto + 1), min(d, ancho - 1) + 1)
+            ys = d - xs
+            # El array de error lleva una fila y columna extra de ceros delante,
+            # así los bordes no necesitan máscaras (sumar 0 no cambia nada).
+            propio = (xs + 1) * (alto + 1) + (ys + 1)
+            diagonales.append((xs * alto + ys, propio, propio - 1, propio - (alto + 1)))
+        _diagonales_cache[clave] = diagonales
+    return _diagonales_cache[clave]
+
+def dither_difusion(grises):
+    """
+    Difusión de error a 4 niveles: la mitad del error va a la derecha y la
+    otra mitad abajo. Mismo resultado que recorrer píxel a píxel, pero en
+    ancho + alto - 1 pasos vectorizados en lugar de ancho * alto.
+    """
+    ancho, alto = grises.shape
+    grises = grises.astype(np.float32).ravel()
+    error = np.zeros((ancho + 1) * (alto + 1), dtype=np.float32)
+    niveles = np.zeros(ancho * alto, dtype=np.float32)
+    medio = np.float32(0.5)
+    paso = np.float32(PASO_NIVEL)
+
+    for idx, propio, arriba, izquierda in _diagonales(ancho, alto):
+        # Mismo orden de sumas que el bucle original: primero llega el error
+        # de arriba (fila anterior) y después el de la izquierda.
+        valor = grises[idx] + error[arriba] * medio
+        valor += error[izquierda] * medio
+
+        nivel = np.clip(np.round(valor / paso), 0, 3)
+        error[propio] = valor - nivel * paso
+        niveles[idx] = nivel
+
+    return niveles.astype(np.uint8).reshape(ancho, alto)
+
+def dither_bayer(grises):
+    """Dithering ordenado con matriz de Bayer 4x4."""
+    ancho, alto = grises.shape
+    umbral = np.tile(_UMBRAL_BAYER, (ancho // 4 + 1, alto // 4 + 1))[:ancho, :alto]
+    niveles = np.floor(grises / PASO_NIVEL + umbral)
+    return np.clip(niveles, 0, 3).astype(np.uint8)
+
+def dither_umbral(grises):
+    """Cuantización directa al nivel más cercano usando la LUT."""
+    indices = np.clip(np.round(grises), 0, 255).astype(np.uint8)
+    return _LUT_NIVELES[indices]
+
+_FUNCIONES = {
+    'difusion': dither_difusion,
+    'bayer': dither_bayer,
+    'umbral': dither_umbral,
+}
+
+def cuantizar(grises, algoritmo='difusion'):
+    """Devuelve el mapa de niveles (0-3) uint8 con el algoritmo elegido."""
+    if algoritmo not in _FUNCIONES:
+        raise ValueError(f"Algoritmo de dithering desconocido: {algoritmo}")
+    return _FUNCIONES[algoritmo](grises)
+
+def niveles_a_rgb(niveles, color_tema=VERDE_SPOTIFY):
+    """Mapea niveles -> colores del tema en una sola indexación (LUT)."""
+    return paleta_tema(color_tema)[niveles]
+
+def colores_paleta(color_tema):
+    """Paleta del tema como lista de tuplas, lista para Surface.set_palette()."""
+    return [tuple(int(c) for c in color) for color in paleta_tema(color_tema)]
+
+def ampliar_niveles(niveles, factor=2):
+    """Escalado entero por vecino más cercano (cada nivel pasa a un bloque factor x factor)."""
+    return np.repeat(np.repeat(niveles, factor, axis=0), factor, axis=1)
+
+def crear_caratula_indexada(niveles, color_tema=VERDE_SPOTIFY, factor=2):
+    """
+    Surface de 8 bits con paleta: cada píxel guarda su nivel (0-3) y el color
+    lo pone la paleta del tema. Ocupa 1 byte por píxel en vez de 3-4 y
+    cambiar de tema es solo un set_palette() (ver aplicar_paleta).
+    """
+    ampliado = ampliar_niveles(niveles, factor)
+    surf = pygame.Surface(ampliado.shape, depth=8)
+    surf.set_palette(colores_paleta(color_tema))
+    pygame.surfarray.blit_array(surf, ampliado)
+    return surf
+
+def aplicar_paleta(surf, color_tema):
+    """Recolorea una carátula indexada al instante (sin volver a hacer dithering)."""
+    surf.set_palette(colores_paleta(color_tema))
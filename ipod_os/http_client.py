@@ -0,0 +1,138 @@
+import re
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import *
+from api_scheduler import planificador_api
+
+# Capa HTTP compartida por toda la app (Spotify vía spotipy, Twitch, carátulas).
+# Una sola Session con pool de conexiones por host y keep-alive: en la Pi Zero
+# cada handshake TLS nuevo cuesta ~300 ms, así que reutilizar conexiones importa.
+#
+# Cada petición lleva:
+#   - Timeouts por defecto (conexión, lectura) si el que llama no pone uno
+#   - Un plazo total ('plazo' en segundos) que incluye los reintentos
+#   - Reintentos acotados con espera exponencial y jitter para errores de red,
+#     429 y 5xx (solo en métodos idempotentes; respeta Retry-After)
+#   - Estadísticas de latencia por endpoint (host + ruta sin IDs)
+#   - Turno, coalescencia de GETs repetidos y bloqueo por 429 del planificador_api
+
+METODOS_REINTENTABLES = ('GET', 'HEAD', 'OPTIONS')
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+# Segmentos de ruta que son IDs (Spotify base62, números...): se agrupan como {id}
+_PATRON_ID = re.compile(r'^(?=.*\d)[A-Za-z0-9_-]{8,}$|^\d+$')
+
+def endpoint(url):
+    """'https://api.spotify.com/v1/albums/4aawyAB9vmqN3uQ7FjRGTy/tracks' -> 'api.spotify.com/v1/albums/{id}/tracks'"""
+    partes = urlsplit(url)
+    segmentos = ['{id}' if _PATRON_ID.match(s) else s for s in partes.path.split('/')]
+    return partes.netloc + '/'.join(segmentos)
+
+class SesionHTTP(requests.Session):
+    def __init__(self):
+        super().__init__()
+        adaptador = HTTPAdapter(pool_connections=HTTP_MAX_HOSTS, pool_maxsize=HTTP_CONEXIONES_POR_HOST)
+        self.mount('https://', adaptador)
+        self.mount('http://', adaptador)
+
+        self.lock = threading.Lock()
+        self.stats = {} # endpoint -> dict de contadores
+
+    def request(self, method, url, *args, plazo=HTTP_PLAZO, reintentos=HTTP_REINTENTOS, **kwargs):
+        """requests.Session.request con timeouts, plazo total, reintentos y estadísticas."""
+        if method.upper() != 'GET' or args or kwargs.get('stream'):
+            return self._request(method, url, *args, plazo=plazo, reintentos=reintentos, **kwargs)
+        # GET idéntico a uno en vuelo: se comparte la respuesta (ya leída entera)
+        cabeceras = kwargs.get('headers') or {}
+        clave = (url, repr(kwargs.get('params')), cabeceras.get('Authorization'), cabeceras.get('Client-Id'))
+        return planificador_api.coalescer(
+            clave, lambda: self._request(method, url, plazo=plazo, reintentos=reintentos, **kwargs))
+
+    def _request(self, method, url, *args, plazo=HTTP_PLAZO, reintentos=HTTP_REINTENTOS, **kwargs):
+        limite = time.monotonic() + plazo
+        puede_reintentar = method.upper() in METODOS_REINTENTABLES
+        timeout_pedido = kwargs.pop('timeout', None)
+        clave = endpoint(url)
+        servicio = urlsplit(url).netloc
+
+        intento = 0
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                self._registrar(clave, None, intento, error=True)
+                raise requests.Timeout(f"Plazo de {plazo}s agotado para {clave}")
+
+            # Turno del planificador (prioridad y posible bloqueo del servicio por 429)
+            if not planificador_api.adquirir(servicio, limite):
+                self._registrar(clave, None, intento, error=True)
+                raise requests.Timeout(f"Plazo de {plazo}s agotado esperando turno para {clave}")
+            restante = max(limite - time.monotonic(), 0.001)
+
+            timeout = timeout_pedido or (HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA)
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            timeout = (min(timeout[0], restante), min(timeout[1], restante))
+
+            inicio = time.monotonic()
+            bloqueo = None
+            try:
+                r = super().request(method, url, *args, timeout=timeout, **kwargs)
+                if r.status_code == 429:
+                    bloqueo = self._espera(intento, r.headers.get('Retry-After') or API_BLOQUEO_429)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not puede_reintentar or intento >= reintentos:
+                    self._registrar(clave, time.monotonic() - inicio, intento, error=True)
+                    raise
+                espera = self._espera(intento)
+            else:
+                if not (puede_reintentar and r.status_code in ESTADOS_REINTENTABLES and intento < reintentos):
+                    self._registrar(clave, time.monotonic() - inicio, intento, error=r.status_code >= 400)
+                    return r
+                espera = self._espera(intento, r.headers.get('Retry-After'))
+                if time.monotonic() + espera >= limite:
+                    # No da tiempo a reintentar: devolvemos la respuesta tal cual
+                    self._registrar(clave, time.monotonic() - inicio, intento, error=True)
+                    return r
+                r.close()
+            finally:
+                planificador_api.liberar(servicio, bloqueo) # Un 429 pausa a todo el servicio
+
+            time.sleep(max(0.0, min(espera, limite - time.monotonic())))
+            intento += 1
+
+    @staticmethod
+    def _espera(intento, retry_after=None):
+        """Backoff exponencial con jitter completo (o lo que pida Retry-After)."""
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** intento))
+
+    def _registrar(self, clave, segundos, reintentos, error=False):
+        with self.lock:
+            e = self.stats.setdefault(clave, {'peticiones': 0, 'errores': 0, 'reintentos': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            e['peticiones'] += 1
+            e['reintentos'] += reintentos
+            if error:
+                e['errores'] += 1
+            if segundos is not None:
+                ms = segundos * 1000.0
+                e['total_ms'] += ms
+                e['max_ms'] = max(e['max_ms'], ms)
+
+    def estadisticas(self):
+        """Latencia media/máxima, errores y reintentos por endpoint."""
+        with self.lock:
+            return {
+                clave: dict(e, media_ms=e['total_ms'] / e['peticiones'] if e['peticiones'] else 0.0)
+                for clave, e in self.stats.items()
+            }
+
+# Sesión única para toda la app (también se le pasa a spotipy)
+http = SesionHTTP()
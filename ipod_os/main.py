@@ -2,13 +2,20 @@ import pygame
 import spotipy
 import os
 import threading
+import time
 from spotipy.oauth2 import SpotifyOAuth
 
 # Importamos nuestros modulos propios
 from config import *
+from http_client import http
 from utils import comprobar_bluetooth_loop
+from damage import danos
+from scheduler import EVENTO_REDIBUJAR, planificador, redibujo_atendido, ms_hasta_siguiente_minuto, MedidorActividad
 from music.menu_principal import MenuPantalla
 from music.now_playing import PantallaNowPlaying
+from music.playback_state import reproduccion
+from music.prefetch import precargador_cola
+from music.librespot_events import eventos_librespot
 from music.search import SearchScreen
 from radio.radio_app import RadioApp
 from music.local_player import LocalPlayer
@@ -23,20 +30,25 @@ pygame.display.set_caption("WafflePod")
 # --- INICIALIZAR API ---
 def iniciar_spotify():
     scope = "user-library-read user-read-playback-state user-modify-playback-state user-follow-read"
+    # Misma sesión HTTP (pool + keep-alive + reintentos) para la API y para refrescar el token
     return spotipy.Spotify(auth_manager=SpotifyOAuth(
         client_id=CLIENT_ID,
         client_secret=CLIENT_SECRET,
         redirect_uri=REDIRECT_URI,
         scope=scope,
         open_browser=False,
-        cache_path=CACHE_PATH
-    ))
+        cache_path=CACHE_PATH,
+        requests_session=http
+    ), requests_session=http, requests_timeout=(HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA))
 
 # Iniciar Spotify
 print("Conectando a Spotify...")
 sp = iniciar_spotify()
+precargador_cola.iniciar(sp) # Carátulas de lo siguiente en la cola (antes del primer sondeo)
+reproduccion.iniciar(sp) # Sondeo del estado de reproducción en segundo plano
+eventos_librespot.iniciar() # Si el Pi es el dispositivo, los cambios llegan por eventos
 
-# Iniciar Reproductor local
+# Iniciar Reproductor local (el escaneo arranca justo antes del bucle principal)
 app_local_player = LocalPlayer()
 
 # Iniciar Radio
@@ -46,9 +58,7 @@ radio = RadioApp()
 twitch = TwitchPlayer()
 
 # --- ESTADO GLOBAL ---
-global_is_playing = False # Estado inicial
-last_global_check = 0
-GLOBAL_CHECK_INTERVAL = 3000 # Comprobar estado cada 3 seg (menos agresivo)
+global_is_playing = False # Estado inicial (lo actualiza 'reproduccion')
 
 # --- DEFINICION DE PANTALLAS ---
 # Se crean las instancias de las pantallas de Spotify
@@ -103,34 +113,57 @@ stack = [launcher]
 # --- BUCLE PRINCIPAL ---
 clock = pygame.time.Clock()
 running = True
+pantalla_anterior = None # Para saber cuándo hay que repintar todo
+activo_hasta = 0 # Tras una pulsación vamos a FPS completos hasta este instante
+medidor = MedidorActividad()
 
 hilo_bt = threading.Thread(target=comprobar_bluetooth_loop, daemon=True)
 hilo_bt.start()
 print("Monitor de Bluetooth iniciado en segundo plano.")
 
+# La biblioteca local se escanea ya con la interfaz en marcha: el menú
+# "Local player" se va llenando y muestra el progreso
+app_local_player.iniciar_escaneo()
+
 while running:
 
+    # 0. DORMIR HASTA EL PRÓXIMO TRABAJO
+    # Mientras se navega (scroll) vamos a FPS completos. En reposo bloqueamos en
+    # event.wait() hasta una tecla, un aviso de un hilo (EVENTO_REDIBUJAR) o el
+    # plazo más cercano: cambio de minuto o lo que pida la pantalla.
+    ahora = pygame.time.get_ticks()
+    if ahora < activo_hasta:
+        eventos = pygame.event.get()
+        medidor.dormido(0.0)
+    else:
+        despertar_pantalla = getattr(stack[-1], 'proximo_despertar', None)
+        plazo = planificador.proximo_plazo(
+            ahora + ms_hasta_siguiente_minuto(),
+            despertar_pantalla() if despertar_pantalla else None
+        )
+        inicio_espera = time.monotonic()
+        primero = pygame.event.wait(max(1, plazo - ahora))
+        medidor.dormido(time.monotonic() - inicio_espera)
+        eventos = [] if primero.type == pygame.NOEVENT else [primero]
+        eventos += pygame.event.get()
+    planificador.vencidos(pygame.time.get_ticks())
+
     # 1. ACTUALIZAR ESTADO GLOBAL (PLAY/PAUSE)
-    tiempo_actual = pygame.time.get_ticks()
-    if tiempo_actual - last_global_check > GLOBAL_CHECK_INTERVAL:
-        try:
-            # Hacemos una llamada ligera solo para ver si suena
-            pb = sp.current_playback()
-            if pb:
-                global_is_playing = pb['is_playing']
-            else:
-                global_is_playing = False
-        except:
-            pass # Si falla (internet, etc), mantenemos el último estado conocido
-        last_global_check = tiempo_actual
+    # Lo sondea un hilo en segundo plano; aquí solo se lee la última instantánea.
+    # Si falla (internet, etc), la instantánea mantiene el último estado conocido.
+    global_is_playing = reproduccion.instantanea.is_playing
 
     # 2. Gestion de Eventos
-    for e in pygame.event.get():
+    for e in eventos:
 
         if e.type == pygame.QUIT: 
             running = False
+
+        if e.type == EVENTO_REDIBUJAR:
+            redibujo_atendido() # Solo sirve para despertar y pintar un frame
         
         if e.type == pygame.KEYDOWN:
+            activo_hasta = pygame.time.get_ticks() + VENTANA_ACTIVA_MS
 
             # TECLAS DE NAVEGACION
             curr = stack[-1] # Pantalla actual
@@ -140,6 +173,7 @@ while running:
                 if e.key == pygame.K_UP: curr.mover_arriba()
                 if e.key == pygame.K_DOWN: curr.mover_abajo()
                 if e.key == pygame.K_ESCAPE:
+                    curr.cancelar_carga() # Si estaba cargando, el resultado se descarta
                     if len(stack) > 1: stack.pop()
                 
                 # TECLA ENTER (Seleccionar)
@@ -162,6 +196,7 @@ while running:
                         print(f"Intentando cambiar al ID: {sel['id']}")
                         try:
                             sp.transfer_playback(device_id=sel['id'], force_play=True)
+                            reproduccion.notificar_comando()
                             stack.pop() # Volver atrás
                         except Exception as e:
                             print(f"Error cambiando dispositivo: {e}")
@@ -173,9 +208,16 @@ while running:
                     # C. Toggle de Settings (Shuffle)
                     elif tipo == 'setting_toggle':
                         if sel.get('setting_key') == 'shuffle':
-                            nuevo_estado = not sel['current_val']
+                            actual = sel['current_val']
+                            if actual is None and reproduccion.instantanea.valida:
+                                actual = reproduccion.instantanea.shuffle # Llegó el sondeo después de abrir el menú
+                            if actual is None:
+                                print("Shuffle: estado desconocido, no se cambia")
+                                continue
+                            nuevo_estado = not actual
                             try:
                                 sp.shuffle(nuevo_estado)
+                                reproduccion.notificar_comando()
                                 # Actualización visual inmediata
                                 txt = "Shuffle: ON" if nuevo_estado else "Shuffle: OFF"
                                 curr.opciones[curr.seleccionado]['nombre'] = txt
@@ -244,22 +286,17 @@ while running:
                         ch = curr.font_item.render(f"{canal}", True, MORADO_TWITCH)
                         pantalla.blit(ch, (20, 120))
                         pygame.display.flip()
+                        danos.invalidar_todo() # Hemos pintado por fuera del registro de zonas
                         
-                        # 1. Descargar imagen de perfil (si hay URL)
-                        # Lo hacemos aquí antes de reproducir para pasársela a la pantalla
-                        foto_bytes = None
-                        if url_foto:
-                            from utils import descargar_imagen_url # Import local
-                            foto_bytes = descargar_imagen_url(url_foto)
-
                         # 2. Intentar reproducir
                         exito = twitch.play(canal)
                         
                         if exito:
+                            # La foto de perfil la resuelve Now Playing: caché o descarga en segundo plano
                             now_playing.set_mode_twitch(
                                 channel_name=nombre,
                                 game_name=game,
-                                cover_bytes=foto_bytes
+                                cover_url=url_foto
                             )
                             stack.append(now_playing)
                         else:
@@ -293,6 +330,7 @@ while running:
                                 app_local_player.stop()
                                 twitch.stop()
                                 sp.start_playback(uris=[uri])
+                                reproduccion.notificar_comando()
                                 stack.append(now_playing)
                             except Exception as err:
                                 print(f"Error Playback: {err}")
@@ -329,18 +367,20 @@ while running:
                             # REPRODUCIR
                             app_local_player.play(uri) # 'uri' aquí es la ruta del archivo (/home/...)
 
-                            cover_data = app_local_player.get_caratula(uri)
-                            
                             # IR A NOW PLAYING (Opcional, de momento nos quedamos en la lista)
                             # stack.append(now_playing) # Esto requeriría adaptar now_playing para local
                             art = sel.get('artist_name', "Local Artist") # Necesitas pasar esto en el menú tracks
                             alb = sel.get('album_name', "Local Album")
 
+                            # Carátula ya procesada al indexar (una por álbum): sin abrir el archivo aquí
+                            cover_clave, cover_cargar = app_local_player.get_caratula(uri, art, alb)
+
                             now_playing.set_mode_local(
                                 titulo=nombre,
                                 artista=menu_local_player.titulo if not art else art, # Fallback
                                 album=alb,
-                                cover_bytes=cover_data
+                                cover_clave=cover_clave,
+                                cover_cargar=cover_cargar
                             )
                             stack.append(now_playing)
                         
@@ -369,6 +409,7 @@ while running:
                         if tipo == 'track':
                             try:
                                 sp.start_playback(uris=[uri])
+                                reproduccion.notificar_comando()
                                 stack.append(now_playing)
                             except: print("Error Playback Search")
                         elif tipo == 'artist':
@@ -386,6 +427,7 @@ while running:
                         elif tipo == 'episode':
                             try:
                                 sp.start_playback(uris=[uri])
+                                reproduccion.notificar_comando()
                                 stack.append(now_playing)
                             except: print("Error Playback Episode")
         
@@ -401,10 +443,21 @@ while running:
             # Si estamos en Now Playing, Enter o Clickwheel central podria pausar (futuro)
 
     # 3. Dibujar
+    # Al cambiar de pantalla se repinta entera; si no, cada pantalla
+    # solo repinta las zonas que han cambiado (ver damage.py)
+    if stack[-1] is not pantalla_anterior:
+        danos.invalidar_todo()
+        pantalla_anterior = stack[-1]
     stack[-1].dibujar(pantalla, global_is_playing)
     
-    # 3. Refrescar
-    pygame.display.flip()
-    clock.tick(FPS)
+    # 3. Refrescar (solo los rectángulos sucios)
+    rects = danos.tomar()
+    if rects:
+        pygame.display.update(rects)
+    medidor.frame()
+    medidor.tick()
+    inicio_espera = time.monotonic()
+    clock.tick(FPS) # Límite de FPS (tras una espera larga no añade retardo)
+    medidor.dormido(time.monotonic() - inicio_espera, despertar=False)
 
 pygame.quit()
\ No newline at end of file
@@ -0,0 +1,269 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from mutagen import File
+from config import *
+
+# Índice persistente de la biblioteca local (SQLite en la SD).
+# Clave: ruta del archivo, con su mtime y tamaño. Al arrancar solo se hace
+# stat() de cada archivo: las etiquetas se vuelven a leer con mutagen solo si
+# el archivo es nuevo o ha cambiado, y los que ya no existen se borran.
+# Con la biblioteca sin cambios, arrancar cuesta lo mismo que recorrer las carpetas.
+# Los archivos que mutagen no puede leer también se guardan (valida = 0) para
+# no reintentarlos en cada arranque; no salen en la biblioteca.
+#
+# Las etiquetas se leen con HILOS_ESCANEO hilos: el recorrido de carpetas va
+# encolando los archivos a leer según los encuentra y los resultados se
+# recogen en el mismo orden. La mayor parte del tiempo es esperar a la SD,
+# así que los hilos se solapan aunque el parseo comparta el GIL.
+# Cada LOTE_ESCANEO archivos se guarda lo leído y se avisa (al_avanzar) para
+# que la biblioteca se vaya llenando mientras dura el escaneo.
+#
+# Carátulas: se resuelven una vez por álbum (tabla caratulas, por la clave del
+# álbum en cover_cache) con una de sus pistas: imagen incrustada (FLAC, ID3
+# APIC, MP4 covr) o, si no tiene, la imagen de la carpeta (CARATULAS_CARPETA).
+# Se guarda de dónde salió (o NULL si el álbum no tiene) para no volver a
+# buscarla; si el álbum cambia, se olvida y se busca de nuevo.
+
+ALBUM_DESCONOCIDO = "Unknown Album"
+
+def leer_etiquetas(path):
+    """(artista, album, titulo, track_no) del archivo, con valores por defecto si no tiene tags."""
+    nombre = os.path.basename(path)
+    # File(path, easy=True) detecta si es FLAC o MP3 y nos da
+    # una interfaz común (diccionario) para leer los datos.
+    audio = File(path, easy=True)
+
+    # OJO: Los WAV suelen venir sin etiquetas (audio será None)
+    if not audio:
+        return "Unknown Artist", ALBUM_DESCONOCIDO, nombre, "0"
+    return (
+        audio.get('artist', ['Unknown Artist'])[0],
+        audio.get('album', [ALBUM_DESCONOCIDO])[0],
+        audio.get('title', [nombre])[0],
+        audio.get('tracknumber', ['0'])[0],
+    )
+
+def caratula_incrustada(path):
+    """Bytes de la imagen incrustada en el archivo o None."""
+    audio = File(path)
+    if audio is None:
+        return None
+    # FLAC: bloques PICTURE (mejor la portada, tipo 3)
+    imagenes = getattr(audio, 'pictures', None)
+    if imagenes:
+        return next((p.data for p in imagenes if p.type == 3), imagenes[0].data)
+    tags = audio.tags
+    if not tags:
+        return None
+    # ID3 (MP3): frames APIC:<descripción>
+    if hasattr(tags, 'getall'):
+        imagenes = tags.getall('APIC')
+        if imagenes:
+            return next((p.data for p in imagenes if p.type == 3), imagenes[0].data)
+        return None
+    # MP4 (m4a): átomo covr
+    imagenes = tags.get('covr')
+    if imagenes:
+        return bytes(imagenes[0])
+    return None
+
+def imagen_carpeta(carpeta):
+    """Ruta de cover.jpg, folder.jpg... de la carpeta (sin distinguir mayúsculas) o None."""
+    try:
+        nombres = {n.lower(): n for n in os.listdir(carpeta)}
+    except OSError:
+        return None
+    for nombre in CARATULAS_CARPETA:
+        if nombre in nombres:
+            return os.path.join(carpeta, nombres[nombre])
+    return None
+
+def buscar_caratula(path):
+    """(origen, bytes) de la carátula del álbum de 'path', o (None, None) si no tiene."""
+    try:
+        data = caratula_incrustada(path)
+        if data:
+            return path, data
+    except Exception as e:
+        print(f"Error leyendo la carátula de {os.path.basename(path)}: {e}")
+    imagen = imagen_carpeta(os.path.dirname(path))
+    if imagen:
+        data = leer_caratula(imagen)
+        if data:
+            return imagen, data
+    return None, None
+
+def leer_caratula(origen):
+    """Bytes de la carátula desde un origen ya resuelto (imagen suelta o archivo de audio)."""
+    try:
+        if origen.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(origen, 'rb') as f:
+                return f.read()
+        return caratula_incrustada(origen)
+    except Exception as e:
+        print(f"Error leyendo la carátula de {os.path.basename(origen)}: {e}")
+        return None
+
+def _leer_fila(ruta, mtime, tamano):
+    """Fila del índice para un archivo (inválida si mutagen no puede con él)."""
+    try:
+        return (ruta, mtime, tamano) + leer_etiquetas(ruta) + (1,)
+    except Exception as e:
+        print(f"Error leyendo {os.path.basename(ruta)}: {e}")
+        return (ruta, mtime, tamano, None, None, None, None, 0)
+
+def _sin_anidadas(carpetas):
+    """Quita las carpetas que ya cuelgan de otra de la lista (se recorren con ella)."""
+    resultado = []
+    for carpeta in sorted(set(carpetas), key=len): # Las de arriba primero
+        if not any(carpeta.startswith(os.path.join(r, '')) for r in resultado):
+            resultado.append(carpeta)
+    return resultado
+
+def recorrer(raiz, extensiones):
+    """Genera (ruta, mtime_ns, tamaño) de los archivos de audio bajo 'raiz'."""
+    pendientes = [raiz]
+    while pendientes:
+        carpeta = pendientes.pop()
+        try:
+            with os.scandir(carpeta) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pendientes.append(entrada.path)
+                        elif entrada.name.lower().endswith(extensiones):
+                            st = entrada.stat()
+                            yield entrada.path, st.st_mtime_ns, st.st_size
+                    except OSError as e:
+                        print(f"Error leyendo {entrada.path}: {e}")
+        except OSError as e:
+            print(f"Error leyendo carpeta {carpeta}: {e}")
+
+class IndiceBiblioteca:
+    def __init__(self, ruta=RUTA_INDICE_BIBLIOTECA):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(ruta, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS pistas (
+            ruta TEXT PRIMARY KEY, mtime INTEGER, tamano INTEGER,
+            artista TEXT, album TEXT, titulo TEXT, track_no TEXT, valida INTEGER)""")
+        columnas = [c[1] for c in self.db.execute("PRAGMA table_info(caratulas)")]
+        if columnas and 'clave' not in columnas:
+            self.db.execute("DROP TABLE caratulas") # Formato anterior (por artista y álbum): se vuelven a buscar
+        self.db.execute("CREATE TABLE IF NOT EXISTS caratulas (clave TEXT PRIMARY KEY, origen TEXT)")
+        self.db.commit()
+
+        self.ultimo_escaneo = {}
+
+    def sincronizar(self, raiz, extensiones, hilos=HILOS_ESCANEO, al_avanzar=None, carpetas=None):
+        """
+        Pone el índice al día con lo que hay en disco. Devuelve cuántas pistas
+        son nuevas, han cambiado, se han borrado o siguen igual.
+        Con 'carpetas' solo se repasan esas carpetas (y lo que cuelga de
+        ellas): es lo que usa el vigilante de cambios.
+        'al_avanzar(filas, hechos)' se llama por lotes con las filas recién
+        leídas (ya guardadas) y los archivos ya procesados hasta el momento.
+        """
+        inicio = time.monotonic()
+        with self.lock:
+            conocidas = {ruta: (mtime, tamano) for ruta, mtime, tamano in
+                         self.db.execute("SELECT ruta, mtime, tamano FROM pistas")}
+        raices = [raiz]
+        if carpetas is not None:
+            raices = _sin_anidadas(carpetas)
+            prefijos = tuple(os.path.join(c, '') for c in raices)
+            conocidas = {ruta: v for ruta, v in conocidas.items() if ruta.startswith(prefijos)}
+
+        vistas = set()
+        a_leer = [] # (ruta, mtime, tamaño) nuevas o cambiadas
+        pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='escaneo') if hilos > 1 else None
+        lecturas = deque() # Futures en el orden del recorrido
+
+        def recoger(esperar):
+            """Hasta LOTE_ESCANEO filas leídas, en orden (esperando por ellas al final)."""
+            filas = []
+            while lecturas and len(filas) < LOTE_ESCANEO and (esperar or lecturas[0].done()):
+                filas.append(lecturas.popleft().result())
+            return filas
+
+        try:
+            for ruta, mtime, tamano in (f for r in raices if os.path.isdir(r) for f in recorrer(r, extensiones)):
+                vistas.add(ruta)
+                if conocidas.get(ruta) != (mtime, tamano):
+                    a_leer.append((ruta, mtime, tamano))
+                    # Los hilos empiezan a leer mientras seguimos recorriendo
+                    if pool:
+                        lecturas.append(pool.submit(_leer_fila, ruta, mtime, tamano))
+                    else:
+                        leida = Future()
+                        leida.set_result(_leer_fila(ruta, mtime, tamano))
+                        lecturas.append(leida)
+                if len(vistas) % LOTE_ESCANEO == 0:
+                    self._guardar_lote(recoger(False), len(vistas) - len(lecturas), al_avanzar)
+            # Recorrido terminado: lo que falte se va guardando según se lee
+            while True:
+                self._guardar_lote(recoger(True), len(vistas) - len(lecturas), al_avanzar)
+                if not lecturas:
+                    break
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
+
+        borradas = [(ruta,) for ruta in conocidas.keys() - vistas]
+        with self.lock:
+            self.db.executemany("DELETE FROM pistas WHERE ruta = ?", borradas)
+            self.db.commit()
+
+        nuevas = sum(1 for ruta, _, _ in a_leer if ruta not in conocidas)
+        self.ultimo_escaneo = {
+            'nuevas': nuevas,
+            'cambiadas': len(a_leer) - nuevas,
+            'borradas': len(borradas),
+            'sin_cambios': len(vistas) - len(a_leer),
+            'segundos': time.monotonic() - inicio,
+        }
+        return self.ultimo_escaneo
+
+    def _guardar_lote(self, filas, hechos, al_avanzar):
+        if filas:
+            with self.lock:
+                self.db.executemany("INSERT OR REPLACE INTO pistas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+                self.db.commit()
+        if al_avanzar:
+            al_avanzar(filas, hechos)
+
+    def total(self):
+        """Archivos en el índice (para estimar el progreso del siguiente escaneo)."""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM pistas").fetchone()[0]
+
+    def pistas(self):
+        """Todas las pistas indexadas: (ruta, artista, album, titulo, track_no)."""
+        with self.lock:
+            return self.db.execute("SELECT ruta, artista, album, titulo, track_no FROM pistas WHERE valida").fetchall()
+
+    def caratulas_resueltas(self):
+        """Claves de los álbumes cuya carátula ya se ha buscado (la tengan o no)."""
+        with self.lock:
+            return {clave for clave, in self.db.execute("SELECT clave FROM caratulas")}
+
+    def guardar_caratula(self, clave, origen):
+        """Anota de dónde sale la carátula del álbum (None: no tiene)."""
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO caratulas VALUES (?, ?)", (clave, origen))
+            self.db.commit()
+
+    def olvidar_caratulas(self, claves):
+        """Álbumes que han cambiado: su carátula se volverá a buscar."""
+        with self.lock:
+            self.db.executemany("DELETE FROM caratulas WHERE clave = ?", [(c,) for c in claves])
+            self.db.commit()
+
+    def origen_caratula(self, clave):
+        """(resuelta, origen) de la carátula del álbum."""
+        with self.lock:
+            fila = self.db.execute("SELECT origen FROM caratulas WHERE clave = ?", (clave,)).fetchone()
+        return (fila is not None), (fila[0] if fila else None)
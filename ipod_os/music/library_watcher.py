@@ -0,0 +1,256 @@
+import os
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+from config import *
+
+# Vigila la carpeta de música y avisa de lo que cambia, sin reescanear todo.
+#   - Linux: inotify (vía libc, sin dependencias) con un watch por carpeta
+#   - Si no hay inotify (o se agotan los watches): cada INTERVALO_VIGILANCIA_MS
+#     se comparan los mtime de las carpetas (solo stat de directorios; una
+#     carpeta cambia de mtime cuando se añade, borra o renombra algo dentro).
+#     Escribir en un archivo no cambia el mtime de su carpeta: las carpetas que
+#     acaban de cambiar se siguen mirando archivo a archivo (tamaño y mtime)
+#     cada ESPERA_VIGILANCIA_MS hasta que pasan INTERVALO_VIGILANCIA_MS quietas:
+#     una copia lenta no se queda indexada a medias.
+# Los eventos se agrupan: se espera a ESPERA_VIGILANCIA_MS sin cambios (un
+# rsync de un álbum entero = un solo lote), con un máximo de
+# MAX_ESPERA_VIGILANCIA_MS para que una copia larga se vaya viendo.
+# al_cambiar(carpetas) recibe las carpetas afectadas (incluidas las que ya no existen).
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+MASCARA = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+CABECERA_EVENTO = struct.Struct('iIII') # wd, mask, cookie, len
+
+class _Inotify:
+    """Lo mínimo de inotify(7) con ctypes."""
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    @classmethod
+    def crear(cls):
+        """Instancia o None si el sistema no tiene inotify."""
+        try:
+            return cls()
+        except (OSError, AttributeError):
+            return None
+
+    def vigilar(self, ruta):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(ruta), MASCARA)
+        if wd < 0:
+            numero = ctypes.get_errno()
+            raise OSError(numero, os.strerror(numero), ruta)
+        return wd
+
+    def leer(self, timeout):
+        """Lista de (wd, mask, nombre). Espera como mucho 'timeout' segundos."""
+        listos, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not listos:
+            return []
+        try:
+            datos = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        eventos = []
+        pos = 0
+        while pos < len(datos):
+            wd, mask, _cookie, longitud = CABECERA_EVENTO.unpack_from(datos, pos)
+            pos += CABECERA_EVENTO.size
+            nombre = os.fsdecode(datos[pos:pos + longitud].rstrip(b'\0'))
+            pos += longitud
+            eventos.append((wd, mask, nombre))
+        return eventos
+
+    def cerrar(self):
+        os.close(self.fd)
+
+class VigilanteBiblioteca:
+    def __init__(self, raiz, al_cambiar):
+        self.raiz = raiz
+        self.al_cambiar = al_cambiar
+        self.hilo = None
+        self.modo = None # 'inotify' / 'sondeo'
+
+        self.inotify = None
+        self.carpetas_wd = {} # wd -> carpeta (inotify)
+        self.mtimes = {} # carpeta -> mtime_ns (sondeo)
+        self.calientes = {} # carpeta -> (firma de sus archivos, último cambio), hasta que se quede quieta (sondeo)
+
+        self.pendientes = set() # Carpetas cambiadas aún sin avisar
+        self.primer_cambio = 0.0
+        self.ultimo_cambio = 0.0
+
+        self.eventos = 0
+        self.lotes = 0
+
+    def iniciar(self):
+        if self.hilo is None:
+            self.hilo = threading.Thread(target=self._bucle, daemon=True)
+            self.hilo.start()
+
+    def _bucle(self):
+        self.inotify = _Inotify.crear()
+        if self.inotify:
+            try:
+                self._vigilar_arbol(self.raiz)
+                self.modo = 'inotify'
+            except OSError as e:
+                # ENOSPC: se acabaron los watches (fs.inotify.max_user_watches)
+                print(f"inotify no disponible para {self.raiz} ({e}): se vigila por sondeo")
+                self.inotify.cerrar()
+                self.inotify = None
+        if not self.inotify:
+            self.modo = 'sondeo'
+            self.mtimes = self._mtimes_carpetas()
+
+        while True:
+            try:
+                if self.inotify:
+                    self._procesar_eventos(self.inotify.leer(self._espera()))
+                else:
+                    time.sleep(self._espera())
+                    self._comparar_mtimes()
+                self._avisar_si_toca()
+            except Exception as e:
+                print(f"Error vigilando la biblioteca: {e}")
+                time.sleep(1)
+
+    def _espera(self):
+        """Segundos hasta que haya que avisar de un lote (o hasta el próximo sondeo)."""
+        if self.pendientes:
+            ahora = time.monotonic()
+            limite = min(self.ultimo_cambio + ESPERA_VIGILANCIA_MS / 1000.0,
+                         self.primer_cambio + MAX_ESPERA_VIGILANCIA_MS / 1000.0)
+            return max(limite - ahora, 0.0)
+        if self.inotify:
+            return 3600.0 # Sin nada pendiente solo despiertan los eventos
+        if self.calientes:
+            return ESPERA_VIGILANCIA_MS / 1000.0
+        return INTERVALO_VIGILANCIA_MS / 1000.0
+
+    def _anotar(self, carpeta):
+        ahora = time.monotonic()
+        if not self.pendientes:
+            self.primer_cambio = ahora
+        self.ultimo_cambio = ahora
+        self.pendientes.add(carpeta)
+        self.eventos += 1
+
+    def _avisar_si_toca(self):
+        if self.pendientes and self._espera() <= 0:
+            carpetas, self.pendientes = self.pendientes, set()
+            self.lotes += 1
+            try:
+                self.al_cambiar(carpetas)
+            except Exception:
+                # El lote no se pierde: se reintenta tras ESPERA_VIGILANCIA_MS
+                self.pendientes |= carpetas
+                self.primer_cambio = self.ultimo_cambio = time.monotonic()
+                raise
+
+    # --- inotify ---
+
+    def _vigilar_arbol(self, raiz):
+        """Un watch por carpeta (inotify no es recursivo)."""
+        for carpeta, subcarpetas, _ in os.walk(raiz):
+            try:
+                self.carpetas_wd[self.inotify.vigilar(carpeta)] = carpeta
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise
+                # Carpeta borrada mientras la recorríamos: se ignora
+
+    def _procesar_eventos(self, eventos):
+        for wd, mask, nombre in eventos:
+            if mask & IN_Q_OVERFLOW:
+                self._anotar(self.raiz) # Se han perdido eventos: repasar todo
+                continue
+            carpeta = self.carpetas_wd.get(wd)
+            if carpeta is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.carpetas_wd[wd] # Carpeta borrada o movida fuera
+                continue
+            if mask & IN_DELETE_SELF:
+                continue # Ya lo avisa la carpeta padre
+
+            ruta = os.path.join(carpeta, nombre)
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    # El watch sigue a la carpeta movida: si vuelve a aparecer en
+                    # el árbol, IN_MOVED_TO lo reasigna a su nueva ruta
+                    prefijo = os.path.join(ruta, '')
+                    for wd_movido, ruta_movida in list(self.carpetas_wd.items()):
+                        if ruta_movida == ruta or ruta_movida.startswith(prefijo):
+                            del self.carpetas_wd[wd_movido]
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._vigilar_arbol(ruta) # Carpeta nueva (o un álbum entero movido dentro)
+                self._anotar(ruta)
+            self._anotar(carpeta)
+
+    # --- Sondeo ---
+
+    def _mtimes_carpetas(self):
+        mtimes = {}
+        pendientes = [self.raiz]
+        while pendientes:
+            carpeta = pendientes.pop()
+            try:
+                mtimes[carpeta] = os.stat(carpeta).st_mtime_ns
+                with os.scandir(carpeta) as entradas:
+                    pendientes.extend(e.path for e in entradas if e.is_dir(follow_symlinks=False))
+            except OSError:
+                pass # Borrada mientras la recorríamos
+        return mtimes
+
+    @staticmethod
+    def _firma(carpeta):
+        """(nombre, tamaño, mtime) de los archivos de la carpeta, o None si ya no existe."""
+        try:
+            with os.scandir(carpeta) as entradas:
+                return frozenset((e.name, st.st_size, st.st_mtime_ns) for e in entradas
+                                 if e.is_file(follow_symlinks=False) for st in (e.stat(),))
+        except OSError:
+            return None
+
+    def _comparar_mtimes(self):
+        # Carpetas que cambiaron hace poco: ¿siguen escribiéndose sus archivos?
+        ahora = time.monotonic()
+        for carpeta, (firma, cambio) in list(self.calientes.items()):
+            actual = self._firma(carpeta)
+            if actual is None or (actual == firma and ahora - cambio >= INTERVALO_VIGILANCIA_MS / 1000.0):
+                del self.calientes[carpeta] # Borrada, o ya quieta
+            elif actual != firma:
+                self.calientes[carpeta] = (actual, ahora)
+                self._anotar(carpeta) # Retrasa el lote (o pide otro si ya se avisó)
+
+        actuales = self._mtimes_carpetas()
+        for carpeta, mtime in actuales.items():
+            if self.mtimes.get(carpeta) != mtime:
+                self._anotar(carpeta)
+                self.calientes[carpeta] = (self._firma(carpeta), ahora)
+        for carpeta in self.mtimes.keys() - actuales.keys():
+            self._anotar(carpeta) # Borrada o movida
+        self.mtimes = actuales
+
+    def estadisticas(self):
+        return {'modo': self.modo, 'eventos': self.eventos, 'lotes': self.lotes,
+                'carpetas': len(self.carpetas_wd) if self.inotify else len(self.mtimes)}
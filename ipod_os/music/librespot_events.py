@@ -0,0 +1,103 @@
+import os
+import json
+import math
+import time
+import socket
+import threading
+from config import *
+from music.playback_state import reproduccion
+
+# Eventos de reproducción del librespot local (Raspotify).
+# Cuando el Pi es el dispositivo de Spotify Connect, librespot ejecuta su hook
+# 'onevent' en cada cambio (pista, play, pausa, seek, volumen...). El hook es
+# music/librespot_onevent.py, que reenvía las variables del evento como un
+# datagrama JSON a un socket Unix (RUTA_SOCKET_LIBRESPOT). Aquí se escucha ese
+# socket y cada evento va directo a reproduccion.aplicar_evento(): Now Playing
+# cambia en milisegundos y sin sondear la Web API.
+#
+# En /etc/raspotify/conf:
+#   LIBRESPOT_ONEVENT="/usr/bin/python3 /ruta/a/ipod_os/music/librespot_onevent.py"
+
+class EventosLibrespot:
+    def __init__(self, ruta=RUTA_SOCKET_LIBRESPOT):
+        self.ruta = ruta
+        self.hilo = None
+        self.sock = None
+
+        self.recibidos = 0
+        self.invalidos = 0
+        self.latencia_max_ms = 0.0 # Desde que librespot lanza el hook
+        self.latencia_total_ms = 0.0
+
+    def iniciar(self):
+        """Abre el socket y arranca el hilo de escucha (una sola vez)."""
+        if self.hilo is not None:
+            return
+        if not hasattr(socket, 'AF_UNIX'):
+            print("Eventos de librespot no disponibles (sin sockets Unix)")
+            return
+        try:
+            if os.path.exists(self.ruta):
+                os.unlink(self.ruta) # Socket de una ejecución anterior
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.ruta)
+            os.chmod(self.ruta, 0o666) # Raspotify corre con otro usuario
+        except OSError as e:
+            print(f"No se pudo abrir el socket de eventos de librespot: {e}")
+            self.sock = None
+            return
+        self.hilo = threading.Thread(target=self._bucle, daemon=True)
+        self.hilo.start()
+
+    def _bucle(self):
+        while True:
+            try:
+                datos = self.sock.recv(65536)
+            except OSError as e:
+                print(f"Error leyendo eventos de librespot: {e}")
+                time.sleep(1)
+                continue
+            try:
+                self._procesar(datos)
+            except Exception as e:
+                # Un evento raro no puede dejarnos sin eventos el resto de la sesión
+                print(f"Error procesando evento de librespot: {e}")
+
+    def _procesar(self, datos):
+        try:
+            evento = json.loads(datos.decode('utf-8'))
+            if not isinstance(evento, dict) or 'PLAYER_EVENT' not in evento:
+                raise ValueError("sin PLAYER_EVENT")
+        except ValueError as e:
+            self.invalidos += 1
+            print(f"Evento de librespot no válido: {e}")
+            return
+
+        # El emisor marca la hora de pared en que librespot lanzó el hook
+        ahora = time.time()
+        try:
+            enviado = float(evento.get('enviado', ahora))
+        except (TypeError, ValueError):
+            enviado = ahora
+        antiguedad = max(ahora - enviado, 0.0) if math.isfinite(enviado) else 0.0
+        self.recibidos += 1
+        self.latencia_total_ms += antiguedad * 1000.0
+        self.latencia_max_ms = max(self.latencia_max_ms, antiguedad * 1000.0)
+        if MODO_MEDICION:
+            print(f"[Medición] evento librespot '{evento['PLAYER_EVENT']}' recibido en {antiguedad * 1000:.1f} ms")
+
+        try:
+            reproduccion.aplicar_evento(evento, antiguedad)
+        except Exception as e:
+            print(f"Error aplicando evento de librespot {evento.get('PLAYER_EVENT')}: {e}")
+
+    def estadisticas(self):
+        return {
+            'recibidos': self.recibidos,
+            'invalidos': self.invalidos,
+            'latencia_media_ms': self.latencia_total_ms / self.recibidos if self.recibidos else 0.0,
+            'latencia_max_ms': self.latencia_max_ms,
+        }
+
+# Receptor único
+eventos_librespot = EventosLibrespot()
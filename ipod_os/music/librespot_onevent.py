@@ -0,0 +1,76 @@
+"""
+Hook 'onevent' de librespot: reenvía el evento a ipod_os por un socket Unix.
+
+librespot lo ejecuta en cada evento con las variables de entorno PLAYER_EVENT,
+TRACK_ID, POSITION_MS... Solo usa la librería estándar (no importa pygame ni
+config.py) para que arranque rápido en la Pi Zero. Si ipod_os no está en
+marcha, no hace nada.
+
+Como hook (en /etc/raspotify/conf):
+    LIBRESPOT_ONEVENT="/usr/bin/python3 /ruta/a/ipod_os/music/librespot_onevent.py"
+
+Como emisor de prueba (sin Raspotify), desde ipod_os/:
+    python music/librespot_onevent.py track_changed --pista 4uLU6hMCjMI75M1A2tKUQC --nombre "Song" --duracion 200000
+    python music/librespot_onevent.py playing --posicion 15000
+    python music/librespot_onevent.py paused --posicion 16000
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+
+RUTA_SOCKET = '/tmp/ipod_os_librespot.sock' # Igual que RUTA_SOCKET_LIBRESPOT en config.py
+
+# Variables de entorno que pone librespot (0.4 y 0.5+)
+VARIABLES = (
+    'PLAYER_EVENT', 'TRACK_ID', 'OLD_TRACK_ID', 'URI', 'ITEM_TYPE',
+    'NAME', 'ARTISTS', 'ALBUM', 'SHOW_NAME', 'NUMBER', 'COVERS',
+    'DURATION_MS', 'POSITION_MS', 'VOLUME', 'SHUFFLE',
+)
+
+def evento_desde_entorno():
+    return {v: os.environ[v] for v in VARIABLES if v in os.environ}
+
+def evento_desde_argumentos(argv):
+    parser = argparse.ArgumentParser(description="Emisor de eventos de librespot de prueba")
+    parser.add_argument('evento', help="playing, paused, seeked, track_changed, volume_changed...")
+    parser.add_argument('--pista', help="ID de la pista (base62)")
+    parser.add_argument('--nombre')
+    parser.add_argument('--artista')
+    parser.add_argument('--album')
+    parser.add_argument('--duracion', type=int, help="ms")
+    parser.add_argument('--posicion', type=int, help="ms")
+    parser.add_argument('--volumen', type=int, help="0-65535")
+    parser.add_argument('--socket', default=RUTA_SOCKET)
+    args = parser.parse_args(argv)
+
+    campos = {
+        'PLAYER_EVENT': args.evento, 'TRACK_ID': args.pista, 'NAME': args.nombre,
+        'ARTISTS': args.artista, 'ALBUM': args.album, 'DURATION_MS': args.duracion,
+        'POSITION_MS': args.posicion, 'VOLUME': args.volumen,
+    }
+    evento = {k: str(v) for k, v in campos.items() if v is not None}
+    return evento, args.socket
+
+def enviar(evento, ruta=RUTA_SOCKET):
+    """Manda el evento como datagrama. False si ipod_os no está escuchando."""
+    evento['enviado'] = time.time()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(json.dumps(evento).encode('utf-8'), ruta)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        evento, ruta = evento_desde_argumentos(sys.argv[1:])
+    else:
+        evento, ruta = evento_desde_entorno(), RUTA_SOCKET
+    if evento.get('PLAYER_EVENT'):
+        enviar(evento, ruta)
+    # Siempre salimos con 0: un fallo aquí no debe afectar a librespot
@@ -1,15 +1,34 @@
 import os
+import threading
 import vlc
 from config import AZUL_LOCAL
-from mutagen import File
+from utils import procesar_niveles_caratula, cargar_imagen_reducida
+from cover_cache import cache_caratulas
 from music.menu_principal import MenuPantalla
+from music.library_index import IndiceBiblioteca, ALBUM_DESCONOCIDO, buscar_caratula, leer_caratula
+from music.library_watcher import VigilanteBiblioteca
 
 class LocalPlayer:
     def __init__(self, ruta_musica="songs"):
         self.ruta_musica = ruta_musica
         
-        # Base de datos en memoria
+        # Base de datos en memoria (se monta desde el índice persistente)
+        # La llena el hilo de escaneo mientras se navega: se accede con self.lock
         self.biblioteca = {}
+        self.indice = IndiceBiblioteca()
+        self.lock = threading.Lock()
+        self._rutas = set() # Pistas ya en self.biblioteca
+        self._lock_indice = threading.Lock() # Escaneo y lotes del vigilante, de uno en uno
+        self._lock_caratulas = threading.Lock() # Búsqueda de carátulas, también de una en una
+        self.vigilante = VigilanteBiblioteca(ruta_musica, self.actualizar_carpetas)
+
+        # Progreso del escaneo en segundo plano
+        self.escaneando = False
+        self.escaneo_terminado = False # Hasta el primero, el menú muestra el progreso
+        self.escaneados = 0
+        self.total_estimado = 0 # Archivos del escaneo anterior
+        self.menu_artistas = None
+        self._albumes_cambiados = set() # Claves de álbumes con pistas nuevas o cambiadas en el escaneo
         
         # VLC se traga FLAC, WAV, ALAC sin problemas
         self.instance = vlc.Instance('--no-video', '--quiet')
@@ -19,94 +38,126 @@ class LocalPlayer:
         
         # Extensiones permitidas (puedes añadir más si quieres)
         self.valid_extensions = ('.mp3', '.flac', '.wav', '.m4a', '.ogg')
-        
-        self.scan_library()
+
+    def iniciar_escaneo(self):
+        """Escanea en segundo plano (lo ya indexado se puede usar desde el principio)."""
+        if self.escaneando: return
+        self.escaneando = True
+        threading.Thread(target=self.scan_library, daemon=True).start()
 
     def scan_library(self):
-        """Escanea recursivamente buscando audio y leyendo metadatos unificados"""
+        """
+        Pone al día el índice persistente (solo lee etiquetas de archivos
+        nuevos o modificados). La biblioteca en memoria y el menú de artistas
+        se van llenando según avanza.
+        """
         print("Escaneando biblioteca local (FLAC/MP3/WAV)...")
-        self.biblioteca = {}
+        self.escaneando = True
         
         if not os.path.exists(self.ruta_musica):
             os.makedirs(self.ruta_musica)
+            self.vigilante.iniciar()
+            self.escaneando = False
+            self.escaneo_terminado = True
+            self._publicar_artistas()
             return
 
-        for root, dirs, files in os.walk(self.ruta_musica):
-            for file in files:
-                # Comprobamos si termina en alguna de las extensiones validas
-                if file.lower().endswith(self.valid_extensions):
-                    path = os.path.join(root, file)
-                    try:
-                        # --- MAGIA DE MUTAGEN ---
-                        # File(path, easy=True) detecta si es FLAC o MP3 y nos da
-                        # una interfaz común (diccionario) para leer los datos.
-                        audio = File(path, easy=True)
-                        
-                        # Valores por defecto por si el archivo no tiene etiquetas
-                        # OJO: Los WAV suelen venir sin etiquetas (serán None)
-                        if audio:
-                            artista = audio.get('artist', ['Unknown Artist'])[0]
-                            album = audio.get('album', ['Unknown Album'])[0]
-                            titulo = audio.get('title', [file])[0]
-                            track_no = audio.get('tracknumber', ['0'])[0]
-                        else:
-                            # Si mutagen no entiende el archivo o no tiene tags (ej: WAV básico)
-                            artista = "Unknown Artist"
-                            album = "Unknown Album"
-                            titulo = file # Usamos nombre de archivo
-                            track_no = "0"
-                        
-                        # Insertar en la biblioteca
-                        if artista not in self.biblioteca:
-                            self.biblioteca[artista] = {}
-                        if album not in self.biblioteca[artista]:
-                            self.biblioteca[artista][album] = []
-                            
-                        self.biblioteca[artista][album].append({
-                            'titulo': titulo,
-                            'ruta': path,
-                            'track_no': track_no
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error leyendo {file}: {e}")
-
-        # Ordenar artistas alfabéticamente
-        self.biblioteca = dict(sorted(self.biblioteca.items()))
-
-    # Añade esto dentro de la clase LocalPlayer, al final
-    
-    def get_caratula(self, ruta_archivo):
+        # Desde ya: lo que se copie durante el escaneo llega como lote después
+        self.vigilante.iniciar()
+
+        # 1. Lo que ya estaba indexado, al momento
+        self._cargar_indice()
+        self.total_estimado = self.indice.total()
+        self._publicar_artistas()
+
+        # 2. Recorrido: las pistas nuevas van apareciendo por lotes
+        with self._lock_indice:
+            cambios = self.indice.sincronizar(self.ruta_musica, self.valid_extensions, al_avanzar=self._al_avanzar)
+        print(f"Biblioteca: {cambios['nuevas']} nuevas, {cambios['cambiadas']} cambiadas, "
+              f"{cambios['borradas']} borradas, {cambios['sin_cambios']} sin cambios ({cambios['segundos']:.1f} s)")
+
+        # 3. Se vuelve a montar desde el índice (quita las borradas y las etiquetas viejas)
+        self._cargar_indice()
+        self.escaneando = False
+        self.escaneo_terminado = True
+        self._publicar_artistas()
+
+        # 4. Carátulas, ya sin frenar el recorrido: se olvidan las de los álbumes
+        #    que han cambiado y se buscan las que falten (ej: álbumes nuevos)
+        cambiados, self._albumes_cambiados = self._albumes_cambiados, set()
+        self._actualizar_caratulas(cambiados)
+
+    def actualizar_carpetas(self, carpetas):
         """
-        Intenta extraer la imagen incrustada (ID3 APIC o FLAC Picture).
-        Devuelve bytes de imagen o None si falla.
+        Hilo del vigilante: aplica un lote de cambios (altas, bajas, movidos)
+        repasando solo las carpetas afectadas, y refresca los menús.
+        Las carátulas de los álbumes de esas carpetas se vuelven a buscar
+        (puede haber llegado un cover.jpg sin que cambie ninguna pista).
         """
-        try:
-            f = File(ruta_archivo)
+        prefijos = tuple(os.path.join(c, '') for c in carpetas)
+        afectados = {clave for clave, ruta in self._pistas() if ruta.startswith(prefijos)}
+        with self._lock_indice:
+            cambios = self.indice.sincronizar(self.ruta_musica, self.valid_extensions, carpetas=carpetas,
+                                              al_avanzar=lambda filas, _hechos: afectados.update(self._claves_filas(filas)))
+        if cambios['nuevas'] or cambios['cambiadas'] or cambios['borradas']:
+            print(f"Biblioteca (cambios en {len(carpetas)} carpetas): {cambios['nuevas']} nuevas, "
+                  f"{cambios['cambiadas']} cambiadas, {cambios['borradas']} borradas")
+            self._cargar_indice()
+            self._publicar_artistas()
+        self._actualizar_caratulas(afectados)
+
+    @staticmethod
+    def _insertar(biblioteca, path, artista, album, titulo, track_no):
+        if artista not in biblioteca:
+            biblioteca[artista] = {}
+        if album not in biblioteca[artista]:
+            biblioteca[artista][album] = []
             
-            # 1. CASO FLAC
-            # Los FLAC guardan las imagenes en f.pictures
-            if hasattr(f, 'pictures') and f.pictures:
-                # Solemos querer la primera imagen
-                return f.pictures[0].data
-                
-            # 2. CASO ID3 (MP3)
-            # Buscamos etiquetas que empiecen por APIC: (Attached Picture)
-            if hasattr(f, 'tags'):
-                for key in f.tags.keys():
-                    if key.startswith('APIC:'):
-                        return f.tags[key].data
-                        
-            return None # No se encontró imagen
-        except Exception as e:
-            print(f"Error extrayendo carátula: {e}")
-            return None
-    
-    # --- MENÚS (Igual que antes) ---
+        biblioteca[artista][album].append({
+            'titulo': titulo,
+            'ruta': path,
+            'track_no': track_no
+        })
 
-    def get_menu_artistas(self):
+    def _cargar_indice(self):
+        biblioteca = {}
+        rutas = set()
+        for path, artista, album, titulo, track_no in self.indice.pistas():
+            self._insertar(biblioteca, path, artista, album, titulo, track_no)
+            rutas.add(path)
+        with self.lock:
+            # Ordenar artistas alfabéticamente
+            self.biblioteca = dict(sorted(biblioteca.items()))
+            self._rutas = rutas
+
+    def _al_avanzar(self, filas, hechos):
+        """Hilo de escaneo: añade las pistas recién leídas y refresca el menú."""
+        self.escaneados = hechos
+        with self.lock:
+            nuevas = False
+            for path, _mtime, _tamano, artista, album, titulo, track_no, valida in filas:
+                if valida and path not in self._rutas:
+                    self._insertar(self.biblioteca, path, artista, album, titulo, track_no)
+                    self._rutas.add(path)
+                    nuevas = True
+            if nuevas:
+                self.biblioteca = dict(sorted(self.biblioteca.items()))
+        self._publicar_artistas()
+        # Las carátulas se buscan al acabar el recorrido (aquí solo se anota qué álbumes)
+        self._albumes_cambiados.update(self._claves_filas(filas))
+
+    def _texto_progreso(self):
+        if self.total_estimado:
+            return f"Scanning... {min(99, self.escaneados * 100 // self.total_estimado)}%"
+        return f"Scanning... {self.escaneados}"
+
+    def _opciones_artistas(self):
         opciones = []
-        for artista in self.biblioteca.keys():
+        if self.escaneando or not self.escaneo_terminado:
+            opciones.append({'nombre': self._texto_progreso(), 'type': 'info_static', 'uri': None})
+        with self.lock:
+            artistas = list(self.biblioteca.keys())
+        for artista in artistas:
             opciones.append({
                 'nombre': artista,
                 'type': 'local_artist',
@@ -114,13 +165,111 @@ class LocalPlayer:
             })
         if not opciones:
             opciones.append({'nombre': '(No songs found)', 'type': 'info_static', 'uri': None})
-            
-        return MenuPantalla("Local Music", opciones, color_tema=AZUL_LOCAL)
+        return opciones
+
+    def _publicar_artistas(self):
+        if self.menu_artistas:
+            self.menu_artistas.reemplazar_opciones(self._opciones_artistas())
+
+    # --- CARÁTULAS ---
+
+    @staticmethod
+    def _clave_album(artista, album, ruta):
+        """Clave de la carátula en la caché. Sin álbum en las etiquetas, una por carpeta."""
+        carpeta = os.path.dirname(ruta) if album == ALBUM_DESCONOCIDO else None
+        return cache_caratulas.clave_album(artista, album, carpeta)
+
+    def _claves_filas(self, filas):
+        return {self._clave_album(artista, album, path)
+                for path, _mtime, _tamano, artista, album, _titulo, _track_no, valida in filas if valida}
+
+    def _pistas(self):
+        """(clave del álbum, ruta) de cada pista de la biblioteca."""
+        with self.lock:
+            pistas = [(artista, album, pista['ruta'])
+                      for artista, albumes in self.biblioteca.items()
+                      for album, lista in albumes.items() for pista in lista]
+        return [(self._clave_album(artista, album, ruta), ruta) for artista, album, ruta in pistas]
+
+    def _albumes(self):
+        """{clave del álbum: ruta de una de sus pistas} de toda la biblioteca."""
+        albumes = {}
+        for clave, ruta in self._pistas():
+            albumes.setdefault(clave, ruta)
+        return albumes
+
+    def _actualizar_caratulas(self, cambiados):
+        """
+        Olvida las carátulas de los álbumes cambiados y busca las que falten.
+        Escaneo y vigilante pasan por aquí de uno en uno: si no, los dos
+        podrían procesar el mismo álbum a la vez (o uno guardar una carátula
+        que el otro acaba de olvidar).
+        """
+        with self._lock_caratulas:
+            self._olvidar_caratulas(cambiados)
+            self._resolver_caratulas(self._albumes())
+
+    def _olvidar_caratulas(self, claves):
+        """Álbumes que han cambiado: fuera de la caché y del índice, para buscarlas de nuevo."""
+        if not claves:
+            return
+        self.indice.olvidar_caratulas(claves)
+        for clave in claves:
+            cache_caratulas.descartar(clave)
+
+    def _resolver_caratulas(self, albumes):
+        """
+        Con _lock_caratulas (ver _actualizar_caratulas): busca una sola vez la
+        carátula de cada álbum y la deja en la caché ya reducida (niveles 64x64)
+        con la clave del álbum. Al reproducir no hay que abrir ni parsear nada.
+        """
+        resueltos = self.indice.caratulas_resueltas()
+        for clave, ruta in albumes.items():
+            if clave in resueltos:
+                continue
+            origen, data = buscar_caratula(ruta)
+            if data and not self._guardar_caratula(clave, data):
+                origen = None
+            self.indice.guardar_caratula(clave, origen)
+
+    @staticmethod
+    def _guardar_caratula(clave, data):
+        try:
+            niveles = procesar_niveles_caratula(cargar_imagen_reducida(data))
+        except Exception as e:
+            print(f"Error procesando carátula: {e}")
+            return False
+        cache_caratulas.guardar(clave, niveles)
+        return True
+
+    def get_caratula(self, ruta_archivo, artista, album):
+        """
+        (clave, cargar) de la carátula de la pista. La clave es la del álbum,
+        que normalmente ya está en la caché. Si no (la caché la ha descartado o
+        el escaneo aún no ha llegado), cargar() devuelve los bytes: abre
+        archivos, así que se llama fuera del hilo de la UI.
+        """
+        clave = self._clave_album(artista, album, ruta_archivo)
+        def cargar():
+            resuelta, origen = self.indice.origen_caratula(clave)
+            if resuelta:
+                return leer_caratula(origen) if origen else None
+            return buscar_caratula(ruta_archivo)[1]
+        return clave, cargar
+    
+    # --- MENÚS (Igual que antes) ---
+
+    def get_menu_artistas(self):
+        # Un único menú: el escaneo le va pasando la lista actualizada
+        if self.menu_artistas is None:
+            self.menu_artistas = MenuPantalla("Local Music", self._opciones_artistas(), color_tema=AZUL_LOCAL)
+        return self.menu_artistas
 
     def get_menu_albums(self, artista):
         opciones = []
-        if artista in self.biblioteca:
-            albums = self.biblioteca[artista].keys()
+        with self.lock:
+            albums = list(self.biblioteca.get(artista, {}).keys())
+        if albums:
             for alb in albums:
                 opciones.append({
                     'nombre': alb,
@@ -132,9 +281,9 @@ class LocalPlayer:
 
     def get_menu_tracks(self, artista, album):
         opciones = []
-        if artista in self.biblioteca and album in self.biblioteca[artista]:
-            tracks = self.biblioteca[artista][album]
-            
+        with self.lock:
+            tracks = list(self.biblioteca.get(artista, {}).get(album, []))
+        if tracks:
             # Ordenar por número de pista si es posible
             # (Intenta convertir track_no a int, si falla usa 0)
             tracks.sort(key=lambda x: int(x['track_no'].split('/')[0]) if x['track_no'].replace('/','').isdigit() else 0)
@@ -1,6 +1,20 @@
 import pygame
 from config import *
-from utils import cargar_fuente, dibujar_header, truncar_texto, dibujar_scrollbar, dibujar_lista_elementos, obtener_ip
+from utils import cargar_fuente, dibujar_header, actualizar_header, truncar_texto, dibujar_scrollbar, dibujar_lista_elementos, obtener_ip
+from text_cache import renderizar_texto
+from damage import danos
+from scheduler import solicitar_redibujo
+from tareas import lanzar
+from music.paginas import TIPOS_PAGINADOS, descargar_pagina
+from response_cache import cache_respuestas
+from api_scheduler import planificador_api, INTERACTIVA, FONDO
+from music.prefetch import precargador
+from music.playback_state import reproduccion
+
+PASO_ANIMACION_CARGA = 300 # ms entre cada punto de "Loading..."
+
+# Hueco de una página aún sin descargar (compartido, no se modifica)
+PENDIENTE = {'nombre': "Loading...", 'type': 'placeholder'}
 
 class MenuPantalla:
     def __init__(self, titulo, opciones, sp_client=None, tipo_carga=None, id_padre=None, color_tema=VERDE_SPOTIFY):
@@ -12,94 +26,258 @@ class MenuPantalla:
         self.color_tema = color_tema
 
         self.datos_cargados = False
+        # Carga en segundo plano: cada carga lleva un número de generación y
+        # solo se aplica el resultado de la última (cancelar = cambiar de generación)
+        self.generacion = 0
+        self.cargando = False
+        self.futuro = None
+        self.resultados = [] # (generacion, pagina, opciones, total, cursor) listos para aplicar en el hilo de dibujado
+        self.reemplazos = [] # Listas completas publicadas desde otro hilo (reemplazar_opciones)
+        self.paginas = set() # Páginas descargadas y en memoria
+        self.paginas_pedidas = set()
+        self.cursores = {0: None} # Página -> cursor para pedirla (artistas seguidos)
+        self.inicio_carga = 0
         self.seleccionado = 0
         self.indice_inicio = 0 # Scroll
         self.items_visibles = 7
         self.font_item = cargar_fuente(TEXT_BIG)
 
+
+    @property
+    def paginado(self):
+        return self.tipo_carga in TIPOS_PAGINADOS
+
+    def iniciar_carga(self):
+        """
+        Lanza la descarga de las opciones en el pool sin bloquear el dibujado.
+        Los menús paginados se muestran en cuanto el pool lee la página de la caché.
+        """
+        # Evitamos cargar si ya tenemos datos, ya se está cargando o no hay cliente Spotify
+        if self.datos_cargados or self.cargando or not self.sp: return
+
+        self.generacion += 1
+        self.cargando = True
+        self.inicio_carga = pygame.time.get_ticks()
+        self.paginas = set()
+        self.paginas_pedidas = set()
+        self.cursores = {0: None}
+        if self.paginado:
+            self._solicitar_pagina(0)
+        else:
+            self.futuro = lanzar(self._tarea_carga, self.generacion)
+
+    def cancelar_carga(self):
+        """Abandona la carga en curso (y las páginas pedidas): sus resultados se descartarán al llegar."""
+        if not self.cargando and not self.paginas_pedidas: return
+        self.generacion += 1
+        self.cargando = False
+        self.paginas_pedidas.clear()
+        if self.futuro:
+            self.futuro.cancel() # Si aún no había empezado, ni se ejecuta
+            self.futuro = None
+
+    def _tarea_carga(self, generacion):
+        """Se ejecuta en un hilo del pool. No toca la pantalla ni self.opciones."""
+        nuevas = self.cargar_datos()
+        if generacion != self.generacion:
+            return # Cancelada mientras se descargaba
+        self.resultados.append((generacion, None, nuevas, None, None))
+        solicitar_redibujo()
+
+    def _tarea_pagina(self, generacion, pagina, offset, cursor):
+        """
+        Se ejecuta en un hilo del pool. Stale-while-revalidate: si la página
+        está en la caché se deja lista ya (aunque esté caducada); si falta o
+        está caducada se descarga. La caché se mira aquí y no en el hilo de
+        dibujado: la consulta puede esperar al commit (fsync) de otro hilo.
+        """
+        cacheada = cache_respuestas.obtener(self.tipo_carga, self.id_padre, pagina)
+        datos, snapshot = None, None
+        if cacheada:
+            datos, fresca, snapshot = cacheada
+            self._publicar(generacion, pagina, *datos)
+            if fresca:
+                return
+        self._descargar_pagina(generacion, pagina, offset, cursor, datos, snapshot)
+
+    def _descargar_pagina(self, generacion, pagina, offset, cursor, cacheada=None, snapshot=None):
+        """
+        Descarga una página, la guarda en la caché y la deja lista. Si
+        'cacheada' viene, es una revalidación y solo se avisa al menú cuando
+        algo ha cambiado.
+        """
+        # Una revalidación no le quita el turno a lo que pide el usuario
+        prioridad = FONDO if cacheada is not None else INTERACTIVA
+        with planificador_api.prioridad(prioridad):
+            tipo = self.tipo_carga
+            nuevas, total, siguiente = None, None, None
+            try:
+                # Playlist ya cacheada: basta con comparar el snapshot_id
+                if cacheada is not None and tipo == 'playlist_tracks' and snapshot:
+                    actual = self.sp.playlist(self.id_padre, fields='snapshot_id')['snapshot_id']
+                    cache_respuestas.registrar_snapshots({self.id_padre: actual})
+                    if actual == snapshot:
+                        cache_respuestas.renovar(tipo, self.id_padre, pagina)
+                        self._publicar(generacion, pagina, None, None, None) # Nada que aplicar
+                        return
+                    snapshot = actual
+                else:
+                    snapshot = None
+
+                nuevas, total, siguiente = descargar_pagina(self.sp, tipo, self.id_padre, offset, cursor)
+                if tipo == 'playlists':
+                    cache_respuestas.registrar_snapshots({i['uri']: i['snapshot_id'] for i in nuevas if i.get('snapshot_id')})
+
+                if cacheada is not None and (nuevas, total, siguiente) == tuple(cacheada):
+                    cache_respuestas.renovar(tipo, self.id_padre, pagina, snapshot)
+                    nuevas = None # Lo que se está mostrando ya es correcto
+                else:
+                    cache_respuestas.guardar(tipo, self.id_padre, pagina, nuevas, total, siguiente, snapshot)
+            except Exception as e:
+                # Si había copia en caché se sigue mostrando esa
+                print(f"Error cargando {tipo} (página {pagina}): {e}")
+                nuevas = None
+        self._publicar(generacion, pagina, nuevas, total, siguiente)
+
+    def _publicar(self, generacion, pagina, nuevas, total, siguiente):
+        """Deja el resultado de una página para el hilo de dibujado."""
+        if generacion != self.generacion:
+            return # Cancelada mientras se descargaba
+        self.resultados.append((generacion, pagina, nuevas, total, siguiente))
+        if nuevas is not None or self.cargando:
+            solicitar_redibujo()
+
+    def _aplicar_resultado(self):
+        """En el hilo de dibujado: coloca las cargas/páginas que hayan llegado."""
+        while self.resultados:
+            generacion, pagina, nuevas, total, siguiente = self.resultados.pop(0)
+            if generacion != self.generacion:
+                continue # Resultado viejo (carga cancelada)
+
+            if pagina is None:
+                self.opciones = nuevas
+                self._fin_carga()
+            else:
+                self._recibir_pagina(pagina, nuevas, total, siguiente)
+
+    def reemplazar_opciones(self, nuevas):
+        """Desde cualquier hilo: sustituye la lista en el siguiente frame (ej: escaneo local)."""
+        self.reemplazos.append(nuevas)
+        solicitar_redibujo()
+
+    def _aplicar_reemplazo(self):
+        """En el hilo de dibujado: aplica la última lista publicada sin perder el elemento seleccionado."""
+        nuevas = None
+        while self.reemplazos:
+            nuevas = self.reemplazos.pop(0)
+        if nuevas is None:
+            return
+        actual = self.obtener_seleccion()
+        self.opciones = nuevas
+        nombre = actual.get('nombre') if isinstance(actual, dict) else actual
+        self.seleccionado = next((i for i, o in enumerate(nuevas) if isinstance(o, dict) and o.get('nombre') == nombre),
+                                 max(0, min(self.seleccionado, len(nuevas) - 1)))
+        if self.seleccionado < self.indice_inicio:
+            self.indice_inicio = self.seleccionado
+        elif self.seleccionado >= self.indice_inicio + self.items_visibles:
+            self.indice_inicio = self.seleccionado - self.items_visibles + 1
+
+    def _fin_carga(self):
+        if self.cargando:
+            self.seleccionado = 0
+            self.indice_inicio = 0
+            self.cargando = False
+            self.futuro = None
+            self.datos_cargados = True
+
+    def _recibir_pagina(self, pagina, nuevas, total, siguiente):
+        """Coloca una página (de la red o de la caché). nuevas=None: error o sin cambios."""
+        self.paginas_pedidas.discard(pagina)
+        if self.cargando and pagina == 0:
+            self._iniciar_lista(nuevas, total, siguiente)
+            self._fin_carga()
+        elif nuevas is not None:
+            if pagina == 0 and (not self.paginas or max(total, len(nuevas)) != len(self.opciones)):
+                # La revalidación cambia el total (o antes estaba vacío): rehacemos la lista
+                self._iniciar_lista(nuevas, total, siguiente)
+                self.seleccionado = max(0, min(self.seleccionado, len(self.opciones) - 1))
+                self.indice_inicio = min(self.indice_inicio, self.seleccionado)
+            else:
+                self._colocar_pagina(pagina, nuevas, total, siguiente)
+        # Si falla una página intermedia se volverá a pedir al acercarse a ella
+
+    def _iniciar_lista(self, nuevas, total, siguiente):
+        """Primera página: la lista ocupa ya el total del servidor (huecos PENDIENTE)."""
+        self.paginas = set()
+        if nuevas is None:
+            self.opciones = ["Error de conexion"]
+            return
+        if not nuevas:
+            self.opciones = ["Vacío"] # Para saber si cargo pero no habia nada
+            return
+        self.opciones = [PENDIENTE] * max(total, len(nuevas))
+        self._colocar_pagina(0, nuevas, total, siguiente)
+
+    def _colocar_pagina(self, pagina, nuevas, total, siguiente):
+        inicio = pagina * TAMANO_PAGINA
+        if inicio >= len(self.opciones):
+            return
+        fin = inicio + len(nuevas)
+        if len(nuevas) < TAMANO_PAGINA and fin < len(self.opciones):
+            # Última página más corta de lo que decía el total: recortamos
+            del self.opciones[fin:]
+            self.seleccionado = min(self.seleccionado, len(self.opciones) - 1)
+        self.opciones[inicio:fin] = nuevas[:len(self.opciones) - inicio]
+        self.paginas.add(pagina)
+        if siguiente:
+            self.cursores[pagina + 1] = siguiente
+        self._liberar_paginas()
+
+    def _liberar_paginas(self):
+        """Vacía las páginas lejos de la selección para acotar la memoria."""
+        actual = self.seleccionado // TAMANO_PAGINA
+        for pagina in [p for p in self.paginas if abs(p - actual) > VENTANA_PAGINAS]:
+            inicio = pagina * TAMANO_PAGINA
+            fin = min(inicio + TAMANO_PAGINA, len(self.opciones))
+            self.opciones[inicio:fin] = [PENDIENTE] * (fin - inicio)
+            self.paginas.discard(pagina)
+
+    def _solicitar_pagina(self, pagina):
+        """Pide una página al pool (caché o red, ver _tarea_pagina)."""
+        cursor = self.cursores.get(pagina)
+        self.paginas_pedidas.add(pagina)
+        futuro = lanzar(self._tarea_pagina, self.generacion, pagina, pagina * TAMANO_PAGINA, cursor)
+        if self.cargando:
+            self.futuro = futuro
+
+    def _pedir_pagina(self, pagina):
+        if pagina < 0 or pagina * TAMANO_PAGINA >= len(self.opciones):
+            return
+        if pagina in self.paginas or pagina in self.paginas_pedidas:
+            return
+        if self.tipo_carga == 'artistas' and pagina not in self.cursores:
+            return # Por cursor: hace falta la página anterior para saber dónde empieza esta
+        self._solicitar_pagina(pagina)
+
+    def _comprobar_paginas(self):
+        """Pide la página de la selección y la vecina si la selección se acerca al borde."""
+        if not self.paginado or not self.datos_cargados or not self.paginas:
+            return
+        actual = self.seleccionado // TAMANO_PAGINA
+        posicion = self.seleccionado % TAMANO_PAGINA
+        self._pedir_pagina(actual)
+        if posicion >= TAMANO_PAGINA - MARGEN_PAGINA:
+            self._pedir_pagina(actual + 1)
+        elif posicion < MARGEN_PAGINA:
+            self._pedir_pagina(actual - 1)
+
     def cargar_datos(self):
-        # Evitamos cargar si ya tenemos datos o no hay cliente Spotify
-        if self.datos_cargados or not self.sp: return
-        
+        """Descarga y devuelve las opciones de los menús no paginados (bloqueante: se llama desde el pool)."""
         try:
             nuevas = []
             
-            # --- FAV ARTISTS ---
-            if self.tipo_carga == 'artistas':
-                print("Descargando artistas...")
-                res = self.sp.current_user_followed_artists(limit=50)
-                nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'artist'} for i in res['artists']['items']]
-            
-            # --- FAV ALBUMS ---
-            elif self.tipo_carga == 'albums':
-                print("Descargando albumes guardados...")
-                res = self.sp.current_user_saved_albums(limit=50)
-                # OJO: Aqui la estructura es item['album']['name']
-                nuevas = [{'nombre': i['album']['name'], 'uri': i['album']['uri'], 'type': 'album'} for i in res['items']]
-
-            # --- MY PLAYLISTS ---
-            elif self.tipo_carga == 'playlists':
-                print("Descargando playlists...")
-                res = self.sp.current_user_playlists(limit=50)
-                nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'playlist'} for i in res['items']]
-            
-            # --- NEW RELEASES ---
-            elif self.tipo_carga == 'new_releases':
-                print("Descargando novedades...")
-                res = self.sp.new_releases(limit=50)
-                # Aqui la estructura es res['albums']['items']
-                nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'album'} for i in res['albums']['items']]
-            
-            # --- ALBUMS (ARTIST) ---
-            elif self.tipo_carga == 'artist_albums' and self.id_padre:
-                print(f"Cargando albumes del artista {self.id_padre}...")
-                # include_groups='album,single' para filtrar un poco
-                res = self.sp.artist_albums(self.id_padre, limit=50, country="ES", include_groups='album,single')
-                nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'album'} for i in res['items']]
-
-            # --- SONGS (ALBUM) ---
-            elif self.tipo_carga == 'album_tracks' and self.id_padre:
-                print(f"Cargando canciones del album {self.id_padre}...")
-                res = self.sp.album_tracks(self.id_padre, limit=50)
-                # Las canciones son 'track', listas para reproducir
-                nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'track'} for i in res['items']]
-
-            # --- SONGS (PLAYLIST) ---
-            elif self.tipo_carga == 'playlist_tracks' and self.id_padre:
-                print(f"Cargando canciones de playlist {self.id_padre}...")
-                res = self.sp.playlist_items(self.id_padre, limit=50)
-                # En playlist, la cancion esta dentro de 'track'
-                nuevas = []
-                for item in res['items']:
-                    if item.get('track'): # Verificacion de seguridad # A veces hay items vacios
-                        t = item['track']
-                        nuevas.append({'nombre': t['name'], 'uri': t['uri'], 'type': 'track'})
-            
-            # --- SHOWS ---
-            elif self.tipo_carga == 'shows':
-                print("Descargando shows...")
-                res = self.sp.current_user_saved_shows(limit=20)
-                nuevas = []
-                for item in res['items']:
-                    show_obj = item['show']
-                    nuevas.append({'nombre': show_obj['name'], 'uri': show_obj['uri'], 'id': show_obj['id'], 'type': 'show'})
-            
-            # --- EPISODES ---
-            elif self.tipo_carga == 'show_episodes':
-                print(f"Cargando episodios del show {self.id_padre}...")
-                # self.id_padre aquí será el ID del show
-                results = self.sp.show_episodes(show_id=self.id_padre, limit=20)
-                nuevas = []
-                for episode in results['items']:
-                    nuevas.append({
-                        'type': 'episode',    # Etiqueta para reproducir
-                        'nombre': episode['name'], 
-                        'uri': episode['uri'],
-                        'subtype': 'podcast'
-                    })
-            
             # --- SETTINGS ---
-            elif self.tipo_carga == 'settings':
+            if self.tipo_carga == 'settings':
                 nuevas = []
                 
                 # 1. Mostrar IP (Información)
@@ -118,18 +296,17 @@ class MenuPantalla:
                 })
 
                 # 3. Toggle Shuffle
-                # Obtenemos estado actual (esto puede tardar un poco, idealmente se cachea)
-                try:
-                    pb = self.sp.current_playback()
-                    if pb:
-                        shuffle_state = pb['shuffle_state']
-                    else:
+                # Estado actual: la última instantánea del sondeo en segundo plano
+                # (si el menú se abre antes del primer sondeo, se espera a él)
+                inst = reproduccion.esperar_instantanea(HTTP_PLAZO)
+                if inst.valida:
+                    shuffle_state = inst.shuffle
+                    if not inst.dispositivo:
                         # Si no hay playback, asumimos False, pero avisamos
                         print("No hay dispositivo activo para leer Shuffle")
-                        shuffle_state = False
                     txt_shuffle = "Shuffle: ON" if shuffle_state else "Shuffle: OFF"
-                except:
-                    shuffle_state = False
+                else:
+                    shuffle_state = None # Desconocido: main.py lo vuelve a mirar al pulsar
                     txt_shuffle = "Shuffle: ?"
 
                 nuevas.append({
@@ -195,15 +372,12 @@ class MenuPantalla:
                     nuevas = [{'nombre': "Error loading", 'type': 'info_static'}]
 
             if nuevas:
-                self.opciones = nuevas
-            else:
-                self.opciones = ["Vacío"] # Para saber si cargo pero no habia nada
+                return nuevas
+            return ["Vacío"] # Para saber si cargo pero no habia nada
         
         except Exception as e:
             print(f"Error cargando {self.tipo_carga}: {e}")
-            self.opciones = ["Error de conexion"]
-            
-        self.datos_cargados = True
+            return ["Error de conexion"]
 
     def mover_arriba(self):
         if self.seleccionado > 0:
@@ -221,25 +395,42 @@ class MenuPantalla:
         if not self.opciones: return None
         return self.opciones[self.seleccionado]
 
+    def proximo_despertar(self):
+        """Mientras carga, despertamos para animar los puntos de "Loading"."""
+        if not self.cargando:
+            return None
+        transcurrido = pygame.time.get_ticks() - self.inicio_carga
+        return self.inicio_carga + (transcurrido // PASO_ANIMACION_CARGA + 1) * PASO_ANIMACION_CARGA
+
+    def _dibujar_cargando(self, pantalla, estado_play):
+        danos.disposicion(pantalla, 'menu_cargando')
+        actualizar_header(pantalla, truncar_texto(self.titulo, 20), estado_play, self.color_tema)
+
+        puntos = (pygame.time.get_ticks() - self.inicio_carga) // PASO_ANIMACION_CARGA % 4
+        rect_texto = pygame.Rect(0, 100, ANCHO, self.font_item.get_height())
+        if danos.region('cargando', puntos, rect_texto):
+            pantalla.fill(NEGRO, rect_texto)
+            t = renderizar_texto(self.font_item, "Loading" + "." * puntos, self.color_tema)
+            pantalla.blit(t, (100, 100))
+
     def dibujar(self, pantalla, estado_play):
         
-        # Si es un menu dinamico y esta vacio, cargamos
-        
+        # Si es un menu dinamico y esta vacio, cargamos (en segundo plano)
+        self._aplicar_resultado()
+        self._aplicar_reemplazo()
+        self._comprobar_paginas()
+        if self.sp and self.datos_cargados:
+            precargador.observar(self.sp, self.obtener_seleccion())
         if self.tipo_carga and not self.datos_cargados:
-            pantalla.fill(NEGRO)
-            dibujar_header(pantalla, truncar_texto(self.titulo, 20), estado_play, self.color_tema)
-            t = self.font_item.render("Loading...", ANTIALIASING, self.color_tema)
-            pantalla.blit(t, (100, 100))
-            pygame.display.flip() # Forzamos refresco para que se vea el "Loading"
-            self.cargar_datos()
-        
-        #if not self.datos_cargados and self.sp:
-        #    self.cargar_datos()
+            self.iniciar_carga()
+            self._dibujar_cargando(pantalla, estado_play)
+            return
         
-        pantalla.fill(NEGRO)
+        # Solo limpiamos todo si cambia la pantalla; si no, cada zona se repinta sola
+        danos.disposicion(pantalla, 'menu')
 
         # Header
-        dibujar_header(pantalla, truncar_texto(self.titulo, 20), estado_play, self.color_tema)
+        actualizar_header(pantalla, truncar_texto(self.titulo, 20), estado_play, self.color_tema)
         
         # --- DIBUJADO DE LISTA UNIFICADO ---
         dibujar_lista_elementos(
@@ -251,4 +442,4 @@ class MenuPantalla:
             fuente=self.font_item, # Pasamos la fuente configurada en __init__
             tiene_foco=True,       # El menú siempre tiene el foco
             color_tema=self.color_tema
-        )
\ No newline at end of file
+        )
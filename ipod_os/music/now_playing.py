@@ -6,8 +6,17 @@ import io
 import traceback
 import numpy as np
 from config import *
-from utils import cargar_fuente, dibujar_header, truncar_texto, formato_tiempo, procesar_caratula_retro, descargar_imagen_url
+from utils import cargar_fuente, dibujar_header, actualizar_header, truncar_texto, formato_tiempo, procesar_niveles_caratula, descargar_imagen_url, cargar_imagen_reducida
+from text_cache import renderizar_texto
+from dithering import aplicar_paleta, crear_caratula_indexada
+from cover_cache import cache_caratulas
+from damage import danos
+from scheduler import solicitar_redibujo
+from music.playback_state import reproduccion
 from twitch.twitch_chat import TwitchChat
+from twitch.chat_overlay import ChatOverlay
+
+ANCHO_BARRA_PROGRESO = 290
 
 class PantallaNowPlaying:
     def __init__(self, sp_client):
@@ -27,13 +36,14 @@ class PantallaNowPlaying:
         
         self.cover_img = None
         self.cover_url = ""
+        self.cover_clave = None # Clave (caché) de la carátula que se está mostrando/pidiendo
+        self.cover_niveles = None # Niveles de los que sale cover_img (para reutilizarla)
         self.duration = 0
         self.progress = 0
         self.is_playing = False
         
-        # Control de actualización (solo para Spotify)
-        self.last_update = 0
-        self.update_interval = 1000
+        # Última instantánea de reproducción aplicada (solo para Spotify)
+        self.instantanea = None
         
         # MODO DE VISTA: 0 = Carátula, 1 = Texto Detallado (Estilo iPod Clásico)
         self.modo_vista = 0
@@ -49,6 +59,8 @@ class PantallaNowPlaying:
         # Fuente MUY pequeña para el chat (necesitamos que quepan cosas)
         # Si Chicago.ttf escala mal, usaremos SysFont
         self.font_chat = cargar_fuente(12)
+        # Panel del chat: buffer con scroll, cada mensaje se renderiza una vez
+        self.chat_overlay = ChatOverlay(self.font_chat, ANCHO, ALTO - ALTURA_HEADER)
 
     ##################################
     # FUNCIONES PARA CAMBIAR DE MODO #
@@ -57,26 +69,27 @@ class PantallaNowPlaying:
     def set_mode_spotify(self):
         self.chat.disconnect()
         self.source_mode = 'spotify'
-        self.theme_color = VERDE_SPOTIFY
+        self._cambiar_tema(VERDE_SPOTIFY)
+        self.instantanea = None # Volver a aplicar la última instantánea
         self.update() # Forzar actualización inmediata
     
-    def set_mode_twitch(self, channel_name, game_name, cover_bytes=None):
+    def set_mode_twitch(self, channel_name, game_name, cover_bytes=None, cover_url=None):
         self.chat.disconnect()
         self.source_mode = 'twitch'
-        self.theme_color = MORADO_TWITCH
+        self._cambiar_tema(MORADO_TWITCH)
         self.track = channel_name
         self.artist = "Live Stream"
         self.album = game_name if game_name else ""
         self.duration = 0
         self.progress = 0
         self.is_playing = True
-        self.cargar_caratula(data_bytes=cover_bytes)
+        self.cargar_caratula(url=cover_url, data_bytes=cover_bytes)
         self.chat.connect(channel_name)
 
     def set_mode_radio(self, station_name):
         self.chat.disconnect()
         self.source_mode = 'radio'
-        self.theme_color = NARANJA_RADIO
+        self._cambiar_tema(NARANJA_RADIO)
         self.track = station_name
         self.artist = "Live Radio"
         self.album = "FM Stream"
@@ -85,17 +98,23 @@ class PantallaNowPlaying:
         self.is_playing = True
         self.cover_img = None # O podrías poner un icono de radio
     
-    def set_mode_local(self, titulo, artista, album, cover_bytes=None):
+    def set_mode_local(self, titulo, artista, album, cover_bytes=None, cover_clave=None, cover_cargar=None):
         self.chat.disconnect()
         self.source_mode = 'local'
-        self.theme_color = AZUL_LOCAL
+        self._cambiar_tema(AZUL_LOCAL)
         self.track = titulo
         self.artist = artista
         self.album = album
         self.duration = 0 # VLC no siempre da la duración fácil, por ahora 0
         self.progress = 0
         self.is_playing = True
-        self.cargar_caratula(data_bytes=cover_bytes)
+        self.cargar_caratula(data_bytes=cover_bytes, clave=cover_clave, cargar=cover_cargar)
+    
+    def _cambiar_tema(self, color_tema):
+        """Cambia el color del tema. La carátula indexada solo cambia de paleta."""
+        self.theme_color = color_tema
+        if self.cover_img:
+            aplicar_paleta(self.cover_img, color_tema)
     
     def cambiar_vista(self):
         """Alterna entre ver la carátula o ver el texto detallado"""
@@ -109,68 +128,109 @@ class PantallaNowPlaying:
 
         if self.source_mode != 'spotify': return
 
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_update > self.update_interval:
-            self.last_update = current_time
-            try:
-                pb = self.sp.current_playback(additional_types='track,episode')
-                if pb and pb.get('item'):
-                    item = pb['item']
-                    self.is_playing = pb['is_playing']
-                    self.progress = pb['progress_ms']
-                    self.duration = item['duration_ms']
-                    
-                    item_type = item.get('type') # track/episode
-
-                    if item_type == 'track':
-
-                        self.track = item['name']
-                        self.artist = item['artists'][0]['name']
-                        self.album = item['album']['name']
-                        self.track_no = item['track_number']
-                        self.total_tracks = item['album']['total_tracks']
-                        images = item['album']['images']
-                        
-                    elif item_type == 'episode':
-                        self.track = item['name']
-                        self.artist = item['show']['publisher']
-                        self.album = item['show']['name']
-                        images = item['images'] # A veces están en el root del item
-                        if not images:
-                            images = item['show']['images'] # A veces en el show
-                        
-                        self.track_no = 0 # No suelen tener número de pista fiable
-                        self.total_tracks = 0
-                    
-                    # Carátula (Solo descargamos si cambia)
-                    url = images[0]['url'] if images else None
-                    if url and url != self.cover_url:
-                        self.cover_url = url
-                        self.cargar_caratula(url=url)
-                else:
-                    self.is_playing = False
-                    
-            except Exception as e:
-                print(f"Error update: {e}")
+        # El sondeo lo hace ServicioReproduccion en segundo plano:
+        # aquí solo leemos la última instantánea (nunca bloquea)
+        reproduccion.pedir_detalle()
+        inst = reproduccion.instantanea_actual() # Al acabar la pista, ya la siguiente de la cola
+
+        # El progreso se interpola en cada frame entre sondeo y sondeo
+        self.progress = reproduccion.progreso_estimado()
+
+        if inst is self.instantanea:
+            return
+        self.instantanea = inst
+
+        if not inst.item_id:
+            self.is_playing = False
+            return
 
-    def cargar_caratula(self, url=None, data_bytes=None):
+        self.is_playing = inst.is_playing
+        self.duration = inst.duracion_ms
+        self.track = inst.titulo
+        self.artist = inst.artista
+        self.album = inst.album
+        self.track_no = inst.track_no
+        self.total_tracks = inst.total_tracks
+
+        # Carátula (Solo descargamos si cambia)
+        url = inst.cover_url
+        if url and url != self.cover_url:
+            self.cover_url = url
+            self.cargar_caratula(url=url)
+
+    def proximo_despertar(self):
+        """Instante (ms) en que el bucle principal debe despertar para esta pantalla."""
+        # Twitch/Radio/Local: solo cambian por eventos (chat, carátula...)
+        # Spotify: cada instantánea nueva ya despierta al bucle (solicitar_redibujo);
+        # mientras suena, además, cuando la barra interpolada cambie de segundo o de píxel
+        if self.source_mode != 'spotify' or not self.is_playing or self.duration <= 0:
+            return None
+        progreso = reproduccion.progreso_estimado()
+        if progreso >= self.duration:
+            # Si se conoce la siguiente pista se cambia a ella en cuanto toque;
+            # si no, esperamos al sondeo
+            hasta_siguiente = reproduccion.ms_hasta_siguiente()
+            if hasta_siguiente is None:
+                return None
+            return pygame.time.get_ticks() + max(1, hasta_siguiente)
+        hasta_segundo = 1000 - progreso % 1000
+        pixel = int(ANCHO_BARRA_PROGRESO * progreso / self.duration) + 1
+        hasta_pixel = -(-pixel * self.duration // ANCHO_BARRA_PROGRESO) - progreso # División hacia arriba
+        return pygame.time.get_ticks() + max(1, min(hasta_segundo, hasta_pixel))
+
+    def cargar_caratula(self, url=None, data_bytes=None, clave=None, cargar=None):
         """
         Método inteligente:
+        - Primero mira la caché de carátulas (memoria o disco): si está, se
+          muestra en el siguiente frame sin red ni dithering.
         - Si recibe data_bytes: Procesa al instante (Local/Twitch).
-        - Si recibe url: Lanza un hilo para no bloquear (Spotify).
+        - Si recibe url: Lanza un hilo para no bloquear (Spotify/Twitch).
+        - Si recibe cargar: igual, pero los bytes los da cargar() (Local).
+        'clave' permite identificar la carátula (ej: por álbum); si no, se usa
+        la URL o el hash de los bytes.
         """
+        if clave is None:
+            if data_bytes:
+                clave = cache_caratulas.clave_bytes(data_bytes)
+            elif url:
+                clave = cache_caratulas.clave_url(url)
+        misma = clave is not None and clave == self.cover_clave and self.cover_img is not None
+        self.cover_clave = clave
+
+        # CASO 0: Ya procesada antes
+        if clave:
+            niveles = cache_caratulas.obtener(clave)
+            if niveles is not None:
+                # Si es la que ya se ve (ej: otra pista del mismo álbum) se reutiliza;
+                # si la caché la ha cambiado (carátula nueva), se vuelve a crear
+                if not (misma and niveles is self.cover_niveles):
+                    self.cover_img = crear_caratula_indexada(niveles, self.theme_color)
+                    self.cover_niveles = niveles
+                return
+
         # CASO 1: Bytes directos (Local o Twitch pre-descargado)
         if data_bytes:
-            self._procesar_bytes_imagen(data_bytes)
+            self._procesar_bytes_imagen(data_bytes, clave)
             return
 
-        # CASO 2: URL (Spotify) -> Threading
-        if url:
+        # CASO 2: URL (Spotify/Twitch) o archivo local -> Threading
+        if url or cargar:
+            if cargar and not misma:
+                # Local: mientras se lee, nada de la carátula del álbum anterior
+                self.cover_img = None
+                self.cover_niveles = None
+
             def _thread_download():
                 # Usamos la función de utils que ya tienes
-                bytes_descargados = descargar_imagen_url(url)
+                bytes_descargados = cargar() if cargar else descargar_imagen_url(url)
                 if bytes_descargados:
-                    self._procesar_bytes_imagen(bytes_descargados)
+                    self._procesar_bytes_imagen(bytes_descargados, clave)
+                    solicitar_redibujo() # Despertar al bucle para mostrarla
+                elif clave == self.cover_clave:
+                    # Sin carátula (ej: álbum local sin imagen): hueco vacío, no la anterior
+                    self.cover_img = None
+                    self.cover_niveles = None
+                    solicitar_redibujo()
             
             threading.Thread(target=_thread_download, daemon=True).start()
             return
@@ -178,14 +238,24 @@ class PantallaNowPlaying:
         # CASO 3: Nada
         self.cover_img = None
 
-    def _procesar_bytes_imagen(self, data):
-        """Convierte bytes -> Imagen Pygame -> Filtro Retro"""
+    def _procesar_bytes_imagen(self, data, clave=None):
+        """Convierte bytes -> Imagen Pygame -> Filtro Retro (y lo guarda en caché)"""
         if not data: 
             self.cover_img = None
             return
         try:
-            img = pygame.image.load(io.BytesIO(data))
-            self.cover_img = procesar_caratula_retro(img, color_tema=self.theme_color)
+            img = cargar_imagen_reducida(data) # JPEG: decodificado ya reducido
+            niveles = procesar_niveles_caratula(img)
+            if clave:
+                cache_caratulas.guardar(clave, niveles)
+
+            # Si mientras tanto se ha pedido otra carátula, esta ya no se muestra
+            if clave != self.cover_clave:
+                return
+            # Guardamos los niveles (0-3) en una Surface de 8 bits con paleta:
+            # al cambiar de tema solo se cambia la paleta, sin repetir el dithering
+            self.cover_img = crear_caratula_indexada(niveles, self.theme_color)
+            self.cover_niveles = niveles
         except Exception as e:
             print(f"Error procesando imagen: {e}")
             self.cover_img = None
@@ -202,11 +272,20 @@ class PantallaNowPlaying:
         x_pos = (ANCHO - ancho_barra) // 2
         # Rectángulo total que ocupará la barra
         rect_contenedor = (x_pos, y_pos, ancho_barra, altura_barra)
+
+        # Solo repintamos si cambia el relleno o alguno de los tiempos (1 vez por segundo)
+        ancho_relleno = 0
+        if self.duration > 0 and self.progress > 0:
+            ancho_relleno = int(ancho_barra * self.progress / self.duration)
+        txt_actual = formato_tiempo(self.progress)
+        txt_restante = "-" + formato_tiempo(self.duration - self.progress)
+        rect_zona = pygame.Rect(x_pos, y_pos, ancho_barra, ALTO - y_pos)
+        if not danos.region('progreso', (ancho_relleno, txt_actual, txt_restante), rect_zona):
+            return
+        pantalla.fill(NEGRO, rect_zona)
         
         # --- 1. DIBUJAR EL RELLENO (Primero, y cuadrado) ---
-        if self.duration > 0 and self.progress > 0:
-            pct = self.progress / self.duration
-            ancho_relleno = int(ancho_barra * pct)
+        if ancho_relleno > 0:
             
             # Para que quede perfecto, el relleno rectangular debe dibujarse 
             # ligeramente por dentro del outline.
@@ -232,26 +311,26 @@ class PantallaNowPlaying:
         alineado_y = 15 # Un poco más abajo de la barra
         
         # Tiempo actual
-        txt_actual = formato_tiempo(self.progress)
-        s_actual = self.font_big.render(txt_actual, ANTIALIASING, self.theme_color)
+        s_actual = renderizar_texto(self.font_big, txt_actual, self.theme_color)
         pantalla.blit(s_actual, (x_pos, y_pos + alineado_y))
         
         # Tiempo restante
-        restante = self.duration - self.progress
-        txt_restante = "-" + formato_tiempo(restante)
-        s_restante = self.font_big.render(txt_restante, ANTIALIASING, self.theme_color)
+        s_restante = renderizar_texto(self.font_big, txt_restante, self.theme_color)
         pantalla.blit(s_restante, (x_pos + ancho_barra - s_restante.get_width(), y_pos + alineado_y))
 
     def dibujar(self, pantalla, estado_play):
         self.update()
-        pantalla.fill(NEGRO)
+
+        # Si cambia la vista, la fuente o el tema, se limpia y repinta todo.
+        # Si no, solo se repintan las zonas que cambian (carátula, textos, barra...)
+        danos.disposicion(pantalla, (self.modo_vista, self.source_mode, self.show_chat, self.theme_color))
         
         # Título Contexto (Header)
         # En el iPod original solía poner el nombre del Album o "Now Playing"
         # Usaremos el nombre del Álbum si cabe, o "Now Playing"
         #titulo_header = self.album if len(self.album) < 20 else "Now Playing"
         titulo_header = "Now Playing"
-        dibujar_header(pantalla, titulo_header, self.is_playing, self.theme_color)
+        actualizar_header(pantalla, titulo_header, self.is_playing, self.theme_color)
 
         # --- VISTA 0: CARÁTULA (Tu diseño anterior) ---
         if self.modo_vista == 0:
@@ -261,30 +340,48 @@ class PantallaNowPlaying:
                 y_inicio = ALTURA_HEADER 
                 alto_chat = ALTO - ALTURA_HEADER
                 
-                # Llamamos a dibujar chat ocupando todo el resto de la pantalla
-                self._dibujar_chat(pantalla, 0, y_inicio, ANCHO, alto_chat)
+                # Los mensajes nuevos se maquetan una sola vez al llegar (ChatOverlay)
+                self.chat_overlay.actualizar(self.chat)
+
+                # Solo repintamos el chat cuando llega un mensaje nuevo
+                # (dejamos fuera la línea del header, que ocupa 2px)
+                rect_chat = pygame.Rect(0, y_inicio + 2, ANCHO, alto_chat - 2)
+                if danos.region('chat', (self.chat_overlay.sesion, self.chat_overlay.ultimo_id), rect_chat):
+                    pantalla.set_clip(rect_chat)
+                    # El panel ocupa todo el resto de la pantalla: un único blit
+                    self.chat_overlay.dibujar(pantalla, 0, y_inicio)
+                    pantalla.set_clip(None)
                 
                 # IMPORTANTE: Hacemos return aquí para que NO dibuje nada más
                 # (ni carátula, ni títulos, ni barras de progreso)
                 return
 
-            if self.source_mode == 'radio':
-                self._dibujar_radio_placeholder(pantalla, 75, 120)
-                pygame.draw.rect(pantalla, GRIS_PIXEL, (10, 58, 128, 128), 1)
+            # Carátula (la Surface cambia de objeto cada vez que llega una nueva)
+            rect_caratula = pygame.Rect(10, 58, 128, 128)
+            firma_caratula = 'radio' if self.source_mode == 'radio' else id(self.cover_img)
+            if danos.region('caratula', firma_caratula, rect_caratula):
+                pantalla.fill(NEGRO, rect_caratula)
 
-            elif self.cover_img:
-                pantalla.blit(self.cover_img, (10, 58))
-                pygame.draw.rect(pantalla, self.theme_color, (10, 58, 128, 128), 1)
-            else:
-                pygame.draw.rect(pantalla, GRIS_PIXEL, (10, 58, 128, 128), 1)
+                if self.source_mode == 'radio':
+                    self._dibujar_radio_placeholder(pantalla, 75, 120)
+                    pygame.draw.rect(pantalla, GRIS_PIXEL, rect_caratula, 1)
+
+                elif self.cover_img:
+                    pantalla.blit(self.cover_img, (10, 58))
+                    pygame.draw.rect(pantalla, self.theme_color, rect_caratula, 1)
+                else:
+                    pygame.draw.rect(pantalla, GRIS_PIXEL, rect_caratula, 1)
             
             # Textos laterales
             t_track = truncar_texto(self.track, 13)
             t_artist = truncar_texto(self.artist, 13)
             t_album = truncar_texto(self.album, 13)
-            pantalla.blit(self.font_big.render(t_track, ANTIALIASING, self.theme_color), (150, 75))
-            pantalla.blit(self.font_big.render(t_artist, ANTIALIASING, self.theme_color), (150, 75 + 32))
-            pantalla.blit(self.font_big.render(t_album, ANTIALIASING, self.theme_color), (150, 75 + 32 + 32))
+            rect_textos = pygame.Rect(150, 75, ANCHO - 150, 32 * 3)
+            if danos.region('textos', (t_track, t_artist, t_album), rect_textos):
+                pantalla.fill(NEGRO, rect_textos)
+                pantalla.blit(renderizar_texto(self.font_big, t_track, self.theme_color), (150, 75))
+                pantalla.blit(renderizar_texto(self.font_big, t_artist, self.theme_color), (150, 75 + 32))
+                pantalla.blit(renderizar_texto(self.font_big, t_album, self.theme_color), (150, 75 + 32 + 32))
             
             # Barra simple
             """
@@ -311,34 +408,48 @@ class PantallaNowPlaying:
             # Limite caracteres más estricto por ser fuente grande
             limite_chars = 24
             
-            # Título (Grande y Brillante)
             lbl_title = truncar_texto(self.track, limite_chars) # Un poco más de margen al no haber foto
-            s_title = self.font_big.render(lbl_title, ANTIALIASING, self.theme_color)
-            r_title = s_title.get_rect(center=(center_x, y_cancion))
-            pantalla.blit(s_title, r_title)
-            
-            # Artista (Pequeño)
             lbl_artist = truncar_texto(self.artist, limite_chars)
-            s_artist = self.font_big.render(lbl_artist, ANTIALIASING, self.theme_color)
-            r_artist = s_artist.get_rect(center=(center_x, y_artista))
-            pantalla.blit(s_artist, r_artist)
-            
-            # Álbum (Pequeño)
             lbl_album = truncar_texto(self.album, limite_chars)
-            s_album = self.font_big.render(lbl_album, ANTIALIASING, self.theme_color) # Gris para diferenciar
-            r_album = s_album.get_rect(center=(center_x, y_album))
-            pantalla.blit(s_album, r_album)
+
+            rect_textos = pygame.Rect(0, 62, ANCHO, 100)
+            if danos.region('textos', (lbl_title, lbl_artist, lbl_album), rect_textos):
+                pantalla.fill(NEGRO, rect_textos)
+                self._dibujar_textos_centrados(pantalla, center_x, (y_cancion, y_artista, y_album), (lbl_title, lbl_artist, lbl_album))
         
         # Contador de Pista (Esquina superior izquierda)
         # "1 of 53"
         txt_counter = f"{self.track_no} of {self.total_tracks}"
-        s_counter = self.font_small.render(txt_counter, ANTIALIASING, self.theme_color)
-        pantalla.blit(s_counter, (10, ALTURA_HEADER + 10))
+        rect_counter = pygame.Rect(0, ALTURA_HEADER + 2, 150, 26)
+        if danos.region('contador', txt_counter, rect_counter):
+            pantalla.fill(NEGRO, rect_counter)
+            s_counter = renderizar_texto(self.font_small, txt_counter, self.theme_color)
+            pantalla.blit(s_counter, (10, ALTURA_HEADER + 10))
 
         # Barra de Progreso y Tiempos
         # La ponemos abajo, estilo iPod classic
         if self.source_mode == 'spotify':
-            self.dibujar_barra_progreso(pantalla, y_pos=195, ancho_barra=290)
+            self.dibujar_barra_progreso(pantalla, y_pos=195, ancho_barra=ANCHO_BARRA_PROGRESO)
+
+    def _dibujar_textos_centrados(self, pantalla, center_x, alturas, textos):
+        """Vista 1: Título, Artista y Álbum centrados"""
+        lbl_title, lbl_artist, lbl_album = textos
+        y_cancion, y_artista, y_album = alturas
+
+        # Título (Grande y Brillante)
+        s_title = renderizar_texto(self.font_big, lbl_title, self.theme_color)
+        r_title = s_title.get_rect(center=(center_x, y_cancion))
+        pantalla.blit(s_title, r_title)
+        
+        # Artista (Pequeño)
+        s_artist = renderizar_texto(self.font_big, lbl_artist, self.theme_color)
+        r_artist = s_artist.get_rect(center=(center_x, y_artista))
+        pantalla.blit(s_artist, r_artist)
+        
+        # Álbum (Pequeño)
+        s_album = renderizar_texto(self.font_big, lbl_album, self.theme_color) # Gris para diferenciar
+        r_album = s_album.get_rect(center=(center_x, y_album))
+        pantalla.blit(s_album, r_album)
     
     def _dibujar_radio_placeholder(self, pantalla, x, y):
         """Dibuja un icono de radio retro procedimentalmente"""
@@ -364,140 +475,3 @@ class PantallaNowPlaying:
         pygame.draw.rect(pantalla, self.theme_color, (rect_body.left + 60, rect_body.top + 10, 30, 40), 1)
         # Linea dial
         pygame.draw.line(pantalla, ROJO_ERROR, (rect_body.left + 60, rect_body.top + 25), (rect_body.left + 89, rect_body.top + 25), 2)
-    
-    def _dibujar_chat2(self, pantalla, x, y, w, h):
-        """Dibuja el overlay del chat"""
-        # 1. Fondo semitransparente (Negro al 70%)
-        #s = pygame.Surface((w, h))
-        #s.set_alpha(180) 
-        #s.fill((0,0,0))
-        #pantalla.blit(s, (x, y))
-        
-        # 2. Obtener mensajes
-        msgs = self.chat.get_messages()
-        
-        line_height = 12 # Altura de cada línea de texto
-        margen_izq = 5
-        start_y = y + h - (len(msgs) * line_height) - 5 # Empezar desde abajo
-        
-        for msg in msgs:
-            # Formato: "User: Mensaje"
-            
-            # Dibujar Usuario (en color del tema o negrita)
-            user_surf = self.font_chat.render(f"{msg['user']}: ", True, self.theme_color)
-            pantalla.blit(user_surf, (x + margen_izq, start_y))
-            
-            # Dibujar Mensaje (Blanco)
-            # Calculamos offset X para que el mensaje empiece después del usuario
-            user_width = user_surf.get_width()
-            
-            # Truncamos mensaje si es muy largo para que no se salga
-            # (Una solución simple, lo ideal sería word-wrap pero es costoso)
-            chars_max = int((w - user_width - 10) / 6) 
-            msg_clean = truncar_texto(msg['text'], chars_max)
-
-            msg_surf = self.font_chat.render(msg_clean, True, (255, 255, 255))
-            pantalla.blit(msg_surf, (x + margen_izq + user_width, start_y))
-            
-            start_y += line_height
-    
-    # En now_playing.py
-
-    def _dibujar_chat(self, pantalla, x, y, w, h):
-        msgs = self.chat.get_messages()
-        
-        line_height = 12 # Altura por línea de texto
-        margen_izq = 6
-        ancho_util = w - (margen_izq * 2) # Margen a ambos lados
-        
-        # Empezamos a dibujar desde abajo del todo
-        current_y = y + h - line_height - 5
-        
-        # Recorremos mensajes del más NUEVO al más VIEJO (reversed)
-        for msg in reversed(msgs):
-            if current_y < y: break # Si nos salimos por arriba, paramos
-            
-            # 1. Preparar Usuario
-            user_str = f"{msg['user']}: "
-            user_surf = self.font_chat.render(user_str, True, msg['color']) # Usamos el color guardado
-            user_width = user_surf.get_width()
-            
-            # 2. Calcular espacio restante en la primera línea para el texto
-            ancho_para_texto_linea1 = ancho_util - user_width
-            
-            # 3. Dividir el mensaje en líneas
-            # OJO: La primera línea tiene menos espacio porque está el usuario
-            # Las siguientes líneas tienen todo el ancho
-            
-            todas_las_lineas = []
-            palabras = msg['text'].split(' ')
-            linea_actual = []
-            es_primera_linea = True
-            
-            for palabra in palabras:
-                ancho_limite = ancho_para_texto_linea1 if es_primera_linea else ancho_util
-                prueba = ' '.join(linea_actual + [palabra])
-                
-                if self.font_chat.size(prueba)[0] <= ancho_limite:
-                    linea_actual.append(palabra)
-                else:
-                    todas_las_lineas.append(' '.join(linea_actual))
-                    linea_actual = [palabra]
-                    es_primera_linea = False # A partir de aquí tenemos todo el ancho
-            
-            if linea_actual:
-                todas_las_lineas.append(' '.join(linea_actual))
-            
-            # 4. Dibujar de abajo a arriba
-            # Invertimos las líneas del mensaje para dibujar primero la última parte (que va más abajo)
-            for i, linea_txt in enumerate(reversed(todas_las_lineas)):
-                if current_y < y: break
-                
-                txt_surf = self.font_chat.render(linea_txt, True, (255, 255, 255))
-                
-                # Si es la primera línea del mensaje (que aquí es la última en procesarse por el reversed)
-                # Dibujamos usuario + texto
-                if i == len(todas_las_lineas) - 1:
-                    pantalla.blit(user_surf, (x + margen_izq, current_y))
-                    pantalla.blit(txt_surf, (x + margen_izq + user_width, current_y))
-                else:
-                    # Es una línea de continuación -> Dibujamos con un pequeño sangrado
-                    pantalla.blit(txt_surf, (x + margen_izq, current_y))
-                
-                current_y -= line_height # Subimos una línea
-            
-            # Un pequeño espacio extra entre mensajes distintos
-            current_y -= 4
-
-    def _dividir_texto_en_lineas(self, texto, fuente, max_ancho):
-        """
-        Divide un texto en varias líneas para que quepan en max_ancho.
-        Devuelve una lista de strings.
-        """
-        palabras = texto.split(' ')
-        lineas = []
-        linea_actual = []
-        
-        for palabra in palabras:
-            # Probamos a añadir la palabra a la línea actual
-            linea_test = ' '.join(linea_actual + [palabra])
-            ancho_test = fuente.size(linea_test)[0]
-            
-            if ancho_test <= max_ancho:
-                linea_actual.append(palabra)
-            else:
-                # Si la línea ya tenía algo, la guardamos y empezamos nueva
-                if linea_actual:
-                    lineas.append(' '.join(linea_actual))
-                    linea_actual = [palabra]
-                else:
-                    # Si la palabra sola ya es más ancha que la pantalla (muy raro),
-                    # la metemos igual para no perderla (o la cortaríamos)
-                    lineas.append(palabra)
-                    linea_actual = []
-        
-        # Añadir la última línea pendiente
-        if linea_actual:
-            lineas.append(' '.join(linea_actual))
-            
-        return lineas
\ No newline at end of file
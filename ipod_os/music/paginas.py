@@ -0,0 +1,106 @@
+from config import *
+from utils import elegir_url_imagen
+
+# Descarga de páginas de los menús de Spotify.
+# Lo usan los menús paginados (music/menu_principal.py) y la precarga
+# (music/prefetch.py): se piden páginas de TAMANO_PAGINA elementos.
+
+TIPOS_PAGINADOS = ('artistas', 'albums', 'playlists', 'new_releases', 'artist_albums',
+                   'album_tracks', 'playlist_tracks', 'shows', 'show_episodes')
+
+def _url_imagen(objeto):
+    """URL de la carátula tal y como la elige Now Playing (misma clave en la caché)."""
+    return elegir_url_imagen((objeto or {}).get('images'))
+
+def descargar_pagina(sp, tipo, id_padre, offset=0, cursor=None):
+    """
+    Descarga una página de un menú paginado (bloqueante: se llama desde el pool).
+    Devuelve (opciones, total en el servidor, cursor de la página siguiente).
+    Los artistas seguidos van por cursor ('after'); el resto por offset.
+    """
+    limite = TAMANO_PAGINA
+    siguiente = None
+
+    # --- FAV ARTISTS ---
+    if tipo == 'artistas':
+        print(f"Descargando artistas (después de {cursor})...")
+        res = sp.current_user_followed_artists(limit=limite, after=cursor)['artists']
+        nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'artist'} for i in res['items']]
+        siguiente = (res.get('cursors') or {}).get('after')
+
+    # --- FAV ALBUMS ---
+    elif tipo == 'albums':
+        print(f"Descargando albumes guardados ({offset})...")
+        res = sp.current_user_saved_albums(limit=limite, offset=offset)
+        # OJO: Aqui la estructura es item['album']['name']
+        nuevas = [{'nombre': i['album']['name'], 'uri': i['album']['uri'], 'type': 'album', 'imagen': _url_imagen(i['album'])} for i in res['items']]
+
+    # --- MY PLAYLISTS ---
+    elif tipo == 'playlists':
+        print(f"Descargando playlists ({offset})...")
+        res = sp.current_user_playlists(limit=limite, offset=offset)
+        # snapshot_id: cambia con cada edición de la playlist (invalida su caché)
+        nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'playlist', 'snapshot_id': i.get('snapshot_id')} for i in res['items']]
+
+    # --- NEW RELEASES ---
+    elif tipo == 'new_releases':
+        print(f"Descargando novedades ({offset})...")
+        # Aqui la estructura es res['albums']['items']
+        res = sp.new_releases(limit=limite, offset=offset)['albums']
+        nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'album', 'imagen': _url_imagen(i)} for i in res['items']]
+
+    # --- ALBUMS (ARTIST) ---
+    elif tipo == 'artist_albums':
+        print(f"Cargando albumes del artista {id_padre} ({offset})...")
+        # include_groups='album,single' para filtrar un poco
+        res = sp.artist_albums(id_padre, limit=limite, offset=offset, country="ES", include_groups='album,single')
+        nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'album', 'imagen': _url_imagen(i)} for i in res['items']]
+
+    # --- SONGS (ALBUM) ---
+    elif tipo == 'album_tracks':
+        print(f"Cargando canciones del album {id_padre} ({offset})...")
+        res = sp.album_tracks(id_padre, limit=limite, offset=offset)
+        # Las canciones son 'track', listas para reproducir
+        nuevas = [{'nombre': i['name'], 'uri': i['uri'], 'type': 'track'} for i in res['items']]
+
+    # --- SONGS (PLAYLIST) ---
+    elif tipo == 'playlist_tracks':
+        print(f"Cargando canciones de playlist {id_padre} ({offset})...")
+        res = sp.playlist_items(id_padre, limit=limite, offset=offset)
+        # En playlist, la cancion esta dentro de 'track'
+        nuevas = []
+        for item in res['items']:
+            if item.get('track'): # Verificacion de seguridad # A veces hay items vacios
+                t = item['track']
+                nuevas.append({'nombre': t['name'], 'uri': t['uri'], 'type': 'track', 'imagen': _url_imagen(t.get('album'))})
+            else:
+                # Mantenemos el hueco para que las posiciones cuadren con el total
+                nuevas.append({'nombre': "(unavailable)", 'type': 'info_static'})
+
+    # --- SHOWS ---
+    elif tipo == 'shows':
+        print(f"Descargando shows ({offset})...")
+        res = sp.current_user_saved_shows(limit=limite, offset=offset)
+        nuevas = []
+        for item in res['items']:
+            show_obj = item['show']
+            nuevas.append({'nombre': show_obj['name'], 'uri': show_obj['uri'], 'id': show_obj['id'], 'type': 'show'})
+
+    # --- EPISODES ---
+    elif tipo == 'show_episodes':
+        print(f"Cargando episodios del show {id_padre} ({offset})...")
+        # id_padre aquí será el ID del show
+        res = sp.show_episodes(show_id=id_padre, limit=limite, offset=offset)
+        nuevas = []
+        for episode in res['items']:
+            nuevas.append({
+                'type': 'episode',    # Etiqueta para reproducir
+                'nombre': episode['name'], 
+                'uri': episode['uri'],
+                'subtype': 'podcast'
+            })
+
+    else:
+        raise ValueError(f"Tipo de menú no paginado: {tipo}")
+
+    return nuevas, res.get('total') or len(nuevas), siguiente
@@ -0,0 +1,460 @@
+import time
+import threading
+from collections import namedtuple
+from config import *
+from scheduler import solicitar_redibujo
+from utils import elegir_url_imagen
+from api_scheduler import planificador_api, INTERACTIVA, FONDO
+
+# Estado de reproducción de Spotify, compartido por toda la app.
+# Un único hilo en segundo plano hace sp.current_playback() y publica una
+# instantánea inmutable. El bucle principal y Now Playing solo leen
+# 'reproduccion.instantanea' (una asignación de atributo, no bloquea nunca).
+#
+# Ritmo de sondeo adaptativo:
+#   - Rápido justo después de un comando del usuario (play, shuffle...)
+#   - Normal mientras suena (más rápido si Now Playing está en pantalla)
+#   - Un sondeo extra justo cuando debería acabar la pista
+#   - Lento en pausa o sin dispositivo activo
+#
+# Entre sondeos el progreso se interpola con el reloj monotónico
+# (progreso_estimado). Cada sondeo resincroniza: si la diferencia es pequeña
+# se corrige poco a poco (la barra no da saltos), si es grande (seek, otra
+# pista) se aplica de golpe. El error de la interpolación frente a cada
+# sondeo se acumula en estadisticas_interpolacion() para ajustar el intervalo.
+#
+# Si el propio Pi es el dispositivo (Raspotify), los eventos de librespot
+# (music/librespot_events.py) llegan por aplicar_evento() y mandan sobre la
+# Web API: el sondeo pasa a INTERVALO_SONDEO_EVENTOS_MS y solo rellena los
+# metadatos que el evento no trae (carátula, contexto...).
+
+InstantaneaReproduccion = namedtuple('InstantaneaReproduccion', [
+    'valida',       # False si nunca se ha podido leer el estado
+    'is_playing',
+    'item_id',      # URI de la pista/episodio (None si no hay nada sonando)
+    'tipo',         # 'track' / 'episode'
+    'titulo',
+    'artista',
+    'album',
+    'track_no',
+    'total_tracks',
+    'duracion_ms',
+    'progreso_ms',
+    'cover_url',
+    'shuffle',
+    'dispositivo',  # Nombre del dispositivo activo
+    'contexto',     # URI del álbum/playlist que se está reproduciendo
+    'instante',     # time.monotonic() en el que se recibió la respuesta
+])
+
+SIN_DATOS = InstantaneaReproduccion(False, False, None, None, "", "", "", 0, 0, 0, 0, None, False, None, None, 0.0)
+
+def instantanea_de_item(item):
+    """Datos de una pista/episodio (sin estado de reproducción). También para la cola."""
+    item_type = item.get('type') # track/episode
+    if item_type == 'episode':
+        artista = item['show']['publisher']
+        album = item['show']['name']
+        images = item['images'] # A veces están en el root del item
+        if not images:
+            images = item['show']['images'] # A veces en el show
+        track_no = 0 # No suelen tener número de pista fiable
+        total_tracks = 0
+    else:
+        artista = item['artists'][0]['name']
+        album = item['album']['name']
+        images = item['album']['images']
+        track_no = item['track_number']
+        total_tracks = item['album']['total_tracks']
+
+    return SIN_DATOS._replace(
+        valida=True,
+        item_id=item.get('uri'),
+        tipo=item_type,
+        titulo=item['name'],
+        artista=artista,
+        album=album,
+        track_no=track_no,
+        total_tracks=total_tracks,
+        duracion_ms=item['duration_ms'],
+        cover_url=elegir_url_imagen(images), # La más pequeña que sirva para el dithering
+    )
+
+def _instantanea_desde(pb, instante):
+    """Convierte la respuesta de current_playback() en una instantánea."""
+    if not pb:
+        return SIN_DATOS._replace(valida=True, instante=instante)
+
+    dispositivo = (pb.get('device') or {}).get('name')
+    item = pb.get('item')
+    if not item:
+        return SIN_DATOS._replace(valida=True, is_playing=pb.get('is_playing', False),
+                                  shuffle=pb.get('shuffle_state', False),
+                                  dispositivo=dispositivo, instante=instante)
+
+    return instantanea_de_item(item)._replace(
+        is_playing=pb['is_playing'],
+        progreso_ms=pb['progress_ms'] or 0,
+        shuffle=pb.get('shuffle_state', False),
+        dispositivo=dispositivo,
+        contexto=(pb.get('context') or {}).get('uri'),
+        instante=instante,
+    )
+
+# Eventos de librespot (variable PLAYER_EVENT del hook 'onevent')
+EVENTOS_PISTA = ('changed', 'track_changed', 'loading', 'started', 'playing', 'paused')
+EVENTOS_POSICION = ('playing', 'paused', 'seeked', 'position_correction', 'loading', 'stopped')
+EVENTOS_FIN_SESION = ('session_disconnected', 'unavailable')
+
+def _tipo_de_evento(evento):
+    """
+    'track' / 'episode' según ITEM_TYPE (librespot lo manda como 'Track'/'Episode').
+    Sin ITEM_TYPE (librespot antiguo, solo pistas): 'track'. Otro tipo: None.
+    """
+    tipo = (evento.get('ITEM_TYPE') or 'track').lower()
+    return tipo if tipo in ('track', 'episode') else None
+
+def _item_id_de_evento(evento):
+    """URI del ítem del evento. Sin URI, se monta desde TRACK_ID con el prefijo de su tipo."""
+    if evento.get('URI'):
+        return evento['URI']
+    tipo = _tipo_de_evento(evento)
+    if evento.get('TRACK_ID') and tipo:
+        return f"spotify:{tipo}:{evento['TRACK_ID']}"
+    return None
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+class ServicioReproduccion:
+    def __init__(self):
+        self.sp = None
+        self.instantanea = SIN_DATOS
+        self.hilo = None
+        self._despertar = threading.Event()
+        self._primera = threading.Event() # Ya hay una instantánea válida
+        self._comando_hasta = 0.0 # monotonic: hasta cuándo sondear rápido
+        self._detalle_hasta = 0.0 # monotonic: Now Playing visible hasta aquí
+
+        # Corrección de deriva pendiente: (ms, instante en que empezó)
+        # Se asigna como una tupla para que el hilo de dibujado la lea entera.
+        self._correccion = (0.0, 0.0)
+
+        # Próximas pistas (instantáneas sin progreso), las rellena PrecargadorCola.
+        # Al acabar la pista se muestra la siguiente sin esperar al sondeo.
+        self.cola = ()
+        self._prediccion = None # (real, siguiente, predicha)
+        self._oyentes = [] # Funciones a llamar cuando cambia la pista
+
+        # Eventos de librespot (sondeo y eventos publican desde hilos distintos)
+        self.lock = threading.Lock()
+        self.eventos_locales = False # True mientras el Pi sea el dispositivo
+        self._ultimo_evento = 0.0 # monotonic
+        self.volumen = None # 0-100, solo lo conocemos por los eventos
+        self.eventos = 0
+
+        self.sondeos = 0
+        self.errores = 0
+
+        # Error de la interpolación medido en cada sondeo (misma pista sonando)
+        self.muestras_error = 0
+        self.suma_error_ms = 0.0
+        self.max_error_ms = 0.0
+        self.ultimo_error_ms = 0.0
+
+    def iniciar(self, sp_client):
+        """Arranca el hilo de sondeo (una sola vez)."""
+        self.sp = sp_client
+        if self.hilo is None:
+            self.hilo = threading.Thread(target=self._bucle, daemon=True)
+            self.hilo.start()
+
+    def notificar_comando(self):
+        """Tras un comando del usuario: sondear ya y seguir rápido un rato."""
+        self._comando_hasta = time.monotonic() + VENTANA_COMANDO_MS / 1000.0
+        self._despertar.set()
+
+    def pedir_detalle(self):
+        """Now Playing está en pantalla: se sondea a INTERVALO_SONDEO_MS."""
+        ahora = time.monotonic()
+        if self._detalle_hasta < ahora:
+            self._despertar.set() # Al entrar en la pantalla, datos frescos
+        self._detalle_hasta = ahora + 2 * INTERVALO_SONDEO_MS / 1000.0
+
+    def esperar_instantanea(self, timeout):
+        """
+        Bloqueante (desde el pool): la instantánea actual, esperando como mucho
+        'timeout' segundos al primer sondeo si aún no ha llegado.
+        """
+        if not self.instantanea.valida:
+            self._despertar.set()
+            self._primera.wait(timeout)
+        return self.instantanea
+
+    def al_cambiar_pista(self, funcion):
+        """Registra funcion(instantanea), llamada desde el hilo de sondeo al cambiar de pista."""
+        self._oyentes.append(funcion)
+
+    def instantanea_actual(self):
+        """
+        La instantánea a mostrar. Si la pista ya debería haber acabado y se
+        conoce la siguiente de la cola, devuelve una predicción de esa pista
+        (empezando en el instante del cambio) hasta que el sondeo la confirme.
+        """
+        inst = self.instantanea
+        cola = self.cola
+        if not (inst.is_playing and inst.duracion_ms > 0 and cola):
+            return inst
+        fin = inst.instante + (inst.duracion_ms - inst.progreso_ms) / 1000.0
+        siguiente = cola[0]
+        if time.monotonic() < fin or siguiente.item_id == inst.item_id:
+            return inst
+
+        prediccion = self._prediccion
+        if prediccion and prediccion[0] is inst and prediccion[1] is siguiente:
+            return prediccion[2] # Mismo objeto: la pantalla no la aplica dos veces
+        predicha = siguiente._replace(is_playing=True, progreso_ms=0, shuffle=inst.shuffle,
+                                      dispositivo=inst.dispositivo, contexto=inst.contexto, instante=fin)
+        self._prediccion = (inst, siguiente, predicha)
+        return predicha
+
+    def ms_hasta_siguiente(self):
+        """Ms hasta que instantanea_actual() pase a la siguiente pista de la cola (None si no hay)."""
+        inst = self.instantanea
+        cola = self.cola
+        if not (inst.is_playing and inst.duracion_ms > 0 and cola) or cola[0].item_id == inst.item_id:
+            return None
+        fin = inst.instante + (inst.duracion_ms - inst.progreso_ms) / 1000.0
+        return max(0, int((fin - time.monotonic()) * 1000))
+
+    def progreso_estimado(self, ahora=None):
+        """
+        Progreso (ms) extrapolado desde la instantánea actual. No bloquea.
+        Sin pista siguiente conocida, se queda en la duración hasta que el sondeo la confirme.
+        """
+        inst = self.instantanea_actual()
+        correccion = self._correccion if inst is self.instantanea else (0.0, 0.0)
+        return self._estimar(inst, correccion, ahora)
+
+    @staticmethod
+    def _estimar(inst, correccion, ahora=None):
+        if not inst.is_playing:
+            return inst.progreso_ms
+        if ahora is None:
+            ahora = time.monotonic()
+        progreso = inst.progreso_ms + (ahora - inst.instante) * 1000.0
+
+        # La corrección se reparte linealmente en TIEMPO_CORRECCION_MS
+        correccion_ms, inicio = correccion
+        if correccion_ms:
+            resto = 1.0 - (ahora - inicio) * 1000.0 / TIEMPO_CORRECCION_MS
+            if resto > 0:
+                progreso += correccion_ms * resto
+
+        if inst.duracion_ms > 0:
+            progreso = min(progreso, inst.duracion_ms)
+        return max(int(progreso), 0)
+
+    def estadisticas_interpolacion(self):
+        """Error de la interpolación frente a los sondeos (para ajustar INTERVALO_SONDEO_MS)."""
+        return {
+            'muestras': self.muestras_error,
+            'error_medio_ms': self.suma_error_ms / self.muestras_error if self.muestras_error else 0.0,
+            'error_max_ms': self.max_error_ms,
+            'ultimo_error_ms': self.ultimo_error_ms,
+            'sondeos': self.sondeos,
+            'errores_api': self.errores,
+        }
+
+    def _intervalo(self):
+        """Segundos hasta el próximo sondeo."""
+        ahora = time.monotonic()
+        if ahora < self._comando_hasta:
+            return INTERVALO_SONDEO_RAPIDO_MS / 1000.0
+
+        if self.eventos_locales:
+            # Los cambios llegan por eventos: el sondeo es solo una red de seguridad
+            return INTERVALO_SONDEO_EVENTOS_MS / 1000.0
+
+        inst = self.instantanea
+        if not inst.is_playing:
+            return INTERVALO_SONDEO_PAUSA_MS / 1000.0
+
+        intervalo = INTERVALO_SONDEO_MS if ahora < self._detalle_hasta else INTERVALO_SONDEO_FONDO_MS
+        if inst.duracion_ms > 0:
+            # Sondeo extra justo cuando debería empezar la siguiente pista
+            restante = inst.duracion_ms - self._estimar(inst, self._correccion, ahora)
+            intervalo = min(intervalo, max(restante, 0) + MARGEN_FIN_PISTA_MS)
+        return intervalo / 1000.0
+
+    def _bucle(self):
+        while True:
+            self._sondear()
+            self._despertar.wait(self._intervalo())
+            self._despertar.clear()
+
+    def _sondear(self):
+        # Tras un comando del usuario el sondeo es interactivo; si no, de fondo
+        prioridad = INTERACTIVA if time.monotonic() < self._comando_hasta else FONDO
+        try:
+            with planificador_api.prioridad(prioridad):
+                pb = self.sp.current_playback(additional_types='track,episode')
+        except Exception as e:
+            # Sin internet, token caducado...: mantenemos el último estado conocido
+            self.errores += 1
+            print(f"Error sondeando reproducción: {e}")
+            return
+
+        nueva = _instantanea_desde(pb, time.monotonic())
+        with self.lock:
+            self.sondeos += 1
+            anterior = self.instantanea
+            if self.eventos_locales:
+                nueva = self._combinar(anterior, nueva)
+            self._publicar(anterior, nueva)
+        self._avisar(anterior, nueva)
+
+    def _publicar(self, anterior, nueva):
+        """Sustituye la instantánea (con self.lock tomado)."""
+        if nueva is anterior:
+            return
+        self._resincronizar(anterior, nueva)
+        self.instantanea = nueva
+        if nueva.valida:
+            self._primera.set()
+
+    def _avisar(self, anterior, nueva):
+        # Solo despertamos al bucle principal si cambia algo visible
+        if nueva._replace(instante=0.0) != anterior._replace(instante=0.0):
+            solicitar_redibujo()
+
+        if nueva.item_id and nueva.item_id != anterior.item_id:
+            for funcion in self._oyentes:
+                funcion(nueva)
+
+    def _combinar(self, anterior, nueva):
+        """Con eventos de librespot activos, el sondeo solo aporta metadatos."""
+        reciente = time.monotonic() - self._ultimo_evento < MARGEN_RETRASO_API_MS / 1000.0
+        otro_dispositivo = anterior.dispositivo and nueva.dispositivo != anterior.dispositivo
+        if nueva.item_id != anterior.item_id or otro_dispositivo:
+            if reciente:
+                return anterior # La Web API aún no se ha enterado del último evento
+            # Ya no suena en el Pi (o nos perdimos el evento): vuelve a mandar la Web API
+            self.eventos_locales = False
+            return nueva
+        return anterior._replace(
+            valida=True,
+            tipo=nueva.tipo,
+            titulo=nueva.titulo,
+            artista=nueva.artista,
+            album=nueva.album,
+            track_no=nueva.track_no,
+            total_tracks=nueva.total_tracks,
+            duracion_ms=nueva.duracion_ms or anterior.duracion_ms,
+            cover_url=nueva.cover_url,
+            shuffle=anterior.shuffle if reciente else nueva.shuffle,
+            dispositivo=nueva.dispositivo,
+            contexto=nueva.contexto,
+        )
+
+    def aplicar_evento(self, evento, antiguedad=0.0):
+        """
+        Aplica un evento 'onevent' de librespot (dict con sus variables de
+        entorno: PLAYER_EVENT, TRACK_ID, POSITION_MS...). 'antiguedad' son los
+        segundos desde que se emitió. Se llama desde el hilo de eventos.
+        """
+        tipo = evento.get('PLAYER_EVENT')
+        instante = time.monotonic() - max(antiguedad, 0.0)
+        posicion = _entero(evento.get('POSITION_MS'))
+        duracion = _entero(evento.get('DURATION_MS'))
+
+        with self.lock:
+            self.eventos += 1
+            anterior = self.instantanea
+            if tipo in EVENTOS_FIN_SESION:
+                # El Pi deja de ser el dispositivo: la Web API vuelve a mandar
+                self.eventos_locales = False
+                self._despertar.set()
+                return
+            self.eventos_locales = True
+            self._ultimo_evento = time.monotonic()
+
+            nueva = anterior
+            item_id = _item_id_de_evento(evento)
+            if tipo in EVENTOS_PISTA and item_id and item_id != anterior.item_id:
+                nueva = self._pista_de_evento(evento, item_id, anterior)._replace(instante=instante)
+                if not nueva.titulo or not nueva.cover_url:
+                    self._despertar.set() # Lo que falte lo rellena un sondeo
+
+            if tipo in ('playing', 'started'):
+                nueva = nueva._replace(is_playing=True)
+            elif tipo in ('paused', 'stopped', 'end_of_track'):
+                nueva = nueva._replace(is_playing=False)
+            elif tipo in ('volume_set', 'volume_changed'):
+                volumen = _entero(evento.get('VOLUME'))
+                if volumen is not None:
+                    self.volumen = volumen * 100 // 65535
+            elif tipo == 'shuffle_changed':
+                nueva = nueva._replace(shuffle=evento.get('SHUFFLE') == 'true')
+
+            if posicion is not None and tipo in EVENTOS_POSICION:
+                # Congelamos el progreso en el instante del evento (la interpolación sigue desde ahí)
+                nueva = nueva._replace(progreso_ms=posicion, instante=instante)
+            elif nueva.is_playing != anterior.is_playing and nueva.item_id == anterior.item_id:
+                # Sin posición: la calculamos con la interpolación hasta este instante
+                progreso = self._estimar(anterior, self._correccion, instante)
+                nueva = nueva._replace(progreso_ms=progreso, instante=instante)
+            if duracion:
+                nueva = nueva._replace(duracion_ms=duracion)
+
+            self._publicar(anterior, nueva)
+        self._avisar(anterior, nueva)
+
+    def _pista_de_evento(self, evento, item_id, anterior):
+        """Instantánea de la pista nueva: metadatos del evento, de la cola o vacíos."""
+        for siguiente in self.cola:
+            if siguiente.item_id == item_id:
+                base = siguiente # Ya la teníamos (con su carátula precargada)
+                break
+        else:
+            base = SIN_DATOS._replace(tipo=_tipo_de_evento(evento) or 'track')
+        if evento.get('NAME'):
+            base = base._replace(
+                titulo=evento['NAME'],
+                artista=evento.get('ARTISTS', '').split('\n')[0] or base.artista,
+                album=evento.get('ALBUM') or evento.get('SHOW_NAME') or base.album,
+                track_no=_entero(evento.get('NUMBER')) or base.track_no,
+            )
+        return base._replace(valida=True, item_id=item_id, is_playing=anterior.is_playing, progreso_ms=0,
+                             shuffle=anterior.shuffle, dispositivo=anterior.dispositivo, contexto=anterior.contexto)
+
+    def _resincronizar(self, anterior, nueva):
+        """Compara lo que se estaba mostrando con el progreso real y prepara la corrección."""
+        misma_pista = anterior.is_playing and nueva.is_playing and nueva.item_id and nueva.item_id == anterior.item_id
+        if not misma_pista:
+            self._correccion = (0.0, 0.0)
+            return
+
+        mostrado = self._estimar(anterior, self._correccion, nueva.instante)
+        error = nueva.progreso_ms - mostrado
+        if abs(error) >= UMBRAL_SALTO_MS:
+            # Seek o salto real: se aplica de golpe
+            self._correccion = (0.0, 0.0)
+            return
+
+        self.muestras_error += 1
+        self.suma_error_ms += abs(error)
+        self.max_error_ms = max(self.max_error_ms, abs(error))
+        self.ultimo_error_ms = error
+        if MODO_MEDICION:
+            e = self.estadisticas_interpolacion()
+            print(f"[Medición] error interpolación: {error:+.0f} ms | medio: {e['error_medio_ms']:.0f} ms | máx: {e['error_max_ms']:.0f} ms")
+
+        # La barra sigue desde donde estaba y converge al valor real
+        self._correccion = (-error, nueva.instante)
+
+# Servicio único: un solo sondeo para toda la app
+reproduccion = ServicioReproduccion()
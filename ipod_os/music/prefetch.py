@@ -0,0 +1,300 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from config import *
+import utils
+import tareas
+from utils import descargar_imagen_url, procesar_niveles_caratula, cargar_imagen_reducida
+from cover_cache import cache_caratulas
+from response_cache import cache_respuestas
+from music.paginas import descargar_pagina
+from music.playback_state import reproduccion, instantanea_de_item
+from scheduler import planificador
+from api_scheduler import planificador_api, FONDO
+
+# Precarga por "hover" en los menús de Spotify.
+# Si la selección se queda quieta PRECARGA_ESPERA_MS sobre un artista, álbum,
+# playlist o show, se descarga en segundo plano la primera página de su menú
+# hijo a la caché de respuestas (y su carátula a la caché de carátulas).
+# Así, al pulsar Enter la lista suele estar ya lista.
+#
+# Prioridad baja:
+#   - Un solo hilo propio (no ocupa el pool de tareas del usuario)
+#   - Antes de cada descarga espera a que no haya tareas del usuario en curso
+#   - Limita el ancho de banda (PRECARGA_BYTES_SEGUNDO) pausando tras cada descarga
+#   - Si la selección cambia, lo que quede por hacer del ítem anterior se abandona
+#
+# PrecargadorCola hace lo mismo con lo que va a sonar: al cambiar de pista lee
+# la cola (o las siguientes pistas del álbum) y baja las carátulas de las
+# próximas PRECARGA_COLA_PISTAS. Now Playing cambia a la siguiente pista en
+# cuanto acaba la actual y su carátula ya está en caché, así que carátula,
+# título y contador cambian en el mismo frame. Tiene su propio hilo: tiene que
+# acabar antes del cambio de pista y no puede esperar detrás de la precarga de
+# menús, que se frena a propósito (turnos y ancho de banda).
+
+# Un hilo de baja prioridad para cada precarga
+# (sus peticiones nunca adelantan a las del usuario en el planificador_api)
+_pool_precarga = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precarga',
+                                    initializer=planificador_api.fijar_prioridad, initargs=(FONDO,))
+_pool_cola = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precarga_cola',
+                                initializer=planificador_api.fijar_prioridad, initargs=(FONDO,))
+
+# Tipo de ítem -> menú que abre main.py al pulsar Enter
+MENUS_HIJO = {
+    'artist': 'artist_albums',
+    'album': 'album_tracks',
+    'playlist': 'playlist_tracks',
+    'show': 'show_episodes',
+}
+
+def _precargar_caratula(url):
+    """Baja y procesa una carátula a la caché. Devuelve los bytes bajados (None si ya estaba)."""
+    clave = cache_caratulas.clave_url(url)
+    if cache_caratulas.contiene(clave):
+        return None
+    data = descargar_imagen_url(url)
+    if not data:
+        return 0
+    img = cargar_imagen_reducida(data)
+    cache_caratulas.guardar(clave, procesar_niveles_caratula(img))
+    return len(data)
+
+class PrecargadorMenus:
+    def __init__(self):
+        self.actual = None # Clave del ítem seleccionado
+        self.desde = 0 # ticks desde que está seleccionado
+        self.lanzada = False
+        self.generacion = 0
+        self.hechas = set() # Trabajos ya hechos en esta sesión
+
+        self.lanzadas = 0
+        self.descargas = 0
+        self.ya_en_cache = 0
+        self.abandonadas = 0
+        self.bytes = 0
+
+    @staticmethod
+    def _trabajos(item):
+        """Lista de trabajos para un ítem: ('menu', tipo, id_padre) y/o ('caratula', url)."""
+        if not isinstance(item, dict):
+            return []
+        trabajos = []
+        tipo_hijo = MENUS_HIJO.get(item.get('type'))
+        if tipo_hijo:
+            # Igual que main.py: los shows se abren por ID, el resto por URI
+            id_padre = item.get('id', item.get('uri')) if tipo_hijo == 'show_episodes' else item.get('uri')
+            if id_padre:
+                trabajos.append(('menu', tipo_hijo, id_padre))
+        if item.get('imagen'):
+            trabajos.append(('caratula', item['imagen']))
+        return trabajos
+
+    def observar(self, sp, item):
+        """
+        Lo llama el menú en cada frame con el ítem seleccionado (hilo de dibujado).
+        Tras PRECARGA_ESPERA_MS sin moverse lanza la precarga.
+        """
+        trabajos = self._trabajos(item)
+        clave = tuple(trabajos)
+        ahora = pygame.time.get_ticks()
+
+        if clave != self.actual:
+            self.actual = clave
+            self.desde = ahora
+            self.lanzada = False
+            self.generacion += 1 # Lo pendiente del ítem anterior se abandona
+            if trabajos:
+                planificador.programar('precarga', ahora + PRECARGA_ESPERA_MS)
+            return
+
+        if self.lanzada or not trabajos or ahora - self.desde < PRECARGA_ESPERA_MS:
+            return
+        self.lanzada = True
+        trabajos = [t for t in trabajos if t not in self.hechas]
+        if not trabajos or not utils.HAY_CONEXION:
+            return
+        self.lanzadas += 1
+        _pool_precarga.submit(self._tarea, self.generacion, sp, trabajos)
+
+    def _vigente(self, generacion):
+        return generacion == self.generacion
+
+    def _esperar_turno(self, generacion):
+        """Cede el paso a las tareas del usuario. False si la precarga ya no interesa."""
+        while tareas.pendientes() > 0:
+            if not self._vigente(generacion):
+                return False
+            time.sleep(0.05)
+        return self._vigente(generacion)
+
+    def _pausa_ancho_banda(self, num_bytes):
+        self.bytes += num_bytes
+        time.sleep(num_bytes / PRECARGA_BYTES_SEGUNDO)
+
+    def _tarea(self, generacion, sp, trabajos):
+        """Hilo de precarga: hace los trabajos en orden mientras el ítem siga seleccionado."""
+        for trabajo in trabajos:
+            if not self._esperar_turno(generacion):
+                self.abandonadas += 1
+                return
+            try:
+                if trabajo[0] == 'menu':
+                    self._precargar_menu(sp, trabajo[1], trabajo[2])
+                else:
+                    self._precargar_caratula(trabajo[1])
+                self.hechas.add(trabajo)
+            except Exception as e:
+                print(f"Error en precarga {trabajo}: {e}")
+
+    def _precargar_menu(self, sp, tipo, id_padre):
+        if cache_respuestas.esta_fresca(tipo, id_padre, 0):
+            self.ya_en_cache += 1
+            return
+        nuevas, total, siguiente = descargar_pagina(sp, tipo, id_padre)
+        cache_respuestas.guardar(tipo, id_padre, 0, nuevas, total, siguiente)
+        self.descargas += 1
+        # La API no da el tamaño: aproximamos con lo que ocupan los ítems
+        self._pausa_ancho_banda(len(repr(nuevas)))
+
+    def _precargar_caratula(self, url):
+        num_bytes = _precargar_caratula(url)
+        if num_bytes is None:
+            self.ya_en_cache += 1
+        elif num_bytes:
+            self.descargas += 1
+            self._pausa_ancho_banda(num_bytes)
+
+    def estadisticas(self):
+        return {
+            'lanzadas': self.lanzadas,
+            'descargas': self.descargas,
+            'ya_en_cache': self.ya_en_cache,
+            'abandonadas': self.abandonadas,
+            'bytes': self.bytes,
+        }
+
+class PrecargadorCola:
+    def __init__(self):
+        self.sp = None
+        self.generacion = 0
+
+        self.cambios = 0
+        self.descargas = 0
+        self.ya_en_cache = 0
+        self.omitidas = 0 # Sin conexión o enlace lento
+        self.bytes = 0
+
+    def iniciar(self, sp):
+        """Se engancha a los cambios de pista (llamar antes de reproduccion.iniciar)."""
+        self.sp = sp
+        reproduccion.al_cambiar_pista(self._pista_cambiada)
+
+    def _pista_cambiada(self, inst):
+        # Hilo de sondeo: no bloquear, solo encolar
+        self.generacion += 1
+        self.cambios += 1
+        _pool_cola.submit(self._tarea, self.generacion, inst)
+
+    def _siguientes(self, inst):
+        """Instantáneas de las próximas pistas: la cola del usuario o, si no hay, el álbum."""
+        try:
+            res = self.sp.queue()
+            items = [i for i in (res or {}).get('queue', []) if i]
+        except Exception as e:
+            print(f"Error leyendo la cola: {e}")
+            items = []
+        if items:
+            return [instantanea_de_item(i) for i in items[:PRECARGA_COLA_PISTAS]]
+
+        # Sonando un álbum: las siguientes son las pistas que vienen después
+        # (misma carátula; sirve al menos para título y contador)
+        if inst.tipo == 'track' and inst.contexto and inst.contexto.startswith('spotify:album:'):
+            return [inst._replace(item_id=t['uri'], titulo=t['name'], artista=t['artists'][0]['name'],
+                                  track_no=t['track_number'], duracion_ms=t['duration_ms'], progreso_ms=0)
+                    for t in self._siguientes_album(inst)]
+        return []
+
+    def _siguientes_album(self, inst):
+        """
+        Pistas del álbum que van detrás de la actual. Se busca la actual por su
+        URI: track_number es el número dentro del disco, no la posición en el
+        álbum (en los álbumes de varios discos se repite).
+        """
+        pistas = []
+        posicion = None
+        while True:
+            res = self.sp.album_tracks(inst.contexto, limit=TAMANO_PAGINA, offset=len(pistas)) or {}
+            items = res.get('items') or []
+            pistas.extend(items)
+            if posicion is None:
+                posicion = next((i for i, t in enumerate(pistas) if t and inst.item_id in
+                                 (t.get('uri'), (t.get('linked_from') or {}).get('uri'))), None)
+            if not items or not res.get('next'):
+                break
+            if posicion is not None and len(pistas) > posicion + PRECARGA_COLA_PISTAS:
+                break
+        if posicion is None:
+            return []
+        return [t for t in pistas[posicion + 1:posicion + 1 + PRECARGA_COLA_PISTAS] if t]
+
+    def _tarea(self, generacion, inst):
+        if not utils.HAY_CONEXION:
+            self.omitidas += 1
+            return
+        inicio = time.monotonic()
+        try:
+            siguientes = self._siguientes(inst)
+        except Exception as e:
+            print(f"Error en precarga de la cola: {e}")
+            return
+        latencia_ms = (time.monotonic() - inicio) * 1000
+        if generacion != self.generacion:
+            return # Ya ha cambiado otra vez de pista
+        reproduccion.cola = tuple(siguientes)
+
+        if latencia_ms > PRECARGA_ENLACE_LENTO_MS:
+            self.omitidas += 1
+            if MODO_MEDICION:
+                print(f"[Medición] cola leída en {latencia_ms:.0f} ms: enlace lento, sin precarga de carátulas")
+            return
+
+        gastados = 0
+        for s in siguientes:
+            if generacion != self.generacion or not utils.HAY_CONEXION:
+                return
+            if not s.cover_url:
+                continue
+            if gastados >= PRECARGA_COLA_MAX_BYTES:
+                self.omitidas += 1
+                return
+            inicio = time.monotonic()
+            try:
+                num_bytes = _precargar_caratula(s.cover_url)
+            except Exception as e:
+                print(f"Error en precarga de carátula {s.cover_url}: {e}")
+                continue
+            if num_bytes is None:
+                self.ya_en_cache += 1
+                continue
+            segundos = time.monotonic() - inicio
+            gastados += num_bytes
+            self.bytes += num_bytes
+            self.descargas += 1
+            if num_bytes and num_bytes / max(segundos, 0.001) < PRECARGA_MIN_BYTES_SEGUNDO:
+                self.omitidas += 1
+                return # Enlace lento: el resto se bajará al sonar
+
+    def estadisticas(self):
+        return {
+            'cambios': self.cambios,
+            'descargas': self.descargas,
+            'ya_en_cache': self.ya_en_cache,
+            'omitidas': self.omitidas,
+            'bytes': self.bytes,
+        }
+
+# Precargador único para todos los menús
+precargador = PrecargadorMenus()
+
+# Precargador de la cola de reproducción
+precargador_cola = PrecargadorCola()
@@ -1,6 +1,43 @@
 import pygame
+from collections import OrderedDict
 from config import *
-from utils import cargar_fuente, dibujar_header, truncar_texto, dibujar_scrollbar, dibujar_lista_elementos
+from utils import cargar_fuente, dibujar_header, actualizar_header, truncar_texto, dibujar_scrollbar, dibujar_lista_elementos
+from text_cache import renderizar_texto
+from damage import danos
+from scheduler import solicitar_redibujo, planificador
+from tareas import lanzar
+
+def _convertir_resultados(res):
+    """Respuesta de sp.search -> lista con cabeceras por categoría e ítems."""
+    resultados = []
+
+    categorias = [
+        ('artists', 'ARTISTS'), 
+        ('tracks', 'SONGS'), 
+        ('albums', 'ALBUMS'), 
+        ('playlists', 'PLAYLISTS'), 
+        ('shows', 'PODCASTS'), 
+        ('episodes', 'EPISODES')
+    ]
+
+    # Categorias
+    for cat_key, label in categorias:
+        items = (res.get(cat_key) or {}).get('items', [])
+        if items:
+            resultados.append({'tipo': 'header', 'nombre': label})
+            for i in items:
+                if not i: continue
+
+                nombre = i['name']
+                if cat_key == 'tracks': nombre += f" - {i['artists'][0]['name']}"
+                resultados.append({
+                    'tipo': 'item',
+                    'nombre': nombre,
+                    'uri': i['uri'],
+                    'id': i['id'],
+                    'subtipo': cat_key[:-1]
+                })
+    return resultados
 
 class SearchScreen:
     def __init__(self, sp_client):
@@ -13,6 +50,23 @@ class SearchScreen:
         
         self.items_visibles = 7
 
+        # Imagen del header ya montada (se rehace solo si cambia la query)
+        self._header_surf = None
+        self._clave_header = None
+
+        # Pipeline de búsqueda: debounce + pool + caché LRU query -> resultados
+        self.cache = OrderedDict()
+        self.pendiente = None # Query esperando a que pase el debounce
+        self.plazo_busqueda = 0
+        self.generacion = 0 # Solo se muestran los resultados de la última búsqueda lanzada
+        self.en_curso = False
+        self.futuro = None
+        self.recibidas = [] # (generacion, clave, resultados) desde el pool
+
+        self.emitidas = 0
+        self.canceladas = 0
+        self.cacheadas = 0
+
         self.reset_state()
         self.buscar()
 
@@ -26,47 +80,95 @@ class SearchScreen:
         self.scroll_inicio = 0
 
     def buscar(self):
+        """
+        Pide buscar la query actual. No bloquea: si está en la caché se muestra
+        ya; si no, se espera DEBOUNCE_BUSQUEDA_MS sin cambios antes de lanzarla.
+        """
         # Concatenamos la query confirmada + el caracter actual para buscar en tiempo real
         busqueda_actual = self.query + self.caracteres[self.char_idx]
+        self.pendiente = None
+        planificador.cancelar('busqueda')
         if not busqueda_actual.strip():
-            self.resultados = []
+            self._cancelar_en_curso()
+            self._mostrar([])
             return
-        
+
+        clave = busqueda_actual.strip().lower()
+        if clave in self.cache:
+            self.cache.move_to_end(clave)
+            self.cacheadas += 1
+            self._cancelar_en_curso() # Lo que llegue ya no corresponde a lo que se ve
+            self._mostrar(self.cache[clave])
+            return
+
+        # Debounce: al girar la rueda de A a M solo se lanza la última
+        self.pendiente = busqueda_actual
+        self.plazo_busqueda = pygame.time.get_ticks() + DEBOUNCE_BUSQUEDA_MS
+        planificador.programar('busqueda', self.plazo_busqueda)
+
+    def _cancelar_en_curso(self):
+        """La búsqueda lanzada ya no interesa: su resultado se guardará en la caché pero no se mostrará."""
+        if self.en_curso:
+            self.generacion += 1
+            self.canceladas += 1
+            self.en_curso = False
+            if self.futuro:
+                self.futuro.cancel()
+                self.futuro = None
+
+    def _lanzar_pendiente(self):
+        """En el hilo de dibujado: lanza la búsqueda si ya pasó el debounce."""
+        if self.pendiente is None or pygame.time.get_ticks() < self.plazo_busqueda:
+            return
+        busqueda, self.pendiente = self.pendiente, None
+        self._cancelar_en_curso()
+        self.generacion += 1
+        self.en_curso = True
+        self.emitidas += 1
+        self.futuro = lanzar(self._tarea_busqueda, self.generacion, busqueda)
+
+    def _tarea_busqueda(self, generacion, busqueda):
+        """Se ejecuta en un hilo del pool."""
         try:
             # Buscamos por categorias como hace dupontgu
-            res = self.sp.search(q=busqueda_actual, limit=10, type='track,artist,album,playlist,show')
-            self.resultados = []
-            
-            categorias = [
-                ('artists', 'ARTISTS'), 
-                ('tracks', 'SONGS'), 
-                ('albums', 'ALBUMS'), 
-                ('playlists', 'PLAYLISTS'), 
-                ('shows', 'PODCASTS'), 
-                ('episodes', 'EPISODES')
-            ]
-
-            # Categorias
-            for cat_key, label in categorias:
-                items = res.get(cat_key, {}).get('items', [])
-                if items:
-                    self.resultados.append({'tipo': 'header', 'nombre': label})
-                    for i in items:
-                        if not i: continue
-
-                        nombre = i['name']
-                        if cat_key == 'tracks': nombre += f" - {i['artists'][0]['name']}"
-                        self.resultados.append({
-                            'tipo': 'item',
-                            'nombre': nombre,
-                            'uri': i['uri'],
-                            'id': i['id'],
-                            'subtipo': cat_key[:-1]
-                        })
-            self.idx_res = 0
-            self.scroll_inicio = 0
-        except:
-            pass
+            res = self.sp.search(q=busqueda, limit=10, type='track,artist,album,playlist,show')
+        except Exception as e:
+            print(f"Error buscando '{busqueda}': {e}")
+            res = None
+        resultados = _convertir_resultados(res) if res else None
+        self.recibidas.append((generacion, busqueda.strip().lower(), resultados))
+        if generacion == self.generacion:
+            solicitar_redibujo()
+
+    def _aplicar_resultados(self):
+        """En el hilo de dibujado: guarda en la caché lo recibido y muestra solo lo vigente."""
+        while self.recibidas:
+            generacion, clave, resultados = self.recibidas.pop(0)
+            if resultados is None:
+                if generacion == self.generacion:
+                    self.en_curso = False # Error: se mantiene lo que había
+                continue
+            self.cache[clave] = resultados
+            self.cache.move_to_end(clave)
+            while len(self.cache) > MAX_BUSQUEDAS_CACHE:
+                self.cache.popitem(last=False)
+            if generacion == self.generacion:
+                self.en_curso = False
+                self._mostrar(resultados)
+
+    def _mostrar(self, resultados):
+        self.resultados = resultados
+        self.idx_res = 0
+        self.scroll_inicio = 0
+
+    def estadisticas(self):
+        """Contadores del pipeline de búsqueda."""
+        return {
+            'emitidas': self.emitidas,
+            'canceladas': self.canceladas,
+            'cacheadas': self.cacheadas,
+            'entradas_cache': len(self.cache),
+        }
 
     def mover_arriba(self):
         if self.modo_foco == 'busqueda':
@@ -133,8 +235,11 @@ class SearchScreen:
     def pulsar_enter(self):
         if self.modo_foco == 'busqueda':
             if self.resultados:
-                # Cambiar foco a lista
+                # Cambiar foco a lista (lo que llegue tarde ya no sustituye a la lista)
                 self.modo_foco = 'lista'
+                self.pendiente = None
+                planificador.cancelar('busqueda')
+                self._cancelar_en_curso()
                 
                 # Buscar el PRIMER ítem válido (no header)
                 self.idx_res = 0
@@ -162,21 +267,20 @@ class SearchScreen:
             return True
         return True # Sale al menú anterior
 
-    def dibujar(self, pantalla, estado_play):
-        pantalla.fill(NEGRO)
-        
+    def _crear_header_surf(self):
+        """Monta el texto bicolor del header (query + letra con cursor)"""
         # --- 1. PREPARAR EL TEXTO PERSONALIZADO ---
         # Creamos una superficie temporal para montar nuestro texto bicolor
         font = self.font_big
         char_actual = self.caracteres[self.char_idx]
 
         # Renderizamos las partes
-        surf_query = font.render(self.query, ANTIALIASING, VERDE_SPOTIFY)
+        surf_query = renderizar_texto(font, self.query, VERDE_SPOTIFY)
 
         if self.modo_foco == 'busqueda':
-            surf_char = font.render(char_actual, ANTIALIASING, NEGRO)
+            surf_char = renderizar_texto(font, char_actual, NEGRO)
         else:
-            surf_char = font.render(char_actual, ANTIALIASING, VERDE_SPOTIFY)
+            surf_char = renderizar_texto(font, char_actual, VERDE_SPOTIFY)
 
         # Calculamos tamaño total de la etiqueta
         w_total = surf_query.get_width() + surf_char.get_width()
@@ -209,15 +313,35 @@ class SearchScreen:
             
         # Pintamos la letra
         header_surf.blit(surf_char, (dest_char_x, 0))
-        
+        return header_surf
+
+    def proximo_despertar(self):
+        """Despertar cuando toque lanzar la búsqueda pendiente."""
+        return self.plazo_busqueda if self.pendiente is not None else None
+
+    def dibujar(self, pantalla, estado_play):
+        self._aplicar_resultados()
+        self._lanzar_pendiente()
+
+        # Limpiamos todo solo si cambiamos entre mensaje vacío y lista
+        danos.disposicion(pantalla, ('busqueda', bool(self.resultados)))
+
         # --- 2. LLAMAR AL HEADER COMÚN ---
+        # La imagen del header solo se vuelve a montar si cambia la query, la letra o el foco
+        clave_header = (self.query, self.char_idx, self.modo_foco)
+        if clave_header != self._clave_header:
+            self._header_surf = self._crear_header_surf()
+            self._clave_header = clave_header
         # Le pasamos nuestra imagen 'header_surf' y él pone los iconos y centra
-        dibujar_header(pantalla, header_surf, estado_play)
+        actualizar_header(pantalla, self._header_surf, estado_play, firma_contenido=clave_header)
 
         # --- 3. RESULTADOS ---
         if not self.resultados:
-            msg = self.font_small.render("Rotate to search...", ANTIALIASING, GRIS_TEXTO)
-            pantalla.blit(msg, (ANCHO//2 - msg.get_width()//2, 60))
+            txt_vacio = "Searching..." if (self.pendiente or self.en_curso) else "Rotate to search..."
+            if danos.region('vacio', txt_vacio, (0, 60, ANCHO, 20)):
+                pantalla.fill(NEGRO, (0, 60, ANCHO, 20))
+                msg = renderizar_texto(self.font_small, txt_vacio, GRIS_TEXTO)
+                pantalla.blit(msg, (ANCHO//2 - msg.get_width()//2, 60))
         else:
             # Determinamos si la lista tiene el foco visual
             lista_activa = (self.modo_foco == 'lista')
@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import threading
+import time
+from config import *
+
+# Caché persistente (SQLite en la SD) de las páginas de los menús de Spotify.
+# Clave: (tipo de carga, id_padre, página). Valor: (opciones, total, cursor).
+#
+# Se sirve siempre lo que haya (aunque esté caducado) para que la biblioteca
+# se pueda navegar sin red nada más arrancar; si está caducado el menú lo
+# revalida en segundo plano (stale-while-revalidate).
+#
+# Caducidad:
+#   - Canciones de una playlist: por snapshot_id (cambia con cada edición).
+#     Los snapshot_id vigentes se aprenden al descargar la lista de playlists.
+#   - Todo lo demás: TTL_CACHE_RESPUESTAS segundos.
+
+class CacheRespuestas:
+    def __init__(self, ruta=RUTA_CACHE_RESPUESTAS, ttl=TTL_CACHE_RESPUESTAS):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        self.aciertos = 0
+        self.aciertos_caducados = 0
+        self.fallos = 0
+        self.sin_cambios = 0 # Revalidaciones que devolvieron lo mismo
+
+        try:
+            self.db = sqlite3.connect(ruta, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS respuestas (
+                tipo TEXT, id_padre TEXT, pagina INTEGER,
+                datos TEXT, fecha REAL, snapshot TEXT,
+                PRIMARY KEY (tipo, id_padre, pagina))""")
+            self.db.execute("CREATE TABLE IF NOT EXISTS snapshots (playlist TEXT PRIMARY KEY, snapshot TEXT)")
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f"Caché de respuestas desactivada: {e}")
+            self.db = None
+
+    def _fresca(self, tipo, id_padre, fecha, snapshot):
+        if tipo == 'playlist_tracks' and snapshot:
+            fila = self.db.execute("SELECT snapshot FROM snapshots WHERE playlist = ?", (id_padre,)).fetchone()
+            if fila:
+                return fila[0] == snapshot
+        return time.time() - fecha < self.ttl
+
+    def obtener(self, tipo, id_padre, pagina):
+        """
+        Devuelve ((opciones, total, cursor), fresca, snapshot) o None.
+        'fresca' = False si hay que revalidar.
+        """
+        if not self.db:
+            return None
+        with self.lock:
+            try:
+                fila = self.db.execute(
+                    "SELECT datos, fecha, snapshot FROM respuestas WHERE tipo = ? AND id_padre = ? AND pagina = ?",
+                    (tipo, id_padre or '', pagina)).fetchone()
+                if fila is None:
+                    self.fallos += 1
+                    return None
+                datos, fecha, snapshot = fila
+                fresca = self._fresca(tipo, id_padre, fecha, snapshot)
+            except sqlite3.Error as e:
+                print(f"Error leyendo caché de respuestas: {e}")
+                return None
+
+            if fresca:
+                self.aciertos += 1
+            else:
+                self.aciertos_caducados += 1
+        return tuple(json.loads(datos)), fresca, snapshot
+
+    def esta_fresca(self, tipo, id_padre, pagina):
+        """Comprueba si hay copia fresca sin contar como acierto (para la precarga)."""
+        if not self.db:
+            return False
+        with self.lock:
+            try:
+                fila = self.db.execute(
+                    "SELECT fecha, snapshot FROM respuestas WHERE tipo = ? AND id_padre = ? AND pagina = ?",
+                    (tipo, id_padre or '', pagina)).fetchone()
+                return fila is not None and self._fresca(tipo, id_padre, *fila)
+            except sqlite3.Error:
+                return False
+
+    def guardar(self, tipo, id_padre, pagina, opciones, total, cursor, snapshot=None):
+        if not self.db:
+            return
+        if tipo == 'playlist_tracks' and snapshot is None:
+            snapshot = self.snapshot_vigente(id_padre)
+        datos = json.dumps((opciones, total, cursor))
+        with self.lock:
+            try:
+                self.db.execute("INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?, ?)",
+                                (tipo, id_padre or '', pagina, datos, time.time(), snapshot))
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"Error guardando caché de respuestas: {e}")
+
+    def renovar(self, tipo, id_padre, pagina, snapshot=None):
+        """La revalidación no trajo cambios: la entrada vuelve a estar fresca."""
+        if not self.db:
+            return
+        with self.lock:
+            self.sin_cambios += 1
+            try:
+                self.db.execute(
+                    "UPDATE respuestas SET fecha = ?, snapshot = COALESCE(?, snapshot) WHERE tipo = ? AND id_padre = ? AND pagina = ?",
+                    (time.time(), snapshot, tipo, id_padre or '', pagina))
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"Error guardando caché de respuestas: {e}")
+
+    def registrar_snapshots(self, snapshots):
+        """Guarda los snapshot_id actuales {uri de playlist: snapshot_id}."""
+        if not self.db or not snapshots:
+            return
+        with self.lock:
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?)", snapshots.items())
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"Error guardando caché de respuestas: {e}")
+
+    def snapshot_vigente(self, playlist):
+        if not self.db:
+            return None
+        with self.lock:
+            fila = self.db.execute("SELECT snapshot FROM snapshots WHERE playlist = ?", (playlist,)).fetchone()
+        return fila[0] if fila else None
+
+    def vaciar(self):
+        if not self.db:
+            return
+        with self.lock:
+            self.db.execute("DELETE FROM respuestas")
+            self.db.execute("DELETE FROM snapshots")
+            self.db.commit()
+
+    def estadisticas(self):
+        return {
+            'aciertos': self.aciertos,
+            'aciertos_caducados': self.aciertos_caducados,
+            'fallos': self.fallos,
+            'sin_cambios': self.sin_cambios,
+        }
+
+# Caché única compartida por todos los menús
+cache_respuestas = CacheRespuestas()
@@ -0,0 +1,115 @@
+import time
+import threading
+from datetime import datetime
+import pygame
+from config import *
+
+# Planificación del bucle principal.
+# En lugar de repintar a FPS fijos, el bucle duerme en pygame.event.wait()
+# hasta el próximo trabajo programado (cambio de minuto del reloj, tick de la
+# barra de progreso...) o hasta que llegue un evento: una tecla o un aviso de
+# un hilo en segundo plano (mensaje de chat, carátula descargada, datos cargados).
+
+# Evento propio que los hilos envían para despertar al bucle y forzar un frame
+EVENTO_REDIBUJAR = pygame.USEREVENT + 1
+
+_redibujo_pendiente = False
+_lock_redibujo = threading.Lock()
+
+def solicitar_redibujo():
+    """
+    Despierta al bucle principal. Se puede llamar desde cualquier hilo.
+    Si ya hay un aviso en la cola no se encola otro.
+    """
+    global _redibujo_pendiente
+    with _lock_redibujo:
+        if _redibujo_pendiente or not pygame.display.get_init():
+            return
+        _redibujo_pendiente = True
+    try:
+        pygame.event.post(pygame.event.Event(EVENTO_REDIBUJAR))
+    except pygame.error:
+        # Cola llena o pygame cerrándose: el siguiente evento ya despertará al bucle
+        with _lock_redibujo:
+            _redibujo_pendiente = False
+
+def redibujo_atendido():
+    """El bucle principal llama a esto al sacar EVENTO_REDIBUJAR de la cola."""
+    global _redibujo_pendiente
+    with _lock_redibujo:
+        _redibujo_pendiente = False
+
+def ms_hasta_siguiente_minuto():
+    """Milisegundos hasta que cambie el minuto del reloj del header."""
+    ahora = datetime.now()
+    return (60 - ahora.second) * 1000 - ahora.microsecond // 1000
+
+class Planificador:
+    """Plazos con nombre, en ms de pygame.time.get_ticks()."""
+
+    def __init__(self):
+        self.plazos = {}
+
+    def programar(self, nombre, cuando_ms):
+        """Programa (o reprograma) un trabajo para el instante 'cuando_ms'."""
+        self.plazos[nombre] = cuando_ms
+
+    def cancelar(self, nombre):
+        self.plazos.pop(nombre, None)
+
+    def proximo_plazo(self, *extra):
+        """El plazo más cercano entre los programados y los 'extra' (None se ignora)."""
+        candidatos = [p for p in list(self.plazos.values()) + list(extra) if p is not None]
+        return min(candidatos) if candidatos else None
+
+    def vencidos(self, ahora_ms):
+        """Devuelve (y quita) los trabajos cuyo plazo ya ha llegado."""
+        nombres = [n for n, p in self.plazos.items() if p <= ahora_ms]
+        for n in nombres:
+            del self.plazos[n]
+        return nombres
+
+class MedidorActividad:
+    """
+    Modo medición (MODO_MEDICION en config.py): cada INTERVALO_MEDICION ms
+    imprime despertares por segundo, frames pintados y % de tiempo dormido.
+    """
+
+    def __init__(self, activo=MODO_MEDICION, intervalo_ms=INTERVALO_MEDICION):
+        self.activo = activo
+        self.intervalo = intervalo_ms / 1000.0
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.inicio = time.monotonic()
+        self.despertares = 0
+        self.frames = 0
+        self.tiempo_dormido = 0.0
+
+    def dormido(self, segundos, despertar=True):
+        """Tiempo pasado bloqueado (event.wait() o el límite de FPS)."""
+        if despertar:
+            self.despertares += 1
+        self.tiempo_dormido += segundos
+
+    def frame(self):
+        self.frames += 1
+
+    def informe(self):
+        """Devuelve el informe del periodo actual sin reiniciarlo."""
+        total = max(time.monotonic() - self.inicio, 1e-6)
+        return {
+            'despertares_s': self.despertares / total,
+            'frames_s': self.frames / total,
+            'inactivo_pct': 100.0 * self.tiempo_dormido / total,
+        }
+
+    def tick(self):
+        if not self.activo or time.monotonic() - self.inicio < self.intervalo:
+            return
+        r = self.informe()
+        print(f"[Medición] despertares/s: {r['despertares_s']:.2f} | frames/s: {r['frames_s']:.2f} | inactivo: {r['inactivo_pct']:.1f}%")
+        self._reiniciar()
+
+# Planificador compartido: cualquier pantalla puede programar un despertar
+planificador = Planificador()
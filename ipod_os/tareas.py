@@ -0,0 +1,31 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+
+# Pool de hilos compartido para el trabajo que no debe bloquear el bucle
+# principal (descargas de la API, cargas de menús...).
+# Las tareas no tocan la pantalla: dejan su resultado preparado y llaman a
+# scheduler.solicitar_redibujo() para que el bucle lo aplique en el siguiente frame.
+
+pool = ThreadPoolExecutor(max_workers=HILOS_TAREAS, thread_name_prefix='tarea')
+
+_pendientes = 0
+_lock = threading.Lock()
+
+def _terminada(_futuro):
+    global _pendientes
+    with _lock:
+        _pendientes -= 1
+
+def lanzar(funcion, *args, **kwargs):
+    """Ejecuta funcion(*args, **kwargs) en el pool. Devuelve un Future."""
+    global _pendientes
+    with _lock:
+        _pendientes += 1
+    futuro = pool.submit(funcion, *args, **kwargs)
+    futuro.add_done_callback(_terminada) # También se llama al cancelarla
+    return futuro
+
+def pendientes():
+    """Tareas pedidas por el usuario aún sin terminar (la precarga espera a que sea 0)."""
+    return _pendientes
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from config import *
+
+# Caché LRU de textos ya renderizados (font.render).
+# A 30 FPS casi todos los textos de la pantalla son los mismos frame tras frame,
+# así que FreeType solo debería trabajar cuando aparece un texto nuevo.
+#
+# Clave: (fuente, tamaño, texto, color, antialias). Las Surfaces devueltas son
+# compartidas: se pueden hacer blit, pero NO se deben modificar.
+# Solo se usa desde el hilo principal (el de dibujado).
+
+_cache = OrderedDict()
+_bytes_usados = 0
+
+# id(fuente) -> (fuente, clave). Guardamos la fuente para que su id no se reutilice.
+_fuentes = {}
+
+aciertos = 0
+fallos = 0
+expulsiones = 0
+
+def registrar_fuente(fuente, nombre, tamano):
+    """Asocia una fuente cargada con su clave legible (nombre, tamaño, negrita)."""
+    _fuentes[id(fuente)] = (fuente, (nombre, tamano, fuente.get_bold()))
+
+def _clave_fuente(fuente):
+    registro = _fuentes.get(id(fuente))
+    if registro is None:
+        # Fuente no registrada (ej: SysFont creada a mano): la identificamos por objeto
+        registrar_fuente(fuente, f"fuente_{id(fuente)}", fuente.get_height())
+        registro = _fuentes[id(fuente)]
+    return registro[1]
+
+def _bytes_surface(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+def renderizar_texto(fuente, texto, color, antialias=ANTIALIASING):
+    """Igual que fuente.render(texto, antialias, color), pero cacheado."""
+    global _bytes_usados, aciertos, fallos, expulsiones
+
+    clave = (_clave_fuente(fuente), texto, tuple(color), antialias)
+    surf = _cache.get(clave)
+    if surf is not None:
+        _cache.move_to_end(clave)
+        aciertos += 1
+        return surf
+
+    fallos += 1
+    surf = fuente.render(texto, antialias, color)
+    _cache[clave] = surf
+    _bytes_usados += _bytes_surface(surf)
+
+    # Expulsamos los menos usados hasta volver al presupuesto
+    while len(_cache) > 1 and (len(_cache) > MAX_ENTRADAS_CACHE_TEXTO or _bytes_usados > MAX_BYTES_CACHE_TEXTO):
+        _, vieja = _cache.popitem(last=False)
+        _bytes_usados -= _bytes_surface(vieja)
+        expulsiones += 1
+
+    return surf
+
+def estadisticas_texto():
+    """Contadores para comprobar que en reposo no se renderiza texto nuevo."""
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'expulsiones': expulsiones,
+        'entradas': len(_cache),
+        'bytes': _bytes_usados,
+    }
+
+def vaciar_cache_texto():
+    global _bytes_usados
+    _cache.clear()
+    _bytes_usados = 0
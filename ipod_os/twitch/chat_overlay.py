@@ -0,0 +1,115 @@
+import pygame
+from config import *
+
+class ChatOverlay:
+    """
+    Panel del chat de Twitch como buffer con scroll.
+    Cada mensaje se parte en líneas y se renderiza UNA sola vez, cuando llega:
+    el buffer se desplaza hacia arriba lo que ocupa y el mensaje se pinta abajo.
+    Dibujar el chat es siempre un único blit, haya los mensajes que haya.
+    """
+
+    def __init__(self, fuente, ancho, alto, line_height=12, margen_izq=6, margen_inferior=5, espacio_mensajes=4):
+        self.fuente = fuente
+        self.ancho = ancho
+        self.alto = alto
+        self.line_height = line_height
+        self.margen_izq = margen_izq
+        self.margen_inferior = margen_inferior
+        self.espacio_mensajes = espacio_mensajes
+        self.ancho_util = ancho - (margen_izq * 2) # Margen a ambos lados
+
+        self.buffer = pygame.Surface((ancho, alto))
+        self.buffer.fill(NEGRO)
+
+        self.sesion = None # Sesión del TwitchChat que estamos mostrando
+        self.ultimo_id = 0 # Último mensaje ya pintado
+
+    def _partir_lineas(self, texto, ancho_primera_linea):
+        """
+        Divide el mensaje en líneas. La primera tiene menos espacio porque
+        delante va el usuario; las siguientes tienen todo el ancho.
+        """
+        lineas = []
+        palabras = texto.split(' ')
+        linea_actual = []
+        ancho_limite = ancho_primera_linea
+        
+        for palabra in palabras:
+            prueba = ' '.join(linea_actual + [palabra])
+            
+            if self.fuente.size(prueba)[0] <= ancho_limite:
+                linea_actual.append(palabra)
+            else:
+                lineas.append(' '.join(linea_actual))
+                linea_actual = [palabra]
+                ancho_limite = self.ancho_util # A partir de aquí tenemos todo el ancho
+        
+        if linea_actual:
+            lineas.append(' '.join(linea_actual))
+        return lineas
+
+    def _componer_mensaje(self, msg):
+        """Devuelve la lista de (surface, x) de cada línea del mensaje, ya renderizadas."""
+        user_surf = self.fuente.render(f"{msg['user']}: ", True, msg['color']) # Usamos el color guardado
+        user_width = user_surf.get_width()
+
+        lineas = []
+        for i, linea_txt in enumerate(self._partir_lineas(msg['text'], self.ancho_util - user_width)):
+            txt_surf = self.fuente.render(linea_txt, True, (255, 255, 255))
+            if i == 0:
+                # Primera línea: usuario + texto
+                linea = pygame.Surface((user_width + txt_surf.get_width(), max(user_surf.get_height(), txt_surf.get_height())))
+                linea.blit(user_surf, (0, 0))
+                linea.blit(txt_surf, (user_width, 0))
+                lineas.append(linea)
+            else:
+                lineas.append(txt_surf)
+        return lineas
+
+    def _anadir_mensaje(self, lineas):
+        """Desplaza el buffer hacia arriba y pinta las líneas nuevas abajo."""
+        alto_bloque = len(lineas) * self.line_height + self.espacio_mensajes
+        self.buffer.scroll(0, -alto_bloque)
+        self.buffer.fill(NEGRO, (0, self.alto - alto_bloque, self.ancho, alto_bloque))
+
+        y = self.alto - self.margen_inferior - len(lineas) * self.line_height
+        for linea in lineas:
+            self.buffer.blit(linea, (self.margen_izq, y))
+            y += self.line_height
+
+    def actualizar(self, chat):
+        """
+        Incorpora los mensajes nuevos del TwitchChat. Devuelve True si el
+        buffer ha cambiado (hay que repintar el panel).
+        """
+        cambiado = False
+        if chat.sesion != self.sesion:
+            # Canal nuevo: empezamos de cero
+            self.sesion = chat.sesion
+            self.ultimo_id = 0
+            self.buffer.fill(NEGRO)
+            cambiado = True
+
+        nuevos = [m for m in chat.get_messages() if m.get('id', 0) > self.ultimo_id]
+        if not nuevos:
+            return cambiado
+
+        # Si llegan muchos de golpe, solo maquetamos los que caben en pantalla
+        compuestos = []
+        alto_total = 0
+        for msg in reversed(nuevos):
+            lineas = self._componer_mensaje(msg)
+            compuestos.append(lineas)
+            alto_total += len(lineas) * self.line_height + self.espacio_mensajes
+            if alto_total >= self.alto:
+                break
+
+        for lineas in reversed(compuestos):
+            self._anadir_mensaje(lineas)
+
+        self.ultimo_id = nuevos[-1]['id']
+        return True
+
+    def dibujar(self, pantalla, x, y):
+        pantalla.blit(self.buffer, (x, y))
@@ -1,10 +1,21 @@
 import streamlink
 import vlc
-import requests
 import io
-from config import TWITCH_CLIENT_ID, TWITCH_ACCESS_TOKEN, MORADO_TWITCH
+import re
+from config import TWITCH_CLIENT_ID, TWITCH_ACCESS_TOKEN, MORADO_TWITCH, TWITCH_PLAZO, RESOLUCION_DITHER
 from music.menu_principal import MenuPantalla
 from utils import descargar_imagen_url
+from http_client import http
+
+# Tamaños de foto de perfil que sirve el CDN de Twitch (...-profile_image-300x300.png)
+LADOS_PERFIL_TWITCH = (70, 150, 300, 600)
+
+def url_perfil_reducida(url, minimo=RESOLUCION_DITHER):
+    """Pide la variante más pequeña de la foto de perfil que sirva para la carátula."""
+    if not url:
+        return url
+    lado = min(l for l in LADOS_PERFIL_TWITCH if l >= minimo)
+    return re.sub(r'-profile_image-\d+x\d+\.', f'-profile_image-{lado}x{lado}.', url)
 
 class TwitchPlayer:
     def __init__(self):
@@ -23,7 +34,7 @@ class TwitchPlayer:
     def get_my_user_id(self):
         """Obtiene tu ID numérico de usuario de Twitch"""
         try:
-            r = requests.get('https://api.twitch.tv/helix/users', headers=self.headers)
+            r = http.get('https://api.twitch.tv/helix/users', headers=self.headers, plazo=TWITCH_PLAZO)
             if r.status_code == 200:
                 data = r.json()
                 return data['data'][0]['id']
@@ -40,7 +51,7 @@ class TwitchPlayer:
         print(f"Buscando directos para el usuario ID: {user_id}...")
         try:
             url = f'https://api.twitch.tv/helix/streams/followed?user_id={user_id}'
-            r = requests.get(url, headers=self.headers)
+            r = http.get(url, headers=self.headers, plazo=TWITCH_PLAZO)
             
             if r.status_code == 200:
                 data = r.json()['data']
@@ -87,10 +98,10 @@ class TwitchPlayer:
         
         pics = {}
         try:
-            r = requests.get(url, headers=self.headers)
+            r = http.get(url, headers=self.headers, plazo=TWITCH_PLAZO)
             if r.status_code == 200:
                 for u in r.json()['data']:
-                    pics[u['id']] = u['profile_image_url']
+                    pics[u['id']] = url_perfil_reducida(u['profile_image_url'])
         except:
             pass
         return pics
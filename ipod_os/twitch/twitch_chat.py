@@ -4,6 +4,7 @@ import time
 import re
 import ssl
 from config import *
+from scheduler import solicitar_redibujo
 
 class TwitchChat:
     def __init__(self):
@@ -19,6 +20,8 @@ class TwitchChat:
         # Buffer de mensajes (Guardamos los últimos 10)
         self.messages = [] 
         self.max_messages = 16 # Cuántos caben en pantalla
+        self.version = 0 # Sube con cada cambio del buffer (para saber cuándo repintar)
+        self.sesion = 0 # Sube con cada connect() (chat nuevo)
         
         # Hilo
         self.thread = None
@@ -29,6 +32,8 @@ class TwitchChat:
         
         self.channel = channel_name.lower().strip() # Twitch exige minúsculas
         self.messages = [] # Limpiar chat anterior
+        self.version += 1
+        self.sesion += 1
         self.running = True
         
         # Iniciar hilo de escucha
@@ -119,17 +124,21 @@ class TwitchChat:
     def add_message(self, user, text):
         """Añade mensaje al buffer y borra los viejos"""
         color = self._get_user_color(user)
-        self.messages.append({'user': user, 'text': text, 'color': color})
+        self.version += 1 # Hace también de id del mensaje (el overlay sabe cuáles son nuevos)
+        self.messages.append({'id': self.version, 'user': user, 'text': text, 'color': color})
         if len(self.messages) > self.max_messages:
             self.messages.pop(0)
+        solicitar_redibujo() # Despertar al bucle principal para pintarlo
 
     def add_system_message(self, text):
-        self.messages.append({'user': 'SYSTEM', 'text': text, 'color': MORADO_TWITCH})
+        self.version += 1
+        self.messages.append({'id': self.version, 'user': 'SYSTEM', 'text': text, 'color': MORADO_TWITCH})
         if len(self.messages) > self.max_messages:
             self.messages.pop(0)
+        solicitar_redibujo() # Despertar al bucle principal para pintarlo
             
     def get_messages(self):
-        return self.messages
+        return list(self.messages) # Copia: el hilo de escucha sigue añadiendo
     
     def _get_user_color(self, username):
         """Genera un color consistente basado en el nombre"""
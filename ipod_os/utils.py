@@ -8,17 +8,40 @@ import socket # Para comprobar si hay internet
 import threading
 import subprocess
 import time
-import requests # Si no lo tienes
+import dithering
 from config import *
+from text_cache import registrar_fuente, renderizar_texto
+from damage import danos
+from scheduler import solicitar_redibujo
+from http_client import http
+
+try:
+    from PIL import Image as ImagenPIL # Opcional: decodificar JPEG a tamaño reducido
+except ImportError:
+    ImagenPIL = None
+
+RECT_HEADER = pygame.Rect(0, 0, ANCHO, ALTURA_HEADER + 2) # Incluye la línea inferior
 
 _fuente_header_big_cache = None
 _fuente_header_small_cache = None
 
+# Header pre-compuesto: capas de iconos por (tema, WiFi, BT) y el header final
+_capas_iconos_header = {}
+_header_compuesto = None
+_firma_header_compuesto = None
+
 HAY_CONEXION = False
 BT_CONECTADO = False
 TIMER_INICIADO = False
 
+_fuentes_cargadas = {}
+
 def cargar_fuente(tamano):
+    # Cada tamaño se carga una sola vez y se comparte (así la caché de textos
+    # reconoce la misma fuente desde todas las pantallas)
+    if tamano in _fuentes_cargadas:
+        return _fuentes_cargadas[tamano]
+
     try:
         ruta = os.path.join(os.path.dirname(__file__), 'Chicago.ttf')
         fuente = pygame.font.Font(ruta, tamano)
@@ -26,9 +49,14 @@ def cargar_fuente(tamano):
         if NEGRITA:
             fuente.set_bold(True)
 
-        return fuente
+        nombre = 'Chicago'
     except FileNotFoundError:
-        return pygame.font.SysFont("arial", tamano, bold=True)
+        fuente = pygame.font.SysFont("arial", tamano, bold=True)
+        nombre = 'arial'
+
+    registrar_fuente(fuente, nombre, tamano)
+    _fuentes_cargadas[tamano] = fuente
+    return fuente
 
 def truncar_texto(texto, limite):
     """
@@ -61,13 +89,45 @@ def descargar_imagen_url(url):
     """Descarga una imagen de una URL y devuelve los bytes raw"""
     if not url: return None
     try:
-        r = requests.get(url, timeout=5)
+        r = http.get(url, plazo=5)
         if r.status_code == 200:
             return r.content
     except Exception as e:
         print(f"Error descargando imagen: {e}")
     return None
 
+def elegir_url_imagen(images, minimo=RESOLUCION_DITHER):
+    """
+    De la lista 'images' de Spotify (varios tamaños) elige la más pequeña que
+    aún mide al menos 'minimo' px: para una carátula de 64x64 no hace falta
+    bajar la de 640x640. Si no hay tamaños, la primera.
+    """
+    if not images:
+        return None
+    validas = [i for i in images if (i.get('width') or 0) >= minimo]
+    if validas:
+        return min(validas, key=lambda i: i['width'])['url']
+    if all(i.get('width') for i in images):
+        return max(images, key=lambda i: i['width'])['url'] # Todas pequeñas: la mayor
+    return images[0]['url']
+
+def cargar_imagen_reducida(data, minimo=RESOLUCION_DITHER):
+    """
+    Bytes de una imagen -> Surface. Con Pillow, los JPEG se decodifican ya
+    reducidos (escalado DCT 1/2, 1/4 o 1/8, sin bajar de 'minimo'): una
+    carátula incrustada de 3000x3000 no llega a ocupar la RAM a tamaño completo.
+    Sin Pillow (o si falla), pygame.image.load normal.
+    """
+    if ImagenPIL is not None:
+        try:
+            img = ImagenPIL.open(io.BytesIO(data))
+            img.draft('RGB', (minimo, minimo)) # Solo tiene efecto en JPEG
+            img = img.convert('RGB')
+            return pygame.image.frombuffer(img.tobytes(), img.size, 'RGB')
+        except Exception as e:
+            print(f"Pillow no pudo decodificar la imagen: {e}")
+    return pygame.image.load(io.BytesIO(data))
+
 #######################
 # FUNCIONES DE DIBUJO #
 #######################
@@ -79,7 +139,7 @@ def dibujar_reloj(pantalla, color):
 
     now = datetime.now()
     time_str = now.strftime("%H:%M") # Formato 24h
-    text_time = _fuente_header_small_cache.render(time_str, ANTIALIASING, color)
+    text_time = renderizar_texto(_fuente_header_small_cache, time_str, color)
     rect_time = text_time.get_rect(midleft=(x_reloj, y_reloj))
     pantalla.blit(text_time, rect_time)
 
@@ -146,19 +206,54 @@ def dibujar_bateria(pantalla, color_tema):
 
     # Placeholder: 100% (Más adelante leeremos el sistema real)
     bateria_pct = "100%" 
-    text_bat = _fuente_header_small_cache.render(bateria_pct, ANTIALIASING, color_tema)
+    text_bat = renderizar_texto(_fuente_header_small_cache, bateria_pct, color_tema)
     rect_bat = text_bat.get_rect(midright=(x, y))
     pantalla.blit(text_bat, rect_bat)
 
-def dibujar_header(pantalla, contenido, estado_play, color_tema):
+def _firma_header(contenido, estado_play, color_tema, firma_contenido=None):
+    """Todo lo que cambia el aspecto del header. Si no cambia, el header es el mismo."""
+    if firma_contenido is None:
+        # Una Surface sin firma no se puede comparar: se recompone siempre
+        firma_contenido = contenido if isinstance(contenido, str) else object()
+    return (firma_contenido, estado_play, color_tema, datetime.now().strftime("%H:%M"), HAY_CONEXION, BT_CONECTADO)
+
+def _capa_iconos_header(color_tema):
+    """
+    Capa transparente con las partes fijas del header para un tema y estado:
+    Bluetooth, WiFi y batería. Se compone una sola vez por combinación.
+    """
+    clave = (color_tema, HAY_CONEXION, BT_CONECTADO)
+    capa = _capas_iconos_header.get(clave)
+    if capa is None:
+        capa = pygame.Surface((ANCHO, ALTURA_HEADER + 2), pygame.SRCALPHA)
+
+        # Icono Bluetooth (esquina superior derecha)
+        if BT_CONECTADO:
+            dibujar_icono_bt(capa, color_tema)
+
+        # WIFI (Derecha)
+        dibujar_icono_wifi(capa, color_tema)
+
+        # BATERÍA (Derecha) - Porcentaje
+        dibujar_bateria(capa, color_tema)
+
+        _capas_iconos_header[clave] = capa
+    return capa
+
+def dibujar_header(pantalla, contenido, estado_play, color_tema=VERDE_SPOTIFY, firma_contenido=None):
     """
     Dibuja la barra superior, iconos y el contenido central.
     'contenido' puede ser:
        - str: Texto simple (se renderiza en verde).
        - pygame.Surface: Una imagen ya renderizada (se centra automáticamente).
+         Conviene pasar 'firma_contenido' para poder reutilizar el header.
+    El header completo se guarda ya compuesto y solo se recompone si cambia
+    el minuto, el play/pause, la conexión, el Bluetooth o el título.
+    En reposo cuesta un único blit.
     """
     global _fuente_header_big_cache
     global _fuente_header_small_cache
+    global _header_compuesto, _firma_header_compuesto
 
     if _fuente_header_big_cache is None:
         _fuente_header_big_cache = cargar_fuente(TEXT_BIG)
@@ -170,38 +265,51 @@ def dibujar_header(pantalla, contenido, estado_play, color_tema):
     if not TIMER_INICIADO:
         comprobar_internet() # Primera comprobación
         TIMER_INICIADO = True
+
+    firma = _firma_header(contenido, estado_play, color_tema, firma_contenido)
+    if firma != _firma_header_compuesto:
+        if _header_compuesto is None:
+            _header_compuesto = pygame.Surface((ANCHO, ALTURA_HEADER + 2))
+        header = _header_compuesto
     
-    # FONDO Y LÍNEA
-    pygame.draw.rect(pantalla, NEGRO, (0, 0, ANCHO, ALTURA_HEADER))
-    pygame.draw.line(pantalla, color_tema, (0, ALTURA_HEADER), (ANCHO, ALTURA_HEADER), 2)
-    
-    # RELOJ (Izquierda)
-    dibujar_reloj(pantalla, color_tema)
+        # FONDO Y LÍNEA
+        header.fill(NEGRO)
+        pygame.draw.line(header, color_tema, (0, ALTURA_HEADER), (ANCHO, ALTURA_HEADER), 2)
+        
+        # RELOJ (Izquierda)
+        dibujar_reloj(header, color_tema)
 
-    # PLAY/PAUSE (Izquierda)
-    dibujar_icono_playpause(pantalla, color_tema, estado_play)
+        # PLAY/PAUSE (Izquierda)
+        dibujar_icono_playpause(header, color_tema, estado_play)
 
-    # CONTENIDO CENTRAL (Texto o Surface)
-    if isinstance(contenido, str):
-        # Es texto normal
-        surf = _fuente_header_big_cache.render(contenido, ANTIALIASING, color_tema)
-    else:
-        # Es una Surface (imagen) personalizada (ej: búsqueda con colores)
-        surf = contenido
-    
-    rect_titulo = surf.get_rect(center=(ANCHO//2, ALTURA_HEADER//2))
-    pantalla.blit(surf, rect_titulo)
-    
-    # Icono Bluetooth (esquina superior derecha)
-    if BT_CONECTADO:
-        dibujar_icono_bt(pantalla, color_tema)
+        # CONTENIDO CENTRAL (Texto o Surface)
+        if isinstance(contenido, str):
+            # Es texto normal
+            surf = renderizar_texto(_fuente_header_big_cache, contenido, color_tema)
+        else:
+            # Es una Surface (imagen) personalizada (ej: búsqueda con colores)
+            surf = contenido
+        
+        rect_titulo = surf.get_rect(center=(ANCHO//2, ALTURA_HEADER//2))
+        header.blit(surf, rect_titulo)
 
-    # WIFI (Derecha)
-    dibujar_icono_wifi(pantalla, color_tema)
+        # ICONOS (BT, WiFi, Batería): capa fija por tema, encima del título
+        header.blit(_capa_iconos_header(color_tema), (0, 0))
 
-    # BATERÍA (Derecha) - Porcentaje
-    dibujar_bateria(pantalla, color_tema)
+        _firma_header_compuesto = firma
+
+    pantalla.blit(_header_compuesto, (0, 0))
     
+def actualizar_header(pantalla, contenido, estado_play, color_tema=VERDE_SPOTIFY, firma_contenido=None):
+    """
+    Igual que dibujar_header, pero solo repinta si algo de lo que se ve ha
+    cambiado (título, play/pause, minuto del reloj, WiFi o Bluetooth).
+    Si 'contenido' es una Surface, pasar en 'firma_contenido' lo que la define.
+    """
+    firma = _firma_header(contenido, estado_play, color_tema, firma_contenido)
+    if danos.region('header', firma, RECT_HEADER):
+        dibujar_header(pantalla, contenido, estado_play, color_tema, firma_contenido)
+
 def dibujar_lista_elementos(pantalla, opciones, seleccion, inicio_scroll, items_visibles, fuente, tiene_foco=True, color_tema=VERDE_SPOTIFY):
     """
     Dibuja una lista estándar estilo iPod.
@@ -212,6 +320,7 @@ def dibujar_lista_elementos(pantalla, opciones, seleccion, inicio_scroll, items_
     - items_visibles: Cuántos caben en pantalla.
     - fuente: La fuente a usar (grande o pequeña).
     - tiene_foco: Si False, el elemento seleccionado se pinta en gris/verde oscuro (no activo).
+    Solo se repintan las filas (y la scrollbar) que han cambiado desde el último frame.
     """
     
     # 1. Cálculos de zona
@@ -220,25 +329,51 @@ def dibujar_lista_elementos(pantalla, opciones, seleccion, inicio_scroll, items_
     
     # Si hay scroll, restamos el ancho de la barra y el separador
     ancho_zona = ANCHO - (ANCHO_SCROLLBAR + ANCHO_SEPARADOR) if hay_scroll else ANCHO
+    # Zona a limpiar de cada fila (incluye el separador de la scrollbar)
+    ancho_limpieza = ANCHO - ANCHO_SCROLLBAR if hay_scroll else ANCHO
+
+    # 2. Scrollbar (antes que las filas: si desaparece, su limpieza no debe pisarlas)
+    dibujar_scrollbar(pantalla, total_items, items_visibles, inicio_scroll, color_tema)
     
-    # 2. Slice de elementos visibles
+    # 3. Slice de elementos visibles
     vista = opciones[inicio_scroll : inicio_scroll + items_visibles]
     
-    for i, op in enumerate(vista):
+    for i in range(items_visibles):
         pos_y = INICIO_VERTICAL_LISTA + (i * ALTURA_HEADER)
         idx_real = i + inicio_scroll
+        rect_fila = pygame.Rect(0, pos_y, ancho_limpieza, ALTURA_HEADER)
+
+        if i >= len(vista):
+            # Fila vacía: solo hay que limpiarla si antes tenía algo
+            if danos.region(('fila', i), None, rect_fila):
+                pantalla.fill(NEGRO, rect_fila)
+            continue
+
+        op = vista[i]
         
         # Normalizar datos: puede ser un dict (Search) o un str (Menu simple)
         if isinstance(op, dict):
             nombre = op['nombre']
             es_header = op.get('tipo') == 'header'
+            es_live = bool(op.get('is_live'))
         else:
             nombre = str(op)
             es_header = False
+            es_live = False
+
+        es_seleccionado = (idx_real == seleccion)
+
+        firma = (nombre, es_header, es_live, es_seleccionado, tiene_foco, ancho_zona, color_tema)
+        if not danos.region(('fila', i), firma, rect_fila):
+            continue
+
+        pantalla.fill(NEGRO, rect_fila)
+        clip_anterior = pantalla.get_clip()
+        pantalla.set_clip(rect_fila)
         
         # A) CASO HEADER (Títulos de sección)
         if es_header:
-            texto_render = fuente.render(nombre, ANTIALIASING, COLOR_HEADER_SECCION)
+            texto_render = renderizar_texto(fuente, nombre, COLOR_HEADER_SECCION)
             # Usamos OFFSET_TEXTO_LISTA para el ajuste vertical fino
             pantalla.blit(texto_render, (10, pos_y + OFFSET_TEXTO_LISTA))
             
@@ -250,15 +385,13 @@ def dibujar_lista_elementos(pantalla, opciones, seleccion, inicio_scroll, items_
             limite_chars = MAX_CARACTERES_MENU
             txt_mostrar = truncar_texto(nombre, limite_chars)
             
-            es_seleccionado = (idx_real == seleccion)
-            
             if es_seleccionado and tiene_foco:
                 # Fondo Verde
                 pygame.draw.rect(pantalla, color_tema, (0, pos_y, ancho_zona, ALTURA_HEADER))
                 # Texto Negro
-                r = fuente.render(txt_mostrar, ANTIALIASING, NEGRO)
+                r = renderizar_texto(fuente, txt_mostrar, NEGRO)
                 # Flechita '>'
-                flecha = fuente.render(">", ANTIALIASING, NEGRO)
+                flecha = renderizar_texto(fuente, ">", NEGRO)
                 pantalla.blit(flecha, (ancho_zona - 15, pos_y + OFFSET_TEXTO_LISTA))
             else:
                 # Texto Verde (o Gris si no tiene foco y es el seleccionado "fantasma")
@@ -268,31 +401,38 @@ def dibujar_lista_elementos(pantalla, opciones, seleccion, inicio_scroll, items_
                 elif not tiene_foco:
                     color = GRIS_TEXTO # Ítems inactivos
                 
-                r = fuente.render(txt_mostrar, ANTIALIASING, color)
+                r = renderizar_texto(fuente, txt_mostrar, color)
             
             pantalla.blit(r, (10, pos_y + OFFSET_TEXTO_LISTA))
 
-            if op.get('is_live'):
+            if es_live:
                 
                 # Dibujamos el círculo rojo
                 # (pantalla, color, (x, y), radio)
                 pygame.draw.circle(pantalla, (235, 4, 0), (ancho_zona - 25, pos_y + OFFSET_TEXTO_LISTA + 14), 4)
-    
-    # 3. Dibujar Scrollbar
-    dibujar_scrollbar(pantalla, total_items, items_visibles, inicio_scroll, color_tema)
+
+        pantalla.set_clip(clip_anterior)
 
 def dibujar_scrollbar(pantalla, total_items, visibles, indice_inicio, color_tema=VERDE_SPOTIFY):
     """
     Dibuja la barra de scroll a la derecha si es necesario.
     Usa las constantes de config para posición y estilo.
     """
-    if total_items <= visibles:
-        return # No hace falta scroll
-
     # Coordenadas
     sb_x = ANCHO - ANCHO_SCROLLBAR
     sb_y = ALTURA_HEADER
     sb_h = ALTO - ALTURA_HEADER
+
+    hay_scroll = total_items > visibles
+    firma = (total_items, visibles, indice_inicio, color_tema) if hay_scroll else None
+    if not danos.region('scrollbar', firma, (sb_x, sb_y, ANCHO_SCROLLBAR, sb_h)):
+        return # Sin cambios desde el último frame
+
+    # Limpiamos por debajo de la línea del header
+    pantalla.fill(NEGRO, (sb_x, sb_y + 2, ANCHO_SCROLLBAR, sb_h - 2))
+
+    if not hay_scroll:
+        return # No hace falta scroll
     
     # A) Marco (Caja)
     pygame.draw.rect(pantalla, color_tema, (sb_x, sb_y, ANCHO_SCROLLBAR, sb_h), GROSOR_CAJA_SCROLL)
@@ -317,81 +457,27 @@ def dibujar_scrollbar(pantalla, total_items, visibles, indice_inicio, color_tema
     pygame.draw.rect(pantalla, color_tema, 
                      (sb_x + margen_interno, pos_y_thumb, ancho_thumb, thumb_height))
 
-def procesar_caratula_retro(surface_original, color_tema=VERDE_SPOTIFY):
+def procesar_niveles_caratula(surface_original, algoritmo=ALGORITMO_DITHER):
     """
-    Convierte una Surface a un estilo retro de 4 tonos (2-bit dithering).
+    Convierte una Surface al mapa de niveles retro (64x64, valores 0-3).
+    No depende del tema: el color lo pone la paleta al crear la Surface.
     """
-    # 1. Definir la paleta de 4 colores (Simulación LCD)
-    # Nivel 0: Negro
-    c0 = np.array([0, 0, 0])
-    # Nivel 1: Verde muy oscuro (sombra)
-    c1 = np.array([10, 55, 25])
-    # Nivel 2: Verde Spotify (medio)
-    c2 = np.array([30, 215, 96])
-    # Nivel 3: Verde muy claro / Blanco verdoso (brillo)
-    c3 = np.array([210, 255, 220])
-    
-    if color_tema == MORADO_TWITCH:
-        c1 = np.array([48, 24, 85])
-        c2 = np.array([145, 71, 255]) # Original
-        c3 = np.array([210, 190, 255])
-    elif color_tema == AZUL_LOCAL:
-        c1 = np.array([20, 53, 73])
-        c2 = np.array([60, 160, 220]) # Original
-        c3 = np.array([233, 247, 247])
-    
-    palette_colors = np.array([c0, c1, c2, c3])
+    # 1. Reducir a la resolución interna y pasar a escala de grises
+    grises = dithering.escala_de_grises(surface_original)
 
-    # 2. Reducir tamaño
-    tamano_pixel = (64, 64) # Resolución interna pixelada
-    small = pygame.transform.scale(surface_original, tamano_pixel)
-    
-    # 3. Obtener píxeles como array de floats para cálculos
-    pixels = pygame.surfarray.pixels3d(small).astype(np.float32)
-    ancho, alto, _ = pixels.shape
-    
-    # 4. Convertir a Escala de Grises (Luminancia)
-    # Usamos la fórmula de luminancia perceptiva: 0.299R + 0.587G + 0.114B
-    grayscale = pixels[:, :, 0] * 0.299 + pixels[:, :, 1] * 0.587 + pixels[:, :, 2] * 0.114
-    
-    # Preparamos el array de salida (3 canales RGB)
-    output = np.zeros((ancho, alto, 3), dtype=np.uint8)
+    # 2. Cuantizar a 4 niveles (0, 85, 170, 255) con el algoritmo elegido
+    return dithering.cuantizar(grises, algoritmo)
 
-    # 5. Algoritmo Floyd-Steinberg ajustado a 4 niveles
-    # Los niveles de gris objetivo son: 0, 85, 170, 255
-    
-    for y in range(alto):
-        for x in range(ancho):
-            old_pixel = grayscale[x, y]
-            
-            # Cuantizar: Encontrar el nivel más cercano (0, 1, 2, 3)
-            # Normalizamos 0-255 a 0-3
-            level = np.round(old_pixel / 85.0)
-            level = np.clip(level, 0, 3)
-            
-            # Asignar el nuevo valor de gris cuantizado (para calcular el error)
-            new_pixel_val = level * 85.0
-            
-            # Guardamos el COLOR correspondiente en la imagen final
-            output[x, y] = palette_colors[int(level)]
-            
-            # Calcular el error (diferencia de brillo)
-            error = old_pixel - new_pixel_val
-            
-            # Difundir el error a los vecinos (solo en el mapa de grises)
-            if x + 1 < ancho:
-                grayscale[x+1, y] += error * 0.5 # Derecha
-            if y + 1 < alto:
-                grayscale[x, y+1] += error * 0.5 # Abajo
-                
-            # Nota: He simplificado la difusión a solo 2 vecinos (Derecha y Abajo)
-            # con factor 0.5 para que sea más rápido y el patrón sea más limpio
-            # estilo "Bayer" o ordenado, que queda mejor en pixelart.
+def procesar_caratula_retro(surface_original, color_tema=VERDE_SPOTIFY, algoritmo=ALGORITMO_DITHER):
+    """
+    Convierte una Surface a un estilo retro de 4 tonos (2-bit dithering).
+    El trabajo pesado lo hace el motor vectorizado de dithering.py.
+    Devuelve una Surface indexada de 128x128 con la paleta del tema.
+    """
+    niveles = procesar_niveles_caratula(surface_original, algoritmo)
 
-    # 6. Crear superficie final
-    surface_final = pygame.surfarray.make_surface(output)
-    
-    return pygame.transform.scale(surface_final, (128, 128))
+    # 3. Ampliar x2 (vecino más cercano) y aplicar la paleta del tema
+    return dithering.crear_caratula_indexada(niveles, color_tema)
 
 #########################
 # FUNCIONES DEL SISTEMA #
@@ -414,6 +500,7 @@ def comprobar_internet():
     """Devuelve True si hay conexión a internet, False si no."""
 
     global HAY_CONEXION
+    anterior = HAY_CONEXION
     
     try:
         # Intenta conectar a Google DNS (esto es lo que podría bloquear)
@@ -422,6 +509,9 @@ def comprobar_internet():
         HAY_CONEXION = True
     except:
         HAY_CONEXION = False
+
+    if HAY_CONEXION != anterior:
+        solicitar_redibujo() # Cambia el icono WiFi del header
     
     # IMPORTANTE: Se programa a sí misma para volver a ejecutarse en 10 segundos
     # Esto es el 'threading.Timer'
@@ -436,6 +526,7 @@ def comprobar_bluetooth_loop():
     """
     global BT_CONECTADO
     while True:
+        anterior = BT_CONECTADO
         try:
             # Preguntamos a bluetoothctl info sobre los dispositivos emparejados
             # Si alguno dice "Connected: yes", es que tenemos audio.
@@ -450,5 +541,8 @@ def comprobar_bluetooth_loop():
         except Exception as e:
             print(f"Error check BT: {e}")
             BT_CONECTADO = False
+
+        if BT_CONECTADO != anterior:
+            solicitar_redibujo() # Cambia el icono Bluetooth del header
             
         time.sleep(5) # Descansar 5 segundos
\ No newline at end of file